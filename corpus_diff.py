@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+'''
+Compares two crawl output corpora, e.g. two crawls of the same input list, and reports per site:
+
+    external domains added or removed
+    authoritative name servers added or removed for a domain
+    ASN and geo cell moves of a domain's IP addresses
+    changes in the number of resources loaded from a domain
+
+Sites are matched by their output file name (the SHA1 of the top URL). Both corpora are streamed a
+pair of files at a time: a pair of byte for byte identical files is skipped without being parsed,
+otherwise both files are reduced to the fields above and compared. Pairs are spread over worker
+processes. Usage:
+
+    python corpus_diff.py ./data/pittsburgh_01/ ./data/pittsburgh_02/ -o diff.jsonl
+'''
+
+import argparse
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from web_monster_stats import geo_cell
+
+
+# ==================================================================================================
+# Maps the path of every output file under directory, relative to it, to its full path. Per-engine
+# subdirectories are kept apart so static and dynamic results of a site are compared separately
+
+def site_files(directory):
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if name.endswith(".json"):
+                path = os.path.join(root, name)
+                files[os.path.relpath(path, directory)] = path
+    return files
+
+
+# ==================================================================================================
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+# ==================================================================================================
+# Reduces a site dictionary to the sets and counts that are compared, so differences in the order
+# the crawl happened to find things in don't count as changes
+
+def summarize_domains(site):
+    domains = {}
+    for domain, info in (site.get("external_domains") or {}).items():
+        ips = (info.get("ip_addresses") or {}).values()
+        domains[domain] = {
+            "nameservers": sorted(ns.lower() for ns in (info.get("authoritative_name_servers")
+                                                         or {}).keys()),
+            "asns": sorted({ip.get("asn") for ip in ips if ip.get("asn") is not None}),
+            "geo": sorted({cell for cell in (geo_cell(ip.get("lat"), ip.get("long")) for ip in ips)
+                           if cell is not None}),
+            "resources": (info.get("resources") or {}).get("total", 0)
+        }
+    return domains
+
+
+# ==================================================================================================
+def diff_domains(before, after):
+    result = {
+        "domains_added": sorted(set(after) - set(before)),
+        "domains_removed": sorted(set(before) - set(after)),
+        "ns_changes": {},
+        "asn_moves": {},
+        "geo_moves": {},
+        "resource_deltas": {}
+    }
+
+    for domain in sorted(set(before) & set(after)):
+        old, new = before[domain], after[domain]
+
+        if old["nameservers"] != new["nameservers"]:
+            result["ns_changes"][domain] = {
+                "added": sorted(set(new["nameservers"]) - set(old["nameservers"])),
+                "removed": sorted(set(old["nameservers"]) - set(new["nameservers"]))
+            }
+        if old["asns"] != new["asns"]:
+            result["asn_moves"][domain] = {"before": old["asns"], "after": new["asns"]}
+        if old["geo"] != new["geo"]:
+            result["geo_moves"][domain] = {"before": old["geo"], "after": new["geo"]}
+        if old["resources"] != new["resources"]:
+            result["resource_deltas"][domain] = new["resources"] - old["resources"]
+
+    return result
+
+
+# ==================================================================================================
+# Compares one pair of files, either of which may be None when the site is only in one corpus.
+# Runs in the worker processes and returns a small record of the differences
+
+def diff_pair(job):
+    name, before_path, after_path = job
+
+    before_bytes = read_file(before_path) if before_path else None
+    after_bytes = read_file(after_path) if after_path else None
+
+    if before_bytes is not None and before_bytes == after_bytes:
+        return {"file": name, "status": "unchanged"}
+
+    try:
+        before = json.loads(before_bytes) if before_bytes is not None else None
+        after = json.loads(after_bytes) if after_bytes is not None else None
+    except ValueError as e:
+        return {"file": name, "status": "error", "error": str(e)}
+
+    site = after if after is not None else before
+    record = {"file": name, "top_url": site.get("top_url")}
+
+    if before is None or after is None:
+        record["status"] = "added" if before is None else "removed"
+        record["domains"] = len(site.get("external_domains") or {})
+        return record
+
+    before_domains = summarize_domains(before)
+    after_domains = summarize_domains(after)
+    if before_domains == after_domains:
+        record["status"] = "unchanged"
+        return record
+
+    record["status"] = "changed"
+    record.update(diff_domains(before_domains, after_domains))
+    return record
+
+
+# ==================================================================================================
+# Yields a diff record for every site in either corpus, in file name order
+
+def diff_corpora(before_dir, after_dir, workers=None, chunksize=16):
+    before_files = site_files(before_dir)
+    after_files = site_files(after_dir)
+
+    jobs = [(name, before_files.get(name), after_files.get(name)) for name in
+            sorted(set(before_files) | set(after_files))]
+
+    if workers == 1:
+        yield from map(diff_pair, jobs)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(diff_pair, jobs, chunksize=chunksize)
+
+
+# ==================================================================================================
+# Totals over the diff records, for the printed report
+
+class DiffSummary:
+    def __init__(self):
+        self.status = Counter()
+        self.domains_added = Counter()
+        self.domains_removed = Counter()
+        self.ns_added = Counter()
+        self.ns_removed = Counter()
+        self.asn_moves = Counter()
+        self.geo_moves = 0
+        self.resource_delta = 0
+
+    def add(self, record):
+        self.status[record["status"]] += 1
+        if record["status"] != "changed":
+            return
+
+        self.domains_added.update(record["domains_added"])
+        self.domains_removed.update(record["domains_removed"])
+        for change in record["ns_changes"].values():
+            self.ns_added.update(change["added"])
+            self.ns_removed.update(change["removed"])
+        for move in record["asn_moves"].values():
+            self.asn_moves[(tuple(move["before"]), tuple(move["after"]))] += 1
+        self.geo_moves += len(record["geo_moves"])
+        self.resource_delta += sum(record["resource_deltas"].values())
+
+
+# ==================================================================================================
+def print_report(summary, top_n):
+    print("SITES: " + ", ".join(status.upper() + " " + str(count) for status, count in
+                                sorted(summary.status.items())))
+    print("GEO MOVES: " + str(summary.geo_moves))
+    print("RESOURCE DELTA: " + "%+d" % summary.resource_delta)
+
+    for title, counter in (("EXTERNAL DOMAINS ADDED", summary.domains_added),
+                           ("EXTERNAL DOMAINS REMOVED", summary.domains_removed),
+                           ("NAMESERVERS ADDED", summary.ns_added),
+                           ("NAMESERVERS REMOVED", summary.ns_removed)):
+        print("\n" + title + " (sites)")
+        for name, sites in counter.most_common(top_n):
+            print("%6d  %s" % (sites, name))
+
+    print("\nASN MOVES (domains)")
+    for (before, after), domains in summary.asn_moves.most_common(top_n):
+        print("%6d  %s -> %s" % (domains, ",".join(map(str, before)) or "-",
+                                 ",".join(map(str, after)) or "-"))
+
+
+# ==================================================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report dependency changes between two crawl output corpora.")
+    parser.add_argument("before_dir", type=str, help="Directory of the earlier crawl's output JSON files")
+    parser.add_argument("after_dir", type=str, help="Directory of the later crawl's output JSON files")
+    parser.add_argument("-o", dest="output_file", type=str, help="Write one JSON line per changed, added or removed site to this file", default=None)
+    parser.add_argument("-w", dest="workers", type=int, help="# of worker processes (default: # of CPUs)", default=None)
+    parser.add_argument("-n", dest="top_n", type=int, help="# of entries per ranking", default=20)
+    args = parser.parse_args()
+
+    summary = DiffSummary()
+    output = open(args.output_file, 'w') if args.output_file else None
+    try:
+        for record in diff_corpora(args.before_dir, args.after_dir, args.workers):
+            summary.add(record)
+            if output is not None and record["status"] != "unchanged":
+                output.write(json.dumps(record) + "\n")
+    finally:
+        if output is not None:
+            output.close()
+
+    print_report(summary, args.top_n)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+'''
+Single entry point for all the crawl engines:
+    static  -- web_monster.py, recursively parses each site's HTML for external resources
+    dynamic -- dynamic_reading.py, loads each site in a headless browser and records its traffic
+    link    -- link_extractor.py, builds the graph of domains each site links to
+
+Engines are only imported when they are selected, and engines run together in one process share the
+DNS / GeoIP caches in globals.py
+'''
+
+import argparse
+import importlib
+import os
+import globals
+
+ENGINES = {
+    "static": "web_monster",
+    "dynamic": "dynamic_reading",
+    "link": "link_extractor"
+}
+
+
+# ==================================================================================================
+def build_parser():
+    parser = argparse.ArgumentParser(description="Crawl webpages for 3rd party links.")
+    parser.add_argument("-e", dest="engines", action="append", choices=sorted(ENGINES.keys()),
+                        help="Crawl engine to run, may be given more than once (default: static)")
+    parser.add_argument("-i", dest="input_file", type=str, help="File containing list of top-level domains to scan", default="./input_files/cmu_input.txt")
+    parser.add_argument("-o", dest="output_dir", type=str, help="Directory to output JSON results", default="./data/")
+    parser.add_argument("-w", dest="workers", type=int, help="# of websites (static) or pages (link) to crawl concurrently", default=5)
+
+    parser.add_argument("--stats", dest="stats_file", type=str, help="Keep live cross-site statistics and write them to this JSON file", default=None)
+    parser.add_argument("--stats-interval", dest="stats_interval", type=int, help="Seconds between writes of the statistics file", default=60)
+
+    parser.add_argument("--metrics-port", dest="metrics_port", type=int, help="Serve live crawl metrics in Prometheus format on this port", default=None)
+    parser.add_argument("--metrics-host", dest="metrics_host", type=str, help="Address the metrics endpoint listens on", default="127.0.0.1")
+
+    parser.add_argument("--db", dest="db_file", type=str, help="Also store results and crawl logs in this SQLite database; sites already in it are skipped", default=None)
+    parser.add_argument("--dns-server", dest="dns_server", type=str, help="Recursive DNS resolver to use instead of the system one", default=None)
+    parser.add_argument("--dns-port", dest="dns_port", type=int, help="Port for DNS queries", default=53)
+    parser.add_argument("--no-cname", dest="resolve_cname", action="store_false", help="Don't resolve CNAME chains and IPv6 addresses of external domains")
+    parser.add_argument("--prefix-table", dest="prefix_table", type=str, help="Directory of a prefix table built with ip_prefix_table.py, used for IPv4 GeoIP / ASN lookups", default=None)
+
+    static = parser.add_argument_group("static engine")
+    static.add_argument("--mode", dest="mode", choices=["serial", "thread", "process"], help="Crawl sites one at a time, on worker threads or on worker processes", default="thread")
+    static.add_argument("--queue-size", dest="queue_size", type=int, help="Maximum # of sites submitted to the workers at once (default: 2 x workers)", default=0)
+    static.add_argument("--interleave-window", dest="interleave_window", type=int, help="# of input URLs read ahead to interleave sites of the same domain", default=1000)
+    static.add_argument("--max-pages", dest="max_pages", type=int, help="Maximum # of internal pages to crawl per site", default=175)
+    static.add_argument("--patience", dest="patience", type=int, help="Stop a site after this many pages in a row find no new external domain (0 to disable)", default=50)
+    static.add_argument("--template-limit", dest="template_limit", type=int, help="Skip URLs whose page template gave this many pages in a row with no new external resources (0 to disable)", default=3)
+    static.add_argument("--connect-timeout", dest="connect_timeout", type=float, help="Seconds to wait for a connection or any single read", default=10)
+    static.add_argument("--read-timeout", dest="read_timeout", type=float, help="Seconds allowed for reading a whole page", default=30)
+    static.add_argument("--retries", dest="retries", type=int, help="# of retries for timeouts, resets and 429/5xx responses", default=2)
+    static.add_argument("--breaker-threshold", dest="breaker_threshold", type=int, help="Failed fetches in a row before a host is paused", default=5)
+    static.add_argument("--breaker-cooldown", dest="breaker_cooldown", type=float, help="Seconds a failing host is paused for", default=300)
+    static.add_argument("--tls", dest="capture_tls", action="store_true", help="Record the certificate and TLS handshake info of the site and each external domain")
+    static.add_argument("--robots", dest="robots", action="store_true", help="Skip internal URLs disallowed by the site's robots.txt")
+    static.add_argument("--sitemaps", dest="sitemaps", action="store_true", help="Seed each site's crawl with URLs from its sitemaps")
+    static.add_argument("--sitemap-max-urls", dest="sitemap_max_urls", type=int, help="Maximum # of URLs to seed from a site's sitemaps", default=500)
+    static.add_argument("--depth-weight", dest="depth_weight", type=float, help="Priority penalty per path segment of an internal URL", default=0.1)
+
+    dynamic = parser.add_argument_group("dynamic engine")
+    dynamic.add_argument("--chrome-driver", dest="chrome_driver", type=str, help="Path to the chromedriver executable", default="chromedriver")
+    dynamic.add_argument("--browser-cache-dir", dest="browser_cache_dir", type=str, help="Directory for the browser's HTTP cache, kept between sites and runs", default=None)
+    dynamic.add_argument("--browser-cache-size", dest="browser_cache_size", type=int, help="Maximum size of the browser cache in MB", default=1024)
+
+    link = parser.add_argument_group("link engine")
+    link.add_argument("-r", dest="recurse", type=int, help="# of recursive scans to perform", default=1)
+    link.add_argument("--cache-dir", dest="cache_dir", type=str, help="Directory to keep extracted links in between runs", default=None)
+    link.add_argument("--cache-size", dest="cache_size", type=int, help="# of domains to keep in the in-memory link cache", default=4096)
+
+    return parser
+
+
+# ==================================================================================================
+# Runs each selected engine in turn. When more than one engine is run, each one writes its results
+# to its own sub directory of the output directory so they don't overwrite each other
+
+def main(argv=None, engines=None):
+    args = build_parser().parse_args(argv)
+    engines = args.engines or engines or ["static"]
+
+    globals.init()
+    globals.MAX_PAGES = args.max_pages
+    globals.PATIENCE = args.patience
+    globals.DEPTH_WEIGHT = args.depth_weight
+    globals.TEMPLATE_LIMIT = args.template_limit
+    globals.CONNECT_TIMEOUT = args.connect_timeout
+    globals.READ_TIMEOUT = args.read_timeout
+    globals.RETRIES = args.retries
+    globals.BREAKER_THRESHOLD = args.breaker_threshold
+    globals.BREAKER_COOLDOWN = args.breaker_cooldown
+    globals.ROBOTS = args.robots
+    globals.SITEMAPS = args.sitemaps
+    globals.SITEMAP_MAX_URLS = args.sitemap_max_urls
+    globals.DNS_SERVER = args.dns_server
+    globals.DNS_PORT = args.dns_port
+    globals.RESOLVE_CNAME = args.resolve_cname
+    globals.CAPTURE_TLS = args.capture_tls
+    globals.INTERLEAVE_WINDOW = args.interleave_window
+
+    if args.stats_file:
+        import web_monster_stats as wms_stats
+        globals.AGGREGATOR = wms_stats.RunningAggregator(args.stats_file, args.stats_interval)
+    if args.db_file:
+        import web_monster_db as wmdb
+        globals.DB = wmdb.ResultStore(args.db_file)
+    if args.prefix_table:
+        import ip_prefix_table
+        globals.PREFIX_TABLE = ip_prefix_table.load(args.prefix_table)
+
+    metrics_server = None
+    if args.metrics_port is not None:
+        import web_monster_metrics as wmm
+        metrics_server = wmm.start_server(args.metrics_port, args.metrics_host)
+
+    output_dir = args.output_dir
+    try:
+        for engine in engines:
+            if len(engines) > 1:
+                args.output_dir = os.path.join(output_dir, engine)
+
+            importlib.import_module(ENGINES[engine]).run(args)
+    finally:
+        if globals.AGGREGATOR is not None:
+            globals.AGGREGATOR.close()
+        if globals.DB is not None:
+            globals.DB.close()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+
+
+# ==================================================================================================
+if __name__ == "__main__":
+    main()
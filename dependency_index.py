@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+'''
+Cross-site dependency index. Builds inverted indexes over a crawl corpus:
+
+    domain     -> sites that load resources from it
+    nameserver -> domains it is authoritative for -> sites
+    ASN        -> domains hosted in it             -> sites
+
+Every site, domain, nameserver and ASN is given an integer ID and the postings are stored as sorted
+unsigned int arrays, so the index is small on disk and a "blast radius" query is a handful of array
+unions. Usage:
+
+    python dependency_index.py build -o index.pkl ./data/cmu/ ./data/pittsburgh_01/
+    python dependency_index.py query index.pkl --ns a.ns.facebook.com.
+    python dependency_index.py report index.pkl -n 20
+'''
+
+import argparse
+import pickle
+from array import array
+import web_monster_support as wms
+
+INDEX_VERSION = 1
+
+
+# ==================================================================================================
+# Assigns consecutive integer IDs to strings
+
+class Interner:
+    def __init__(self, names=None):
+        self.names = list(names or [])
+        self.ids = {name: i for i, name in enumerate(self.names)}
+
+    def intern(self, name):
+        if name not in self.ids:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+        return self.ids[name]
+
+    def get(self, name):
+        return self.ids.get(name)
+
+    def __len__(self):
+        return len(self.names)
+
+
+# ==================================================================================================
+# Converts a list of ID sets into a list of sorted compact arrays
+
+def to_postings(id_sets):
+    return [array('I', sorted(ids)) for ids in id_sets]
+
+
+# ==================================================================================================
+def add_posting(postings, key, value):
+    while len(postings) <= key:
+        postings.append(set())
+    postings[key].add(value)
+
+
+# ==================================================================================================
+class DependencyIndex:
+    def __init__(self):
+        self.sites = Interner()
+        self.domains = Interner()
+        self.nameservers = Interner()
+        self.asns = Interner()
+        self.asn_orgs = {}
+
+        self.domain_sites = []
+        self.ns_domains = []
+        self.asn_domains = []
+
+    # ----------------------------------------------------------------------------------------------
+    # Building
+
+    @classmethod
+    def build(cls, sites):
+        ''' sites is an iterable of site dicts or (source, site dict) pairs '''
+        index = cls()
+        domain_sites = []
+        ns_domains = []
+        asn_domains = []
+
+        for site in sites:
+            if isinstance(site, tuple):
+                site = site[1]
+
+            site_id = index.sites.intern(site.get("top_url"))
+
+            for domain, domain_info in (site.get("external_domains") or {}).items():
+                domain_id = index.domains.intern(domain)
+                add_posting(domain_sites, domain_id, site_id)
+
+                for ns in (domain_info.get("authoritative_name_servers") or {}).keys():
+                    add_posting(ns_domains, index.nameservers.intern(ns.lower()), domain_id)
+
+                ip_infos = list((domain_info.get("ip_addresses") or {}).values()) + \
+                    list((domain_info.get("ip6_addresses") or {}).values())
+                for ip_info in ip_infos:
+                    asn = ip_info.get("asn")
+                    if asn is not None:
+                        asn_id = index.asns.intern(asn)
+                        index.asn_orgs[asn] = ip_info.get("as_org")
+                        add_posting(asn_domains, asn_id, domain_id)
+
+        index.domain_sites = to_postings(domain_sites)
+        index.ns_domains = to_postings(ns_domains)
+        index.asn_domains = to_postings(asn_domains)
+        return index
+
+    # ----------------------------------------------------------------------------------------------
+    # Persistence
+
+    def save(self, path):
+        state = {
+            "version": INDEX_VERSION,
+            "sites": self.sites.names,
+            "domains": self.domains.names,
+            "nameservers": self.nameservers.names,
+            "asns": self.asns.names,
+            "asn_orgs": self.asn_orgs,
+            "domain_sites": [p.tobytes() for p in self.domain_sites],
+            "ns_domains": [p.tobytes() for p in self.ns_domains],
+            "asn_domains": [p.tobytes() for p in self.asn_domains]
+        }
+        with open(path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+
+        if state.get("version") != INDEX_VERSION:
+            raise ValueError("Unsupported dependency index version: " + str(state.get("version")))
+
+        index = cls()
+        index.sites = Interner(state["sites"])
+        index.domains = Interner(state["domains"])
+        index.nameservers = Interner(state["nameservers"])
+        index.asns = Interner(state["asns"])
+        index.asn_orgs = state["asn_orgs"]
+        index.domain_sites = [array('I', p) for p in state["domain_sites"]]
+        index.ns_domains = [array('I', p) for p in state["ns_domains"]]
+        index.asn_domains = [array('I', p) for p in state["asn_domains"]]
+        return index
+
+    # ----------------------------------------------------------------------------------------------
+    # Queries, all return sets of integer IDs
+
+    def sites_of_domains(self, domain_ids):
+        site_ids = set()
+        for domain_id in domain_ids:
+            site_ids.update(self.domain_sites[domain_id])
+        return site_ids
+
+    def domain_blast_radius(self, domain):
+        domain_id = self.domains.get(domain)
+        if domain_id is None:
+            return set()
+        return set(self.domain_sites[domain_id])
+
+    def ns_domain_ids(self, nameserver):
+        ns_id = self.nameservers.get(nameserver.lower())
+        if ns_id is None:
+            return set()
+        return set(self.ns_domains[ns_id])
+
+    def ns_blast_radius(self, nameserver):
+        return self.sites_of_domains(self.ns_domain_ids(nameserver))
+
+    def asn_domain_ids(self, asn):
+        asn_id = self.asns.get(asn)
+        if asn_id is None:
+            return set()
+        return set(self.asn_domains[asn_id])
+
+    def asn_blast_radius(self, asn):
+        return self.sites_of_domains(self.asn_domain_ids(asn))
+
+    # ----------------------------------------------------------------------------------------------
+    # Concentration reports: entities ranked by the number of sites that depend on them
+
+    def rank_domains(self, top_n):
+        ranked = sorted(((len(sites), self.domains.names[d]) for d, sites in
+                         enumerate(self.domain_sites)), reverse=True)
+        return [(name, count) for count, name in ranked[:top_n]]
+
+    def rank_nameservers(self, top_n):
+        ranked = sorted(((len(self.sites_of_domains(domains)), len(domains),
+                          self.nameservers.names[n]) for n, domains in enumerate(self.ns_domains)),
+                        reverse=True)
+        return [(name, sites, domains) for sites, domains, name in ranked[:top_n]]
+
+    def rank_asns(self, top_n):
+        ranked = sorted(((len(self.sites_of_domains(domains)), len(domains),
+                          self.asns.names[a]) for a, domains in enumerate(self.asn_domains)),
+                        reverse=True)
+        return [(asn, self.asn_orgs.get(asn), sites, domains) for sites, domains, asn in
+                ranked[:top_n]]
+
+
+# ==================================================================================================
+def print_report(index, top_n):
+    total = len(index.sites)
+    print("SITES: " + str(total))
+
+    print("\nTOP EXTERNAL DOMAINS (sites)")
+    for name, sites in index.rank_domains(top_n):
+        print("%6d  %5.1f%%  %s" % (sites, 100.0 * sites / total, name))
+
+    print("\nTOP NAMESERVERS (sites, domains)")
+    for name, sites, domains in index.rank_nameservers(top_n):
+        print("%6d  %5.1f%%  %6d  %s" % (sites, 100.0 * sites / total, domains, name))
+
+    print("\nTOP ASNS (sites, domains)")
+    for asn, org, sites, domains in index.rank_asns(top_n):
+        print("%6d  %5.1f%%  %6d  AS%s %s" % (sites, 100.0 * sites / total, domains, asn, org))
+
+
+# ==================================================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cross-site dependency index and concentration reports.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_cmd = commands.add_parser("build", help="Build an index from crawl output directories")
+    build_cmd.add_argument("input_dirs", type=str, nargs="+", help="Directories of crawl output JSON files")
+    build_cmd.add_argument("-o", dest="index_file", type=str, help="Index file to write", default="./dependency_index.pkl")
+
+    query_cmd = commands.add_parser("query", help="List the sites affected if a dependency fails")
+    query_cmd.add_argument("index_file", type=str, help="Index file built with the build command")
+    query_cmd.add_argument("--domain", dest="domain", type=str, help="External domain")
+    query_cmd.add_argument("--ns", dest="nameserver", type=str, help="Authoritative name server")
+    query_cmd.add_argument("--asn", dest="asn", type=int, help="Autonomous system number")
+
+    report_cmd = commands.add_parser("report", help="Rank dependencies by the number of sites relying on them")
+    report_cmd.add_argument("index_file", type=str, help="Index file built with the build command")
+    report_cmd.add_argument("-n", dest="top_n", type=int, help="# of entries per ranking", default=20)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        index = DependencyIndex.build(wms.iter_output_files(args.input_dirs))
+        index.save(args.index_file)
+        print("INDEXED " + str(len(index.sites)) + " SITES, " + str(len(index.domains)) +
+              " DOMAINS, " + str(len(index.nameservers)) + " NAMESERVERS, " +
+              str(len(index.asns)) + " ASNS")
+
+    elif args.command == "query":
+        index = DependencyIndex.load(args.index_file)
+        if args.domain:
+            site_ids = index.domain_blast_radius(args.domain)
+        elif args.nameserver:
+            domain_ids = index.ns_domain_ids(args.nameserver)
+            print("DOMAINS (" + str(len(domain_ids)) + "):")
+            for domain_id in sorted(domain_ids):
+                print("\t" + index.domains.names[domain_id])
+            site_ids = index.sites_of_domains(domain_ids)
+        elif args.asn is not None:
+            site_ids = index.asn_blast_radius(args.asn)
+        else:
+            parser.error("query needs one of --domain, --ns or --asn")
+
+        print("SITES (" + str(len(site_ids)) + "):")
+        for site_id in sorted(site_ids):
+            print("\t" + index.sites.names[site_id])
+
+    else:
+        print_report(DependencyIndex.load(args.index_file), args.top_n)
@@ -1,47 +1,47 @@
 #https://github.com/pyzzled/selenium/blob/master/headless_browser/headless.py
 
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
 from urllib.parse import urlparse
-import argparse
 import json
-import hashlib
 import os
 
 import globals
 
 import web_monster_support as wms
 import web_monster_ip as wmi
-
-# Threading / Concurrency Imports
-from concurrent import futures
-from concurrent.futures import ThreadPoolExecutor
+import web_monster_stats as wms_stats
 
 globals.init()
 
-def parse_input(input_file):
-    """ Takes in an input file path, where the input file is a list of 
-        newline separated top level URLs to crawl. Starts filling out the 
-        TOP_URLS global dictionary.
-    """
-
-    with open(input_file, 'r') as f:
-        top_urls = f.readlines()
+# Shared webdriver, created by run()
+driver = None
 
-    # get rid of newlines, etc
-    top_urls = [x.strip() for x in top_urls]
+# Responses seen / served from the browser cache over the whole run
+CACHE_TOTALS = {"responses": 0, "cached": 0}
 
-    wms.initialize_dicts(top_urls)
+def setup_driver(CHROME_DRIVER_PATH, cache_dir=None, cache_size_mb=None):
+    """ Setup driver with capabilities. If cache_dir is given the browser's
+        HTTP cache is kept there, so common third party resources are
+        reused across sites and runs; Chrome evicts entries once the cache
+        grows past cache_size_mb. Chrome partitions its cache by top level
+        site, which would keep any entry from being reused on another
+        site, so partitioning is turned off when caching
+    """ 
 
-def setup_driver(CHROME_DRIVER_PATH):
-    """ Setup driver with capabilities """ 
+    # selenium is only imported once a driver is actually needed
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
 
     # instantiate a chrome options object so you can set the size and headless preference
     chrome_options = Options()
     chrome_options.add_argument("--headless")
     chrome_options.add_argument("--window-size=1920x1080")
     chrome_options.add_experimental_option('w3c', False)
+    if cache_dir:
+        chrome_options.add_argument("--disk-cache-dir=" + os.path.abspath(cache_dir))
+        chrome_options.add_argument("--disable-features=SplitCacheByNetworkIsolationKey")
+    if cache_size_mb:
+        chrome_options.add_argument("--disk-cache-size=" + str(cache_size_mb * 1024 * 1024))
 
     caps = DesiredCapabilities.CHROME
     caps['loggingPrefs'] = {
@@ -133,33 +133,33 @@ def evaluate_requests(requests, orig_url, top_dict):
         else:
             continue
 
-def output_to_json(output_directory, url):
-    # make filename hash of the top url because linux doesn't like :./ in the file name
-    hash_object = hashlib.sha1(str.encode(globals.TOP_URLS[url]["top_url"]))
-    hex_dig = hash_object.hexdigest()
+def cache_stats(events):
+    """ Count the responses in the events and how many of them came from
+        the browser's memory or disk cache. Cached responses still have
+        their Network.requestWillBeSent events, so evaluate_requests sees
+        the full dependency chain either way
+    """
 
-    json_file = os.path.join(output_directory, str(hex_dig) + ".json")
+    responses = 0
+    cached = set()
+    for event in events:
+        if event['method'] == 'Network.responseReceived':
+            responses += 1
+            response = event['params'].get('response', {})
+            if response.get('fromDiskCache') or response.get('fromPrefetchCache'):
+                cached.add(event['params'].get('requestId'))
+        elif event['method'] == 'Network.requestServedFromCache':
+            cached.add(event['params'].get('requestId'))
 
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+    return responses, len(cached)
 
-    with open(json_file, 'w') as fp:
-        json.dump(globals.TOP_URLS[url], fp, indent=4)
+def hit_rate(responses, cached):
+    return 100.0 * cached / responses if responses else 0.0
 
 def thread_start(url, top_dict, output_dir):
 
     # Get IPv4 addresses
-    ip_4_addresses = wmi.get_ip4_addrs(url)
-
-    # Initialize ip_addresses
-    top_dict["ip_addresses"] = {}
-    for ip_address in ip_4_addresses:
-        # Get latitude and longitude by IP address
-        lat, long = wmi.get_ip_geo(ip_address)
-        top_dict["ip_addresses"][ip_address] = {
-            "lat": lat,
-            "long": long,
-        }
+    wmi.set_top_ip4_info(url, top_dict)
 
     # Get url with driver
     driver.get(url)
@@ -186,41 +186,54 @@ def thread_start(url, top_dict, output_dir):
     evaluate_responses(responses, domain, top_dict)
     evaluate_requests(requests, domain, top_dict)
 
+    # Report how much of the page came from the browser cache
+    site_responses, site_cached = cache_stats(events)
+    CACHE_TOTALS["responses"] += site_responses
+    CACHE_TOTALS["cached"] += site_cached
+    print("CACHE: %d/%d responses cached (%.1f%%)" % (site_cached, site_responses,
+                                                       hit_rate(site_responses, site_cached)))
+
     # Save results to output
-    output_to_json(output_dir, url)
+    wms.output_to_json(output_dir, top_dict, indent=4)
 
+    wms_stats.record_site(top_dict)
+    if globals.DB is not None:
+        globals.DB.save_site(top_dict, globals.TOP_LOGS[top_dict["top_url"]])
     wms.free_up_memory(top_dict)
+
+    # drop the site's entries entirely so memory doesn't grow with the length of the input
+    globals.TOP_URLS.pop(top_dict["top_url"], None)
+    globals.TOP_LOGS.pop(top_dict["top_url"], None)
     print("WEBSITE " + url + " THREAD DONE")
 
-if __name__ == "__main__":
-    
+def run(args):
+    """ Dynamic crawl engine: loads every top level URL in the input file
+        in a headless browser and records the network traffic
+    """
+    global driver
+
     # download the chrome driver from https://sites.google.com/a/chromium.org/chromedriver/downloads
-    # Add chrome driver directory
-    CHROME_DRIVER_PATH = "/Users/ian/Documents/CMU/Spring2020/NetSec/Project/chromedriver"
-
-    driver = setup_driver(CHROME_DRIVER_PATH)
-
-    parser = argparse.ArgumentParser(description="Crawl webpages for 3rd party links.")
-    parser.add_argument("-i", dest="input_file", type=str, help="File containing list of top-level domains to scan", default="./input_files/pittsburgh_input.txt")
-    parser.add_argument("-o", dest="output_dir", type=str, help="Directory to output JSON results", default="./data/dynamic-2/")
-    args = parser.parse_args()
-
-    parse_input(args.input_file)
-
-    threads = []
-    # with ThreadPoolExecutor(max_workers=5) as executor:
-    #     for top_url in globals.TOP_URLS.keys():
-    #         print("ANALYZING WEBSITE: " + top_url)
-    #         threads.append(executor.submit(thread_start, top_url, globals.TOP_URLS[top_url],
-    #                                        args.output_dir))
-
-    # # wait for threads to finish
-    # for f in futures.as_completed(threads):
-    #     pass
-    # '''
-    # FOR TESTING PURPOSES ONLY
-    for top_url in globals.TOP_URLS.keys():
-        print("ANALYZING WEBSITE: " + top_url)
-        thread_start(top_url, globals.TOP_URLS[top_url], args.output_dir)
-    # '''
-    print("CRAWL COMPLETE!")
\ No newline at end of file
+    driver = setup_driver(args.chrome_driver, args.browser_cache_dir, args.browser_cache_size)
+
+    completed = globals.DB.completed_sites() if globals.DB is not None else set()
+
+    # sites are read from the input and allocated one at a time, as the browser loads them
+    try:
+        for top_url in wms.iter_input(args.input_file):
+            if top_url in completed:
+                continue
+
+            print("ANALYZING WEBSITE: " + top_url)
+            wms.initialize_dicts([top_url])
+            thread_start(top_url, globals.TOP_URLS[top_url], args.output_dir)
+    finally:
+        driver.quit()
+
+    print("CACHE TOTAL: %d/%d responses cached (%.1f%%)" % (
+        CACHE_TOTALS["cached"], CACHE_TOTALS["responses"],
+        hit_rate(CACHE_TOTALS["responses"], CACHE_TOTALS["cached"])))
+    print("CRAWL COMPLETE!")
+
+if __name__ == "__main__":
+    import crawl
+    crawl.main(engines=["dynamic"])
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+'''
+Flattens crawl output into columnar tables for cross-site analytics:
+
+    sites        -- one row per crawled top level URL
+    domains      -- one row per (site, external domain) with resource counts by tag type
+    resources    -- one row per (site, external resource URL)
+    ips          -- one row per (site, domain, IP address); domain is null for the site itself
+    nameservers  -- one row per (site, domain, authoritative name server)
+
+String columns are dictionary encoded. Tables are written as Parquet (default) or Arrow IPC stream
+files in row groups of --batch-size rows, so neither the input nor the output is ever fully in memory.
+Sites can be streamed from existing data/*/ directories or passed in as already loaded dicts.
+
+    python export_columnar.py -o ./columnar/ ./data/cmu/ ./data/pittsburgh_01/
+
+Needs pyarrow, which the crawl itself does not (pip install pyarrow).
+
+REFERENCES:
+    https://arrow.apache.org/docs/python/parquet.html
+    https://arrow.apache.org/docs/python/ipc.html
+'''
+
+import argparse
+import os
+import web_monster_support as wms
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+RESOURCE_TYPES = list(wms.HTML_ELEMENTS.keys())
+
+
+# ==================================================================================================
+# Column layout of every table. "str" columns are dictionary encoded
+
+TABLES = {
+    "sites": [("site_id", "int32"), ("top_url", "str"), ("top_domain", "str"), ("source", "str")],
+    "domains": [("site_id", "int32"), ("domain", "str"), ("total", "int32")] +
+               [(tag, "int32") for tag in RESOURCE_TYPES],
+    "resources": [("site_id", "int32"), ("url", "str"), ("domain", "str"), ("type", "str"),
+                  ("count", "int32")],
+    "ips": [("site_id", "int32"), ("domain", "str"), ("ip", "str"), ("lat", "float64"),
+            ("long", "float64"), ("asn", "int64"), ("as_org", "str")],
+    "nameservers": [("site_id", "int32"), ("domain", "str"), ("nameserver", "str"), ("ip", "str"),
+                    ("lat", "float64"), ("long", "float64"), ("asn", "int64"),
+                    ("asn_org", "str")]
+}
+
+
+# ==================================================================================================
+def arrow_type(column_type):
+    if column_type == "str":
+        return pa.dictionary(pa.int32(), pa.string())
+    return getattr(pa, column_type)()
+
+
+# ==================================================================================================
+def arrow_schema(table):
+    return pa.schema([(name, arrow_type(column_type)) for name, column_type in TABLES[table]])
+
+
+# ==================================================================================================
+# Turns one site dict into rows (tuples in TABLES column order) for each table
+
+def flatten_site(site_id, site, source=None):
+    rows = {table: [] for table in TABLES}
+
+    rows["sites"].append((site_id, site.get("top_url"), site.get("top_domain"), source))
+
+    for ip, ip_info in (site.get("ip_addresses") or {}).items():
+        rows["ips"].append((site_id, None, ip, ip_info.get("lat"), ip_info.get("long"),
+                            ip_info.get("asn"), ip_info.get("as_org")))
+
+    for url, resource in (site.get("external_resources") or {}).items():
+        rows["resources"].append((site_id, url, wms.url_to_domain(url), resource.get("type"),
+                                  resource.get("count")))
+
+    for domain, domain_info in (site.get("external_domains") or {}).items():
+        # dynamic engine output has no resource counts
+        counts = domain_info.get("resources") or {}
+        rows["domains"].append((site_id, domain, counts.get("total")) +
+                               tuple(counts.get(tag) for tag in RESOURCE_TYPES))
+
+        ip_addresses = dict(domain_info.get("ip_addresses") or {})
+        ip_addresses.update(domain_info.get("ip6_addresses") or {})
+        for ip, ip_info in ip_addresses.items():
+            rows["ips"].append((site_id, domain, ip, ip_info.get("lat"), ip_info.get("long"),
+                                ip_info.get("asn"), ip_info.get("as_org")))
+
+        for ns, ns_info in (domain_info.get("authoritative_name_servers") or {}).items():
+            rows["nameservers"].append((site_id, domain, ns, ns_info.get("ip"),
+                                        ns_info.get("lat"), ns_info.get("long"),
+                                        ns_info.get("asn"), ns_info.get("asn_org")))
+
+    return rows
+
+
+# ==================================================================================================
+# Buffers rows for one table and writes them out as a record batch every batch_size rows
+
+class TableWriter:
+    def __init__(self, table, output_dir, fmt, batch_size):
+        self.table = table
+        self.schema = arrow_schema(table)
+        self.batch_size = batch_size
+        self.rows = []
+        self.row_count = 0
+
+        extension = ".parquet" if fmt == "parquet" else ".arrows"
+        self.path = os.path.join(output_dir, table + extension)
+
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+        else:
+            # the IPC stream format (unlike the file format) allows every batch its own dictionary
+            import pyarrow.ipc
+            self.writer = pyarrow.ipc.new_stream(self.path, self.schema)
+
+    def extend(self, rows):
+        self.rows.extend(rows)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+
+        arrays = []
+        for i, (name, column_type) in enumerate(TABLES[self.table]):
+            values = [row[i] for row in self.rows]
+            if column_type == "str":
+                arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, type=arrow_type(column_type)))
+
+        self.writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        self.row_count += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+# ==================================================================================================
+# Exports sites to one file per table in output_dir. sites is an iterable of either site dicts or
+# (source, site dict) pairs, as yielded by wms.iter_output_files. Returns the row count per table
+
+def export(sites, output_dir, fmt="parquet", batch_size=50000):
+    if pa is None:
+        raise ImportError("pyarrow is required for columnar export (pip install pyarrow)")
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    writers = {table: TableWriter(table, output_dir, fmt, batch_size) for table in TABLES}
+    try:
+        for site_id, site in enumerate(sites):
+            source = None
+            if isinstance(site, tuple):
+                source, site = site
+
+            for table, rows in flatten_site(site_id, site, source).items():
+                writers[table].extend(rows)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    return {table: writer.row_count for table, writer in writers.items()}
+
+
+# ==================================================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export crawl results to columnar tables.")
+    parser.add_argument("input_dirs", type=str, nargs="+", help="Directories of crawl output JSON files")
+    parser.add_argument("-o", dest="output_dir", type=str, help="Directory to write the tables to", default="./columnar/")
+    parser.add_argument("-f", dest="format", type=str, choices=["parquet", "arrow"], help="Output file format", default="parquet")
+    parser.add_argument("--batch-size", dest="batch_size", type=int, help="# of rows per row group / record batch", default=50000)
+    args = parser.parse_args()
+
+    counts = export(wms.iter_output_files(args.input_dirs), args.output_dir, args.format,
+                    args.batch_size)
+    for table, count in counts.items():
+        print(table + ": " + str(count) + " rows")
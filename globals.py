@@ -1,20 +1,120 @@
-import geoip2.database
+import threading
 
 global TOP_URLS
 global TOP_LOGS
 global IP_LIB
 global GEO_LIB
 global ASN_LIB
+global NS_CACHE
+global CNAME_CACHE
+global RESOLVE_CNAME
+global TLS_CACHE
+global CAPTURE_TLS
+global AGGREGATOR
+global DB
+global PREFIX_TABLE
+global MAX_PAGES
+global PATIENCE
+global DEPTH_WEIGHT
+global TEMPLATE_LIMIT
+global CONNECT_TIMEOUT
+global READ_TIMEOUT
+global RETRIES
+global RETRY_BACKOFF
+global BREAKER_THRESHOLD
+global BREAKER_COOLDOWN
+global ROBOTS
+global SITEMAPS
+global SITEMAP_MAX_URLS
+global SITEMAP_MAX_FILES
+global DNS_SERVER
+global DNS_PORT
+global INTERLEAVE_WINDOW
 global USR_AGNTS
 
+# GEO_LIB and ASN_LIB are opened on first use (see __getattr__ below) so importing a crawl engine,
+# or running one that never touches GeoIP, doesn't pay for opening the mmdb files
+READER_PATHS = {
+    "GEO_LIB": 'databases/geo_ip_database/GeoLite2-City.mmdb',
+    "ASN_LIB": 'databases/asn_ip_database/GeoLite2-ASN.mmdb'
+}
+READER_LOCK = threading.Lock()
+
+# Configuration values handed to worker processes, see settings() / apply_settings()
+SETTINGS = ("MAX_PAGES", "PATIENCE", "DEPTH_WEIGHT", "TEMPLATE_LIMIT", "CONNECT_TIMEOUT",
+            "READ_TIMEOUT", "RETRIES", "RETRY_BACKOFF", "BREAKER_THRESHOLD", "BREAKER_COOLDOWN",
+            "ROBOTS", "SITEMAPS", "SITEMAP_MAX_URLS", "SITEMAP_MAX_FILES", "DNS_SERVER",
+            "DNS_PORT", "RESOLVE_CNAME", "CAPTURE_TLS", "READER_PATHS")
+
+
+# ==================================================================================================
+# Sets up the shared crawl state. Safe to call more than once (e.g. by every engine run in the same
+# process): state that already exists is kept so engines share the same DNS / GeoIP caches
 
 def init():
-    global TOP_LOGS, TOP_URLS, IP_LIB, GEO_LIB, ASN_LIB, USR_AGNTS
+    global TOP_LOGS, TOP_URLS, NS_CACHE, CNAME_CACHE, RESOLVE_CNAME, AGGREGATOR, DB, PREFIX_TABLE, USR_AGNTS
+    global MAX_PAGES, PATIENCE, DEPTH_WEIGHT, TEMPLATE_LIMIT
+    global CONNECT_TIMEOUT, READ_TIMEOUT, RETRIES, RETRY_BACKOFF, BREAKER_THRESHOLD, BREAKER_COOLDOWN
+    global ROBOTS, SITEMAPS, SITEMAP_MAX_URLS, SITEMAP_MAX_FILES, DNS_SERVER, DNS_PORT
+    global INTERLEAVE_WINDOW, TLS_CACHE, CAPTURE_TLS
+
+    if "TOP_URLS" in globals():
+        return
 
     TOP_URLS = {}
     TOP_LOGS = {}
-    GEO_LIB = geoip2.database.Reader('databases/geo_ip_database/GeoLite2-City.mmdb')
-    ASN_LIB = geoip2.database.Reader('databases/asn_ip_database/GeoLite2-ASN.mmdb')
+    NS_CACHE = {}
+    CNAME_CACHE = {}
+    TLS_CACHE = {}
+
+    # web_monster_stats.RunningAggregator, when live statistics are enabled
+    AGGREGATOR = None
+
+    # web_monster_db.ResultStore, when results are also written to SQLite
+    DB = None
+
+    # ip_prefix_table.PrefixTable, used instead of GEO_LIB / ASN_LIB for IPv4 when loaded
+    PREFIX_TABLE = None
+
+    # Static crawl page budget: at most MAX_PAGES internal pages per site, stopping early once
+    # PATIENCE pages in a row found no new external domain (0 disables). DEPTH_WEIGHT is how much
+    # each path segment lowers a URL's priority in the frontier
+    MAX_PAGES = 175
+    PATIENCE = 50
+    DEPTH_WEIGHT = 0.1
+
+    # Skip internal URLs whose template (see web_monster.template_keys) already produced this many
+    # pages in a row with no new set of external resources (0 disables)
+    TEMPLATE_LIMIT = 3
+
+    # Static fetch deadlines (seconds), retries of transient errors and the per host circuit breaker
+    CONNECT_TIMEOUT = 10
+    READ_TIMEOUT = 30
+    RETRIES = 2
+    RETRY_BACKOFF = 1.0
+    BREAKER_THRESHOLD = 5
+    BREAKER_COOLDOWN = 300
+
+    # Obey robots.txt / seed the frontier from sitemaps (see web_monster_robots.py)
+    ROBOTS = False
+    SITEMAPS = False
+    SITEMAP_MAX_URLS = 500
+    SITEMAP_MAX_FILES = 10
+
+    # Recursive resolver to use instead of the system one (None keeps the system resolver). DNS_PORT
+    # is used for it and for queries sent straight to authoritative name servers
+    DNS_SERVER = None
+    DNS_PORT = 53
+
+    # Also resolve each external domain's CNAME chain and IPv6 addresses
+    RESOLVE_CNAME = True
+
+    # Also connect to the top URL and each external domain over TLS and record its certificate and
+    # negotiated protocol / cipher (see web_monster_tls.py)
+    CAPTURE_TLS = False
+
+    # How many input URLs are read ahead to interleave sites by registrable domain
+    INTERLEAVE_WINDOW = 1000
 
     USR_AGNTS = [
         'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/60.0.3112.113 Safari/537.36',
@@ -41,3 +141,31 @@ def init():
         'Mozilla/5.0 (compatible; MSIE 10.0; Windows NT 6.1; Trident/6.0)',
         'Mozilla/4.0 (compatible; MSIE 8.0; Windows NT 5.1; Trident/4.0; .NET CLR 2.0.50727; .NET CLR 3.0.4506.2152; .NET CLR 3.5.30729)'
     ]
+
+
+# ==================================================================================================
+# Snapshot of the configuration, to be passed to apply_settings() in a worker process
+
+def settings():
+    return {name: globals()[name] for name in SETTINGS}
+
+
+# ==================================================================================================
+def apply_settings(values):
+    init()
+    globals().update(values)
+
+
+# ==================================================================================================
+# Lazily open the GeoIP readers the first time globals.GEO_LIB / globals.ASN_LIB is accessed
+
+def __getattr__(name):
+    if name not in READER_PATHS:
+        raise AttributeError("module 'globals' has no attribute '" + name + "'")
+
+    with READER_LOCK:
+        if name not in globals():
+            import geoip2.database
+            globals()[name] = geoip2.database.Reader(READER_PATHS[name])
+
+    return globals()[name]
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+'''
+Precompiled IPv4 prefix table for GeoIP / ASN enrichment. The GeoLite2 City and ASN databases are
+flattened once into sorted, non-overlapping [start, end] IPv4 ranges stored as .npy columns, which
+are memory mapped at load time, so a lookup is a binary search (numpy.searchsorted) and batches of
+IPs are resolved in one vectorised call instead of one mmdb tree walk each.
+
+    python ip_prefix_table.py build -o ./databases/prefix_table/
+    python ip_prefix_table.py check ./databases/prefix_table/
+    python ip_prefix_table.py bench ./databases/prefix_table/ -n 100000
+
+Pass the table directory to crawl.py with --prefix-table to use it for IPv4 lookups; IPv6 addresses
+and stale tables fall back to the mmdb readers.
+'''
+
+import argparse
+import ipaddress
+import json
+import os
+import random
+import time
+import globals
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TABLE_VERSION = 1
+IPV4_MAPPED_MAX = 2 ** 32
+
+
+# ==================================================================================================
+# Size and modification time of the mmdb files a table is built from, used for the freshness check
+
+def source_stamp():
+    stamp = {}
+    for name, path in globals.READER_PATHS.items():
+        stat = os.stat(path)
+        stamp[name] = {"path": path, "size": stat.st_size, "mtime": int(stat.st_mtime)}
+    return stamp
+
+
+# ==================================================================================================
+# Yields (first IP, last IP, record) for every IPv4 network in an mmdb file. IPv6 databases store
+# IPv4 in the ::/96 subtree; the other aliases of it (::ffff:0:0/96, 2002::/16) are skipped
+
+def iter_ipv4_networks(path):
+    import maxminddb
+
+    with maxminddb.open_database(path) as reader:
+        for network, record in reader:
+            if network.version == 6:
+                if network.prefixlen < 96 or int(network.network_address) >= IPV4_MAPPED_MAX:
+                    continue
+                network = ipaddress.IPv4Network((int(network.network_address),
+                                                 network.prefixlen - 96))
+
+            yield int(network.network_address), int(network.broadcast_address), record
+
+
+# ==================================================================================================
+def build(output_dir):
+    if np is None:
+        raise ImportError("numpy is required for the prefix table (pip install numpy)")
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    city = sorted((start, end, (record.get("location") or {}).get("latitude"),
+                   (record.get("location") or {}).get("longitude"))
+                  for start, end, record in iter_ipv4_networks(globals.READER_PATHS["GEO_LIB"]))
+
+    asn_orgs = []
+    org_ids = {}
+    asn = []
+    for start, end, record in iter_ipv4_networks(globals.READER_PATHS["ASN_LIB"]):
+        org = record.get("autonomous_system_organization")
+        if org not in org_ids:
+            org_ids[org] = len(asn_orgs)
+            asn_orgs.append(org)
+        asn.append((start, end, record.get("autonomous_system_number"), org_ids[org]))
+    asn.sort()
+
+    columns = {
+        "city_start": np.array([r[0] for r in city], dtype=np.uint32),
+        "city_end": np.array([r[1] for r in city], dtype=np.uint32),
+        "city_lat": np.array([np.nan if r[2] is None else r[2] for r in city], dtype=np.float64),
+        "city_long": np.array([np.nan if r[3] is None else r[3] for r in city], dtype=np.float64),
+        "asn_start": np.array([r[0] for r in asn], dtype=np.uint32),
+        "asn_end": np.array([r[1] for r in asn], dtype=np.uint32),
+        "asn_number": np.array([-1 if r[2] is None else r[2] for r in asn], dtype=np.int64),
+        "asn_org": np.array([r[3] for r in asn], dtype=np.int32)
+    }
+    for name, column in columns.items():
+        np.save(os.path.join(output_dir, name + ".npy"), column)
+
+    meta = {"version": TABLE_VERSION, "built": int(time.time()), "sources": source_stamp(),
+            "asn_orgs": asn_orgs}
+    with open(os.path.join(output_dir, "meta.json"), 'w') as fp:
+        json.dump(meta, fp)
+
+    return len(city), len(asn)
+
+
+# ==================================================================================================
+# Returns true if the table exists and was built from the mmdb files currently on disk
+
+def is_fresh(table_dir):
+    meta_file = os.path.join(table_dir, "meta.json")
+    if not os.path.exists(meta_file):
+        return False
+
+    with open(meta_file, 'r') as fp:
+        meta = json.load(fp)
+
+    try:
+        return meta.get("version") == TABLE_VERSION and meta.get("sources") == source_stamp()
+    except OSError:
+        return False
+
+
+# ==================================================================================================
+class PrefixTable:
+    def __init__(self, table_dir):
+        if np is None:
+            raise ImportError("numpy is required for the prefix table (pip install numpy)")
+
+        with open(os.path.join(table_dir, "meta.json"), 'r') as fp:
+            self.asn_orgs = json.load(fp)["asn_orgs"]
+
+        def column(name):
+            return np.load(os.path.join(table_dir, name + ".npy"), mmap_mode='r')
+
+        self.city_start = column("city_start")
+        self.city_end = column("city_end")
+        self.city_lat = column("city_lat")
+        self.city_long = column("city_long")
+        self.asn_start = column("asn_start")
+        self.asn_end = column("asn_end")
+        self.asn_number = column("asn_number")
+        self.asn_org = column("asn_org")
+
+    # Index of the range holding each IP, -1 where no range does
+    @staticmethod
+    def find(starts, ends, ips):
+        idx = np.searchsorted(starts, ips, side='right') - 1
+        found = idx >= 0
+        found[found] = ips[found] <= ends[idx[found]]
+        return np.where(found, idx, -1)
+
+    # Index of the range holding one IP (an int), -1 if no range does
+    @staticmethod
+    def find_one(starts, ends, ip):
+        i = int(starts.searchsorted(ip, side='right')) - 1
+        if i >= 0 and ip <= ends[i]:
+            return i
+        return -1
+
+    @staticmethod
+    def to_ints(ip_addresses):
+        return np.array([int(ipaddress.IPv4Address(ip)) for ip in ip_addresses], dtype=np.uint32)
+
+    # ----------------------------------------------------------------------------------------------
+    # Batch lookups: take a list of IPv4 strings, return a list of tuples with None for unknowns
+
+    def lookup_geo(self, ip_addresses):
+        idx = self.find(self.city_start, self.city_end, self.to_ints(ip_addresses))
+        return [self.geo_at(i) for i in idx]
+
+    def lookup_asn(self, ip_addresses):
+        idx = self.find(self.asn_start, self.asn_end, self.to_ints(ip_addresses))
+        return [self.asn_at(i) for i in idx]
+
+    # Results for one range index, as returned by find / find_one
+    def geo_at(self, i):
+        if i < 0:
+            return None, None
+        lat, long = self.city_lat[i], self.city_long[i]
+        return None if np.isnan(lat) else float(lat), None if np.isnan(long) else float(long)
+
+    def asn_at(self, i):
+        if i < 0 or self.asn_number[i] < 0:
+            return None, None
+        return int(self.asn_number[i]), self.asn_orgs[self.asn_org[i]]
+
+    # ----------------------------------------------------------------------------------------------
+    # Single IP lookups, as made by the crawl. They binary search for the one IP directly instead of
+    # going through the batch path's arrays, and return None if the address isn't IPv4 so the
+    # caller can fall back
+
+    def geo(self, ip_address):
+        ip = ipaddress.ip_address(ip_address)
+        if ip.version != 4:
+            return None
+        return self.geo_at(self.find_one(self.city_start, self.city_end, int(ip)))
+
+    def asn(self, ip_address):
+        ip = ipaddress.ip_address(ip_address)
+        if ip.version != 4:
+            return None
+        return self.asn_at(self.find_one(self.asn_start, self.asn_end, int(ip)))
+
+
+# ==================================================================================================
+# Loads the table for use by web_monster_ip, ignoring it with a warning if it is missing or stale
+
+def load(table_dir):
+    if not is_fresh(table_dir):
+        print("WARNING (PREFIX TABLE): " + table_dir + " is missing or older than the mmdb files, "
+              "rebuild it with: python ip_prefix_table.py build -o " + table_dir)
+        return None
+
+    return PrefixTable(table_dir)
+
+
+# ==================================================================================================
+# Compares batch table lookups with the current one-at-a-time globals.GEO_LIB.city path
+
+def benchmark(table_dir, count):
+    table = PrefixTable(table_dir)
+    ip_addresses = [str(ipaddress.IPv4Address(random.getrandbits(32))) for _ in range(count)]
+
+    start = time.perf_counter()
+    table.lookup_geo(ip_addresses)
+    table_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for ip_address in ip_addresses:
+        try:
+            globals.GEO_LIB.city(ip_address)
+        except Exception:
+            pass
+    mmdb_seconds = time.perf_counter() - start
+
+    return table_seconds, mmdb_seconds
+
+
+# ==================================================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and benchmark the IPv4 GeoIP / ASN prefix table.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_cmd = commands.add_parser("build", help="Build the table from the GeoLite2 mmdb files")
+    build_cmd.add_argument("-o", dest="table_dir", type=str, help="Directory to write the table to", default="./databases/prefix_table/")
+
+    check_cmd = commands.add_parser("check", help="Check that the table matches the mmdb files")
+    check_cmd.add_argument("table_dir", type=str, help="Table directory")
+
+    bench_cmd = commands.add_parser("bench", help="Compare lookup speed with the mmdb reader")
+    bench_cmd.add_argument("table_dir", type=str, help="Table directory")
+    bench_cmd.add_argument("-n", dest="count", type=int, help="# of random IPs to look up", default=100000)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        city_ranges, asn_ranges = build(args.table_dir)
+        print("BUILT " + str(city_ranges) + " CITY RANGES, " + str(asn_ranges) + " ASN RANGES")
+
+    elif args.command == "check":
+        fresh = is_fresh(args.table_dir)
+        print("FRESH" if fresh else "STALE")
+        raise SystemExit(0 if fresh else 1)
+
+    else:
+        table_seconds, mmdb_seconds = benchmark(args.table_dir, args.count)
+        print("PREFIX TABLE: %.3fs (%.0f lookups/s)" % (table_seconds, args.count / table_seconds))
+        print("GEO_LIB.city: %.3fs (%.0f lookups/s)" % (mmdb_seconds, args.count / mmdb_seconds))
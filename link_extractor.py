@@ -5,83 +5,244 @@ Resources:
 https://docs.python-guide.org/scenarios/scrape/
 https://lxml.de/2.2/lxmlhtml.html
 https://docs.python.org/3/library/urllib.parse.html
-https://anytree.readthedocs.io/en/latest/index.html
+https://docs.python.org/3/library/concurrent.futures.html
 https://docs.python.org/3/howto/argparse.html 
 '''
 
-import requests
-import pprint
 import sys
+import os
+import json
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
-from lxml import html
 import argparse
-from anytree import Node, RenderTree, search, LevelOrderIter
 
-def main(args):
+def main(args, cache=None):
 	# The initial baseURL is created with urlparse, and needs to be prefixed with the scheme
 	if not args.url.startswith("http"):
 		args.url = "http://" + args.url
-	baseURL = urlparse(args.url).netloc
-	if baseURL.startswith("www."):
-		# TODO: some sites use www. and some don't, leading to duplicates.
-		#	I've removed www. for now to remove duplicates, but there is
-		#	probably a better way to do this in the future
-		baseURL = baseURL[4:]
-	root = Node(baseURL)
-
-	# Traverse tree level-by-level, at each step creating the next level
-	#	of children until we reach the desired depth
-	for n in LevelOrderIter(root, maxlevel=args.recurse):
-		addChildren(n)
+	baseURL = stripWWW(urlparse(args.url).netloc)
+
+	ownCache = cache is None
+	if ownCache:
+		cache = LinkCache(args.cache_size, args.cache_dir)
+	graph, parents = buildGraph(baseURL, args.recurse, args.workers, cache)
 
 	# Print nicely to the console
-	for pre, fill, node in RenderTree(root):
-		print("%s%s" % (pre, node.name))
+	for line in renderGraph(graph, parents, baseURL):
+		print(line)
+
+	if ownCache:
+		print(cache.summary())
+
+
+def run(args):
+	'''
+	Link crawl engine: builds the domain graph of every top level URL in
+	the input file, streaming the input one URL at a time and sharing
+	one link cache between all of them.
+	'''
+	# imported here so the standalone CLI doesn't need the crawler's modules
+	import web_monster_support as wms
+
+	cache = LinkCache(args.cache_size, args.cache_dir)
+	for url in wms.iter_input(args.input_file):
+		args.url = url
+		main(args, cache)
+
+	print(cache.summary())
+
+
+def stripWWW(netloc):
+	# TODO: some sites use www. and some don't, leading to duplicates.
+	#	I've removed www. for now to remove duplicates, but there is
+	#	probably a better way to do this in the future
+	if netloc.startswith("www."):
+		return netloc[4:]
+	return netloc
+
+
+def makeSession(workers):
+	'''
+	Create a requests Session whose connection pool is large enough
+	for every worker thread to keep its own connection alive.
+	'''
+	# requests is imported here so the CLI starts without it
+	import requests
+	session = requests.Session()
+	adapter = requests.adapters.HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+	session.mount("http://", adapter)
+	session.mount("https://", adapter)
+	return session
 
 
-def addChildren(node):
+class LinkCache:
 	'''
-	Given a node (where node.name is a base URL), scrape all 
-	links from the page at that URL and add the unique links 
-	as children.
+	Fetch-and-extract cache keyed by netloc. Holds the extracted link
+	weights of the most recently used domains in memory and, if a
+	directory is given, also keeps every result on disk so later runs
+	don't need to download popular domains (twitter.com, etc.) again.
 	'''
-	page = getPage(node.name)
 
-	if page == None:
-		# Can happen if we try to access a non-existent URL
-		return
+	def __init__(self, maxsize=4096, directory=None):
+		self.maxsize = maxsize
+		self.directory = directory
+		self.entries = OrderedDict()
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		if directory and not os.path.exists(directory):
+			os.makedirs(directory)
+
+	def path(self, netloc):
+		digest = hashlib.sha1(str.encode(netloc)).hexdigest()
+		return os.path.join(self.directory, digest + ".json")
+
+	def get(self, netloc):
+		with self.lock:
+			if netloc in self.entries:
+				self.entries.move_to_end(netloc)
+				self.hits += 1
+				return self.entries[netloc]
+
+		weights = None
+		if self.directory and os.path.exists(self.path(netloc)):
+			# An unreadable entry (e.g. from an older, interrupted run) is
+			#	treated as a miss and gets rewritten once fetched again
+			try:
+				with open(self.path(netloc), 'r') as f:
+					weights = Counter(json.load(f))
+			except (OSError, ValueError, TypeError):
+				print("Ignoring unreadable cache entry: " + netloc, file=sys.stderr)
+				weights = None
+			if weights is not None:
+				self.put(netloc, weights, persist=False)
+
+		with self.lock:
+			if weights is None:
+				self.misses += 1
+			else:
+				self.hits += 1
+		return weights
+
+	def summary(self):
+		with self.lock:
+			hits, misses = self.hits, self.misses
+		total = hits + misses
+		rate = 100.0 * hits / total if total else 0.0
+		return "LINK CACHE: %d hits, %d misses (%.1f%% hit rate)" % (hits, misses, rate)
+
+	def put(self, netloc, weights, persist=True):
+		with self.lock:
+			self.entries[netloc] = weights
+			self.entries.move_to_end(netloc)
+			while len(self.entries) > self.maxsize:
+				self.entries.popitem(last=False)
+
+		if persist and self.directory:
+			# Written to a temporary file and renamed, so an interrupted
+			#	write never leaves a partial entry behind
+			path = self.path(netloc)
+			tmp = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+			with open(tmp, 'w') as f:
+				json.dump(weights, f)
+			os.replace(tmp, path)
+
+
+def buildGraph(root, recurse, workers, cache=None):
+	'''
+	Build the domain graph breadth first, fetching every node of a
+	level concurrently. Domains found in the cache are not fetched.
+	Returns the adjacency map (netloc -> Counter of child netlocs,
+	weighted by how many times the link appeared) and the BFS parent
+	of every discovered node, used for rendering.
+	'''
+	graph = {}
+	parents = {root: None}
+	level = [root]
+
+	with makeSession(workers) as session, ThreadPoolExecutor(max_workers=workers) as executor:
+		for _ in range(recurse):
+			nextLevel = []
+			children = executor.map(lambda n: getChildren(n, session, cache), level)
+
+			for node, weights in zip(level, children):
+				graph[node] = weights
+				for child in weights:
+					# Only expand a domain the first time it is discovered
+					if child not in parents:
+						parents[child] = node
+						nextLevel.append(child)
+
+			if not nextLevel:
+				break
+			level = nextLevel
+
+	return graph, parents
+
+
+def getChildren(url, session, cache=None):
+	'''
+	Given a base URL, scrape all links from the page at that URL and
+	count how many times each external base URL is linked to.
+	'''
+	if cache is not None:
+		weights = cache.get(url)
+		if weights is not None:
+			return weights
+
+	weights = Counter()
+	page = getPage(url, session)
+
+	if page is None:
+		# Can happen if we try to access a non-existent URL. Failures are
+		#	not cached so a transient error doesn't stick across runs
+		return weights
 
 	for link in page.iterlinks():
 		# Get URL of the HTML link element
-		l = urlparse(link[2])
-		if l.netloc.startswith("www."):
-			# TODO: see note in main() about www.
-			netloc = l.netloc[4:]
-		else:
-			netloc = l.netloc
-
-		# If the link is not to the same base URL and not already in the 
-		#	children of the tree, add it to the tree.
-		# TODO: Maybe instead of skipping duplicates we can count the number 
-		#	of times a link appears on a page, and weight certain nodes as 
-		#	"more important" than others.
-		if netloc != '' and netloc != node.name:
-			find = search.findall(node, filter_=lambda n: n.name == netloc)
-			if find == ():
-				# Setting the parent here automatically updates the tree!
-				Node(netloc, parent=node)
-
-
-def getPage(url):
+		netloc = stripWWW(urlparse(link[2]).netloc)
+
+		# Links back to the same base URL are not dependencies
+		if netloc != '' and netloc != url:
+			weights[netloc] += 1
+
+	if cache is not None:
+		cache.put(url, weights)
+	return weights
+
+
+def renderGraph(graph, parents, root):
 	'''
-	Given a URL, use the requests library + lxml/html to 
+	Yield the lines of a tree rendering of the graph. A node is only
+	expanded under its BFS parent; anywhere else it is shown as a leaf.
+	Each child is annotated with the number of links to it.
+	'''
+	yield root
+	yield from renderChildren(graph, parents, root, "")
+
+
+def renderChildren(graph, parents, node, prefix):
+	children = list(graph.get(node, {}).items())
+	for i, (child, weight) in enumerate(children):
+		last = i == len(children) - 1
+		yield "%s%s%s (%d)" % (prefix, "└── " if last else "├── ", child, weight)
+		if parents.get(child) == node and child in graph:
+			yield from renderChildren(graph, parents, child, prefix + ("    " if last else "│   "))
+
+
+def getPage(url, session):
+	'''
+	Given a URL, use the pooled requests Session + lxml/html to 
 	return an html_tree object.
 	'''
 	try:
 		if not url.startswith("http"):
 			# requests.get() needs the scheme--default to http
 			url = "http://" + url
-		page = requests.get(url)
+		page = session.get(url, timeout=10)
 		if page.ok != True:
 			print("Error reading page: ", file=sys.stderr)
 			print(page, file=sys.stderr)
@@ -90,13 +251,22 @@ def getPage(url):
 		print("Error sending request", file=sys.stderr)
 		return None
 
-	html_tree = html.fromstring(page.content)
+	from lxml import html
+	try:
+		html_tree = html.fromstring(page.content)
+	except Exception:
+		# Empty or non-HTML bodies can't be parsed
+		print("Error parsing page: " + url, file=sys.stderr)
+		return None
 	return html_tree
 
 
 if __name__ == "__main__":
 	parser = argparse.ArgumentParser(description="Crawl webpages for 3rd party links.")
 	parser.add_argument("-r", type=int, dest="recurse", default=1, help="# of recursive scans to perform")
+	parser.add_argument("-w", type=int, dest="workers", default=16, help="# of pages to fetch concurrently")
+	parser.add_argument("-c", type=str, dest="cache_dir", default=None, help="Directory to keep extracted links in between runs")
+	parser.add_argument("--cache-size", type=int, dest="cache_size", default=4096, help="# of domains to keep in the in-memory cache")
 	parser.add_argument("url", type=str, help="The URL to scan")
 	args = parser.parse_args()
-	main(args)
\ No newline at end of file
+	main(args)
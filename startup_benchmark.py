@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+'''
+Measures the cold start cost of a crawl worker: for each target, a fresh interpreter is started and
+its wall clock time and peak RSS are recorded. Run from the repository root:
+
+    python startup_benchmark.py -n 10
+'''
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+TARGETS = {
+    "python": ["-c", "pass"],
+    "import globals": ["-c", "import globals; globals.init()"],
+    "import web_monster": ["-c", "import web_monster"],
+    "import dynamic_reading": ["-c", "import dynamic_reading"],
+    "import link_extractor": ["-c", "import link_extractor"],
+    "crawl.py --help": ["crawl.py", "--help"]
+}
+
+
+# ==================================================================================================
+# Runs the command once, returns (seconds, peak RSS in KB, exit status)
+
+def time_once(argv):
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable] + argv, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    return elapsed, rusage.ru_maxrss, proc.returncode
+
+
+# ==================================================================================================
+def benchmark(runs):
+    results = {}
+    for name, argv in TARGETS.items():
+        times = []
+        rss = []
+        status = 0
+        for _ in range(runs):
+            elapsed, maxrss, status = time_once(argv)
+            times.append(elapsed)
+            rss.append(maxrss)
+
+        times.sort()
+        results[name] = {
+            "min_ms": times[0] * 1000,
+            "median_ms": times[len(times) // 2] * 1000,
+            "max_rss_kb": max(rss),
+            "status": status
+        }
+
+    return results
+
+
+# ==================================================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark crawl worker startup time and memory.")
+    parser.add_argument("-n", dest="runs", type=int, help="# of runs per target", default=5)
+    args = parser.parse_args()
+
+    print("%-26s %10s %10s %12s %s" % ("target", "min ms", "median ms", "max RSS KB", "status"))
+    for name, result in benchmark(args.runs).items():
+        print("%-26s %10.1f %10.1f %12d %s" % (name, result["min_ms"], result["median_ms"],
+                                                result["max_rss_kb"], result["status"]))
@@ -0,0 +1,238 @@
+'''
+Local stand-ins for everything a crawl talks to: a DNS server answering from a small zone, an HTTP
+server serving a generated site and tiny GeoLite2 format City / ASN databases.
+'''
+
+import os
+import socket
+import sys
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import globals  # noqa: E402
+
+# --------------------------------------------------------------------------------------------------
+# Synthetic zone. Every zone's name server is the stub itself (127.0.0.1), so queries sent straight
+# to an authoritative server end up back at the stub too
+
+ZONE = {
+    ("example.org.", "NS"): ["ns1.example.org."],
+    ("ns1.example.org.", "A"): ["127.0.0.1"],
+    ("cdn.example.org.", "A"): ["192.0.2.10", "192.0.2.11"],
+    ("example.net.", "NS"): ["ns1.example.net.", "ns2.example.net."],
+    ("ns1.example.net.", "A"): ["127.0.0.1"],
+    ("ns2.example.net.", "A"): ["127.0.0.1"],
+    ("img.example.net.", "CNAME"): ["edge-7.examplecdn.net."],
+    ("edge-7.examplecdn.net.", "A"): ["198.51.100.7"],
+    ("edge-7.examplecdn.net.", "AAAA"): ["2001:db8::7"],
+    ("social.example.com.", "NS"): ["ns.example.net."],
+    ("ns.example.net.", "A"): ["127.0.0.1"],
+    ("social.example.com.", "A"): ["192.0.2.20"],
+}
+
+GEO_NETWORKS = {
+    "127.0.0.0/8": {"location": {"latitude": 40.4406, "longitude": -79.9959}},
+    "192.0.2.0/24": {"location": {"latitude": 51.4964, "longitude": -0.1224}},
+    "198.51.100.0/24": {"location": {"latitude": 37.751, "longitude": -97.822}},
+}
+
+ASN_NETWORKS = {
+    "127.0.0.0/8": {"autonomous_system_number": 64496, "autonomous_system_organization": "LOOPBACK"},
+    "192.0.2.0/24": {"autonomous_system_number": 64500, "autonomous_system_organization": "EXAMPLE-CDN"},
+    "198.51.100.0/24": {"autonomous_system_number": 64501, "autonomous_system_organization": "EXAMPLE-IMG"},
+}
+
+
+# ==================================================================================================
+# DNS stub
+
+def zone_apex(name):
+    labels = name.split(".")
+    for i in range(len(labels) - 1):
+        candidate = ".".join(labels[i:])
+        if (candidate, "NS") in ZONE:
+            return candidate
+    return None
+
+
+def answer_query(wire):
+    import dns.message
+    import dns.rcode
+    import dns.rdatatype
+    import dns.rrset
+
+    query = dns.message.from_wire(wire)
+    response = dns.message.make_response(query)
+    question = query.question[0]
+    name = question.name.to_text().lower()
+    rdtype = dns.rdatatype.to_text(question.rdtype)
+
+    # follow CNAMEs like a recursive resolver, putting the whole chain in the answer
+    while rdtype != "CNAME" and (name, "CNAME") in ZONE:
+        target = ZONE[(name, "CNAME")]
+        response.answer.append(dns.rrset.from_text_list(name, 300, "IN", "CNAME", target))
+        name = target[0]
+
+    records = ZONE.get((name, rdtype))
+    if records:
+        response.answer.append(dns.rrset.from_text_list(name, 300, "IN", rdtype, records))
+    if response.answer:
+        return response.to_wire()
+
+    apex = zone_apex(name)
+    if apex is None:
+        response.set_rcode(dns.rcode.NXDOMAIN)
+    else:
+        # NODATA: point at the enclosing zone like a real server does with its SOA
+        response.authority.append(dns.rrset.from_text(
+            apex, 300, "IN", "SOA", "ns1." + apex + " hostmaster." + apex + " 1 3600 600 86400 300"))
+    return response.to_wire()
+
+
+def answer_servfail(wire):
+    import dns.message
+    import dns.rcode
+
+    response = dns.message.make_response(dns.message.from_wire(wire))
+    response.set_rcode(dns.rcode.SERVFAIL)
+    return response.to_wire()
+
+
+def serve_dns(answer, address=("127.0.0.1", 0)):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(address)
+    stop = threading.Event()
+
+    def serve():
+        sock.settimeout(0.2)
+        while not stop.is_set():
+            try:
+                wire, address = sock.recvfrom(4096)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            sock.sendto(answer(wire), address)
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield sock.getsockname()
+
+    stop.set()
+    thread.join()
+    sock.close()
+
+
+@pytest.fixture(scope="session")
+def dns_stub():
+    pytest.importorskip("dns")
+    yield from serve_dns(answer_query)
+
+
+# A broken resolver that answers every query with SERVFAIL. It listens on another loopback address
+# but the same port as dns_stub, since a resolver sends to every nameserver on one port
+
+@pytest.fixture(scope="session")
+def servfail_stub(dns_stub):
+    yield from serve_dns(answer_servfail, ("127.0.0.3", dns_stub[1]))
+
+
+# ==================================================================================================
+# HTTP site generator
+
+def generate_site(sections=3, pages_per_section=4):
+    ''' Returns {path: html} for a small news style site that includes a few external resources '''
+    pages = {}
+
+    home_links = "".join('<a href="/%s/">%s</a>' % (s, s) for s in ["section%d" % i for i in range(sections)])
+    pages["/"] = ('<html><head><script src="https://cdn.example.org/app.js"></script>'
+                  '<link href="https://cdn.example.org/site.css" rel="stylesheet"></head>'
+                  '<body>%s<a href="https://social.example.com/share">share</a>'
+                  '<a href="mailto:someone@example.org">mail</a></body></html>' % home_links)
+
+    for i in range(sections):
+        links = "".join('<a href="/section%d/story-%d/">story</a>' % (i, j) for j in range(pages_per_section))
+        pages["/section%d/" % i] = ('<html><body><a href="/">home</a>%s'
+                                    '<img src="https://img.example.net/section%d.png"></body></html>'
+                                    % (links, i))
+        for j in range(pages_per_section):
+            pages["/section%d/story-%d/" % (i, j)] = (
+                '<html><body><a href="/section%d/">back</a>'
+                '<script src="https://cdn.example.org/app.js"></script>'
+                '<img src="https://img.example.net/story-%d-%d.png">'
+                '<iframe src="https://social.example.com/embed/%d"></iframe></body></html>' % (i, i, j, j))
+
+    return pages
+
+
+@pytest.fixture(scope="session")
+def http_site():
+    pages = generate_site()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = pages.get(self.path.split("?")[0])
+            if body is None:
+                self.send_error(404)
+                return
+            body = body.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%d/" % server.server_address[1]
+
+    server.shutdown()
+    server.server_close()
+
+
+# ==================================================================================================
+# GeoLite2 format databases
+
+@pytest.fixture(scope="session")
+def mmdb_files(tmp_path_factory):
+    from mmdb_writer import write_mmdb
+
+    directory = tmp_path_factory.mktemp("mmdb")
+    city = str(directory / "GeoLite2-City.mmdb")
+    asn = str(directory / "GeoLite2-ASN.mmdb")
+    write_mmdb(city, "GeoLite2-City", GEO_NETWORKS)
+    write_mmdb(asn, "GeoLite2-ASN", ASN_NETWORKS)
+    return {"GEO_LIB": city, "ASN_LIB": asn}
+
+
+# ==================================================================================================
+# Points the crawl's globals at the stand-ins, and resets the shared caches between tests
+
+@pytest.fixture
+def crawl_env(dns_stub, mmdb_files, monkeypatch):
+    pytest.importorskip("geoip2")
+    import web_monster_ip as wmi
+
+    globals.init()
+    monkeypatch.setattr(globals, "READER_PATHS", dict(mmdb_files))
+    monkeypatch.setattr(globals, "DNS_SERVER", dns_stub[0])
+    monkeypatch.setattr(globals, "DNS_PORT", dns_stub[1])
+    monkeypatch.setattr(globals, "NS_CACHE", {})
+    monkeypatch.setattr(globals, "CNAME_CACHE", {})
+    for reader in ("GEO_LIB", "ASN_LIB"):
+        monkeypatch.delitem(globals.__dict__, reader, raising=False)
+
+    wmi.get_ip_geo.cache_clear()
+    wmi.get_ip_asn.cache_clear()
+    yield
+    wmi.get_ip_geo.cache_clear()
+    wmi.get_ip_asn.cache_clear()
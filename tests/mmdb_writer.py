@@ -0,0 +1,124 @@
+'''
+Minimal writer for MaxMind DB (GeoLite2 format) files, enough to build tiny IPv4 City and ASN
+databases for the tests.
+
+REFERENCES:
+    https://maxmind.github.io/MaxMind-DB/
+'''
+
+import ipaddress
+import struct
+import time
+
+METADATA_MARKER = b"\xab\xcd\xefMaxMind.com"
+RECORD_SIZE = 24
+
+
+# ==================================================================================================
+# Data section encoding
+
+def control(type_num, size):
+    if size < 29:
+        size_bytes, size_bits = b"", size
+    elif size < 285:
+        size_bytes, size_bits = bytes([size - 29]), 29
+    elif size < 65821:
+        size_bytes, size_bits = struct.pack(">H", size - 285), 30
+    else:
+        size_bytes, size_bits = struct.pack(">I", size - 65821)[1:], 31
+
+    if type_num <= 7:
+        return bytes([(type_num << 5) | size_bits]) + size_bytes
+    return bytes([size_bits, type_num - 7]) + size_bytes
+
+
+def uint_bytes(value):
+    return value.to_bytes((value.bit_length() + 7) // 8, "big")
+
+
+def encode(value, type_hint=None):
+    if isinstance(value, dict):
+        data = control(7, len(value))
+        for key, item in value.items():
+            data += encode(key) + encode(item, type_hint.get(key) if type_hint else None)
+        return data
+    if isinstance(value, list):
+        return control(11, len(value)) + b"".join(encode(item) for item in value)
+    if isinstance(value, str):
+        raw = value.encode("utf-8")
+        return control(2, len(raw)) + raw
+    if isinstance(value, float):
+        return control(3, 8) + struct.pack(">d", value)
+    if isinstance(value, bool):
+        return control(14, int(value))
+    if isinstance(value, int):
+        type_num = {"uint16": 5, "uint64": 9}.get(type_hint, 6)
+        raw = uint_bytes(value)
+        return control(type_num, len(raw)) + raw
+    raise TypeError("cannot encode " + repr(value))
+
+
+# ==================================================================================================
+# Builds the binary search tree over the 32 bit IPv4 space
+
+def build_tree(networks):
+    nodes = [[None, None]]
+
+    for network, data_index in networks:
+        bits = int(network.network_address)
+        node = 0
+        for depth in range(network.prefixlen):
+            bit = (bits >> (31 - depth)) & 1
+            if depth == network.prefixlen - 1:
+                nodes[node][bit] = ("data", data_index)
+            else:
+                if not isinstance(nodes[node][bit], int):
+                    nodes.append([None, None])
+                    nodes[node][bit] = len(nodes) - 1
+                node = nodes[node][bit]
+
+    return nodes
+
+
+# ==================================================================================================
+# networks maps "a.b.c.d/len" to a record dict. database_type must contain "City" or "ASN" for
+# geoip2's city() / asn() to accept the file
+
+def write_mmdb(path, database_type, networks):
+    data = b""
+    offsets = []
+    parsed = []
+    for cidr, record in networks.items():
+        offsets.append(len(data))
+        data += encode(record)
+        parsed.append((ipaddress.IPv4Network(cidr), len(offsets) - 1))
+
+    nodes = build_tree(parsed)
+    node_count = len(nodes)
+
+    def record_value(record):
+        if record is None:
+            return node_count
+        if isinstance(record, int):
+            return record
+        return node_count + 16 + offsets[record[1]]
+
+    tree = b""
+    for left, right in nodes:
+        tree += record_value(left).to_bytes(3, "big") + record_value(right).to_bytes(3, "big")
+
+    metadata = encode({
+        "node_count": node_count,
+        "record_size": RECORD_SIZE,
+        "ip_version": 4,
+        "database_type": database_type,
+        "languages": ["en"],
+        "binary_format_major_version": 2,
+        "binary_format_minor_version": 0,
+        "build_epoch": int(time.time()),
+        "description": {"en": "web_dependencies test fixture"}
+    }, {"record_size": "uint16", "ip_version": "uint16", "binary_format_major_version": "uint16",
+        "binary_format_minor_version": "uint16", "build_epoch": "uint64"})
+
+    with open(path, "wb") as f:
+        f.write(tree + b"\x00" * 16 + data + METADATA_MARKER + metadata)
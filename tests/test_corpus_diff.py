@@ -0,0 +1,58 @@
+import json
+
+import corpus_diff
+
+
+def site(top_url, **domains):
+    return {"top_url": top_url, "top_domain": top_url, "external_resources": {}, "ip_addresses": {},
+            "external_domains": {name: dict(info) for name, info in domains.items()}}
+
+
+def domain(nameservers, ips, total):
+    return {"resources": {"total": total},
+            "authoritative_name_servers": {ns: {"ip": "192.0.2.53"} for ns in nameservers},
+            "ip_addresses": {ip: {"lat": lat, "long": long, "asn": asn} for ip, lat, long, asn in ips}}
+
+
+def write_corpus(directory, sites):
+    directory.mkdir()
+    for name, data, indent in sites:
+        (directory / name).write_text(json.dumps(data, indent=indent))
+    return str(directory)
+
+
+def test_diff_corpora(tmp_path):
+    cdn = domain(["ns1.cdn.net."], [("192.0.2.1", 40.4, -79.9, 64500)], 10)
+    moved = domain(["ns1.cdn.net."], [("198.51.100.1", 52.3, 4.9, 64501)], 12)
+
+    before = write_corpus(tmp_path / "before", [
+        ("same.json", site("https://same.org/", **{"cdn.net": cdn}), None),
+        ("reordered.json", site("https://reordered.org/", **{"cdn.net": cdn, "b.com": cdn}), None),
+        ("changed.json", site("https://changed.org/", **{"cdn.net": cdn, "old.com": cdn}), None),
+        ("removed.json", site("https://removed.org/"), None)])
+    after = write_corpus(tmp_path / "after", [
+        ("same.json", site("https://same.org/", **{"cdn.net": cdn}), None),
+        ("reordered.json", site("https://reordered.org/", **{"b.com": cdn, "cdn.net": cdn}), 2),
+        ("changed.json", site("https://changed.org/", **{"cdn.net": moved, "new.com": cdn}), None),
+        ("added.json", site("https://added.org/"), None)])
+
+    records = list(corpus_diff.diff_corpora(before, after, workers=2))
+    assert records == list(corpus_diff.diff_corpora(before, after, workers=1))
+
+    by_file = {record["file"]: record for record in records}
+    assert by_file["same.json"] == {"file": "same.json", "status": "unchanged"}
+    assert by_file["reordered.json"]["status"] == "unchanged"
+    assert by_file["added.json"]["status"] == "added"
+    assert by_file["removed.json"]["status"] == "removed"
+    assert by_file["changed.json"] == {
+        "file": "changed.json", "top_url": "https://changed.org/", "status": "changed",
+        "domains_added": ["new.com"], "domains_removed": ["old.com"], "ns_changes": {},
+        "asn_moves": {"cdn.net": {"before": [64500], "after": [64501]}},
+        "geo_moves": {"cdn.net": {"before": ["40,-80"], "after": ["52,4"]}},
+        "resource_deltas": {"cdn.net": 2}}
+
+    summary = corpus_diff.DiffSummary()
+    for record in records:
+        summary.add(record)
+    assert summary.status == {"unchanged": 2, "changed": 1, "added": 1, "removed": 1}
+    assert summary.asn_moves == {((64500,), (64501,)): 1}
@@ -0,0 +1,259 @@
+'''
+Golden output tests: crawling the generated site must give exactly the same external_domains,
+external_resources and ip_addresses whichever way the static engine schedules its sites, and the
+dynamic engine's request / response evaluation must give the same dependency chain.
+'''
+
+import argparse
+import glob
+import json
+import os
+
+import pytest
+
+import globals
+import web_monster_support as wms
+
+pytest.importorskip("bs4")
+pytest.importorskip("lxml")
+
+CDN_IP = {"lat": 51.4964, "long": -0.1224, "asn": 64500, "as_org": "EXAMPLE-CDN"}
+IMG_IP = {"lat": 37.751, "long": -97.822, "asn": 64501, "as_org": "EXAMPLE-IMG"}
+NS_IP = {"ip": "127.0.0.1", "lat": 40.4406, "long": -79.9959, "asn": 64496, "asn_org": "LOOPBACK"}
+
+
+def resource_counts(**counts):
+    result = {tag: 0 for tag in wms.HTML_ELEMENTS.keys()}
+    result.update(counts)
+    return dict(total=sum(counts.values()), **result)
+
+
+EXPECTED_DOMAINS = {
+    "cdn.example.org": {
+        "resources": resource_counts(script=13, link=1),
+        "authoritative_name_servers": {"ns1.example.org.": NS_IP},
+        "ip_addresses": {"192.0.2.10": CDN_IP, "192.0.2.11": CDN_IP},
+        "cname_chain": [],
+        "cdn_zone": None,
+        "ip6_addresses": {},
+    },
+    "social.example.com": {
+        "resources": resource_counts(a=1, iframe=12),
+        "authoritative_name_servers": {"ns.example.net.": NS_IP},
+        "ip_addresses": {"192.0.2.20": CDN_IP},
+        "cname_chain": [],
+        "cdn_zone": None,
+        "ip6_addresses": {},
+    },
+    "img.example.net": {
+        "resources": resource_counts(img=15),
+        "authoritative_name_servers": {"ns1.example.net.": NS_IP, "ns2.example.net.": NS_IP},
+        "ip_addresses": {"198.51.100.7": IMG_IP},
+        "cname_chain": ["edge-7.examplecdn.net"],
+        "cdn_zone": "examplecdn.net",
+        # the test databases are IPv4 only
+        "ip6_addresses": {"2001:db8::7": {"lat": None, "long": None, "asn": None, "as_org": None}},
+    },
+}
+
+EXPECTED_RESOURCES = dict(
+    [("https://cdn.example.org/app.js", {"count": 13, "type": "script"}),
+     ("https://cdn.example.org/site.css", {"count": 1, "type": "link"}),
+     ("https://social.example.com/share/", {"count": 1, "type": "a"})] +
+    [("https://social.example.com/embed/%d" % j, {"count": 3, "type": "iframe"}) for j in range(4)] +
+    [("https://img.example.net/section%d.png" % i, {"count": 1, "type": "img"}) for i in range(3)] +
+    [("https://img.example.net/story-%d-%d.png" % (i, j), {"count": 1, "type": "img"})
+     for i in range(3) for j in range(4)]
+)
+
+
+def crawl(http_site, tmp_path, mode):
+    import web_monster
+
+    # the same server reached under two host names is two sites to the crawler
+    top_urls = [http_site, http_site.replace("127.0.0.1", "localhost")]
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("\n".join(top_urls) + "\n")
+    output_dir = tmp_path / mode
+
+    args = argparse.Namespace(input_file=str(input_file), output_dir=str(output_dir),
+                              workers=2, mode=mode)
+    web_monster.run(args)
+
+    results = {}
+    for json_file in glob.glob(os.path.join(str(output_dir), "*.json")):
+        with open(json_file) as f:
+            site = json.load(f)
+        results[site["top_url"]] = site
+    return results
+
+
+@pytest.mark.parametrize("mode", ["serial", "thread", "process"])
+def test_static_engine_golden_output(crawl_env, http_site, tmp_path, mode):
+    results = crawl(http_site, tmp_path, mode)
+
+    assert len(results) == 2
+    for site in results.values():
+        assert site["external_domains"] == EXPECTED_DOMAINS
+        assert site["external_resources"] == EXPECTED_RESOURCES
+        # the test server has no DNS name, so the site itself has no addresses
+        assert site["ip_addresses"] == {}
+
+
+def test_static_engine_modes_agree(crawl_env, http_site, tmp_path):
+    outputs = [crawl(http_site, tmp_path, mode) for mode in ["serial", "thread", "process"]]
+    assert outputs[0] == outputs[1] == outputs[2]
+
+
+def test_get_auth_ns_follows_parent_zone(crawl_env):
+    import web_monster_ip as wmi
+
+    assert wmi.get_auth_ns("cdn.example.org", None, 0) == {"ns1.example.org.": {"ip": "127.0.0.1"}}
+    assert wmi.get_auth_ns("missing.invalid", None, 0) is None
+
+
+def test_get_auth_ns_of_alias_is_its_zones(crawl_env):
+    import web_monster_ip as wmi
+
+    assert sorted(wmi.get_auth_ns("img.example.net", None, 0)) == ["ns1.example.net.", "ns2.example.net."]
+
+
+def test_resolve_chain_is_cached_along_the_chain(crawl_env):
+    import web_monster_ip as wmi
+
+    assert wmi.resolve_chain("img.example.net") == {"cname_chain": ["edge-7.examplecdn.net"],
+                                                     "ip4_addresses": ["198.51.100.7"],
+                                                     "ip6_addresses": ["2001:db8::7"]}
+    assert globals.CNAME_CACHE["edge-7.examplecdn.net"] == {"cname_chain": [],
+                                                           "ip4_addresses": ["198.51.100.7"],
+                                                           "ip6_addresses": ["2001:db8::7"]}
+
+
+def test_query_batch_falls_back_to_the_next_nameserver(crawl_env, monkeypatch):
+    import web_monster_ip as wmi
+
+    resolver = wmi.get_resolver()
+    # nothing answers on 127.0.0.2
+    resolver.nameservers = ["127.0.0.2", globals.DNS_SERVER]
+    resolver.lifetime = 1
+    monkeypatch.setattr(wmi, "get_resolver", lambda: resolver)
+
+    responses = wmi.query_batch("cdn.example.org")
+    chain, addresses = wmi.parse_chain(responses["A"], "cdn.example.org", "A")
+    assert chain == [] and sorted(addresses) == ["192.0.2.10", "192.0.2.11"]
+    assert responses["AAAA"] is not None
+
+
+def test_external_domains_need_no_separate_a_query(crawl_env, http_site, tmp_path, monkeypatch):
+    import web_monster_ip as wmi
+
+    queried = []
+    get_ip4_addrs = wmi.get_ip4_addrs
+    monkeypatch.setattr(wmi, "get_ip4_addrs",
+                        lambda url, ns: queried.append(url) or get_ip4_addrs(url, ns))
+
+    results = crawl(http_site, tmp_path, "serial")
+    for site in results.values():
+        assert site["external_domains"] == EXPECTED_DOMAINS
+    # only the top URLs, which have no CNAME lookup, are resolved on their own
+    assert sorted(queried) == sorted(results)
+
+
+def test_get_ip4_addrs_via_authoritative_ns(crawl_env):
+    import web_monster_ip as wmi
+
+    nameservers = {"ns1.example.org.": {"ip": "127.0.0.1"}}
+    assert sorted(wmi.get_ip4_addrs("https://cdn.example.org/app.js", nameservers)) == \
+        ["192.0.2.10", "192.0.2.11"]
+
+
+def test_servfail_is_retried_on_the_next_nameserver_and_not_cached(crawl_env, servfail_stub,
+                                                                   monkeypatch):
+    import web_monster_ip as wmi
+
+    resolver = wmi.get_resolver()
+    resolver.nameservers = [servfail_stub[0], globals.DNS_SERVER]
+    monkeypatch.setattr(wmi, "get_resolver", lambda: resolver)
+
+    assert wmi.resolve_chain("img.example.net")["ip4_addresses"] == ["198.51.100.7"]
+    assert "img.example.net" in globals.CNAME_CACHE
+
+    # with only the broken resolver left the lookup fails, and is asked again next time
+    resolver.nameservers = [servfail_stub[0]]
+    assert wmi.resolve_chain("cdn.example.org") == {"cname_chain": [], "ip4_addresses": None,
+                                                     "ip6_addresses": []}
+    assert "cdn.example.org" not in globals.CNAME_CACHE
+
+
+def test_servfail_falls_back_to_an_a_query(crawl_env, servfail_stub, monkeypatch):
+    import web_monster_ip as wmi
+
+    top_dict = {"external_domains": {"cdn.example.org": {}}}
+    resolver = wmi.get_resolver()
+    resolver.nameservers = [servfail_stub[0]]
+    monkeypatch.setattr(wmi, "get_resolver", lambda: resolver)
+    result = wmi.set_cname_info("cdn.example.org", top_dict)
+    assert result["ip4_addresses"] is None
+
+    # set_ip4_info asks the authoritative nameserver when the batch got no usable A answer
+    nameservers = {"ns1.example.org.": {"ip": "127.0.0.1"}}
+    wmi.set_ip4_info("cdn.example.org", top_dict, nameservers, result["ip4_addresses"])
+    assert sorted(top_dict["external_domains"]["cdn.example.org"]["ip_addresses"]) == \
+        ["192.0.2.10", "192.0.2.11"]
+
+
+# --------------------------------------------------------------------------------------------------
+# Dynamic engine: performance log events as Chrome reports them
+
+def request_event(url, referer=None):
+    headers = {"Referer": referer} if referer else {}
+    return {"method": "Network.requestWillBeSent",
+            "params": {"request": {"url": url, "headers": headers}}}
+
+
+def response_event(url, ip, mime_type, server=None, issuer=None):
+    response = {"url": url, "remoteIPAddress": ip, "mimeType": mime_type,
+                "headers": {"server": server} if server else {}}
+    if issuer:
+        response["securityDetails"] = {"issuer": issuer}
+    return {"method": "Network.responseReceived", "params": {"response": response}}
+
+
+def test_dynamic_evaluation_golden_output():
+    import dynamic_reading
+
+    top_dict = {"top_url": "https://site.example/", "top_domain": "site.example",
+                "external_domains": {}, "external_resources": {}}
+
+    responses = [
+        response_event("https://site.example/", "203.0.113.1", "text/html", "nginx", "Example CA"),
+        response_event("https://tags.example.com/tm.js", "192.0.2.30", "application/javascript",
+                       issuer="Example CA"),
+        response_event("https://ads.example.net/px.gif", "192.0.2.31", "image/gif", "ads"),
+        response_event("https://ads.example.net/px2.gif", "192.0.2.31", "image/gif", "ads"),
+    ]
+    requests = [
+        request_event("https://site.example/"),
+        request_event("https://tags.example.com/tm.js", "https://site.example/"),
+        request_event("https://ads.example.net/px.gif", "https://tags.example.com/tm.js"),
+        request_event("https://ads.example.net/px2.gif", "https://tags.example.com/tm.js"),
+    ]
+
+    dynamic_reading.evaluate_responses(responses, "site.example", top_dict)
+    dynamic_reading.evaluate_requests(requests, "site.example", top_dict)
+
+    assert top_dict["ip_addresses"] == {"203.0.113.1": {"server": "nginx"}}
+    assert top_dict["cert_issuer"] == ["Example CA"]
+    assert top_dict["external_domains"] == {
+        "tags.example.com": {
+            "ip_addresses": {"192.0.2.30": {}},
+            "cert_issuer": ["Example CA"],
+            "mimeType": {"application/javascript": 1},
+            "dependencies": ["ads.example.net"],
+        },
+        "ads.example.net": {
+            "ip_addresses": {"192.0.2.31": {"server": "ads"}},
+            "cert_issuer": [],
+            "mimeType": {"image/gif": 2},
+        },
+    }
@@ -0,0 +1,45 @@
+import sqlite3
+
+import web_monster_db as wmdb
+
+
+def site(top_url, count=1):
+    return {"top_url": top_url, "top_domain": top_url, "ip_addresses": {}, "external_domains": {},
+            "external_resources": {"https://cdn.example.org/app.js": {"count": count,
+                                                                       "type": "script"}}}
+
+
+def test_a_bad_site_does_not_lose_its_batch(tmp_path, capsys):
+    path = str(tmp_path / "crawl.db")
+    store = wmdb.ResultStore(path, batch_size=50, flush_interval=0.5)
+
+    log = {"internal_urls": {"https://a.org/"}, "error_urls": set(), "error_reasons": {}}
+    store.save_site(site("https://a.org/"), log)
+    # sqlite can't bind a dict, so this site's insert fails
+    store.save_site(site("https://bad.org/", count={"not": "a number"}), log)
+    store.save_site(site("https://c.org/"), log)
+    store.close()
+
+    assert store.completed_sites() == {"https://a.org/", "https://c.org/"}
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM resources").fetchone()[0] == 2
+    conn.close()
+    assert "could not store https://bad.org/" in capsys.readouterr().out
+
+
+def test_a_site_that_raises_a_non_sqlite_error_does_not_stop_the_writer(tmp_path, capsys):
+    path = str(tmp_path / "crawl.db")
+    store = wmdb.ResultStore(path, batch_size=50, flush_interval=0.5)
+
+    log = {"internal_urls": {"https://a.org/"}, "error_urls": set(), "error_reasons": {}}
+    store.save_site(site("https://a.org/"), log)
+    # a domain without its info dictionary raises AttributeError while it is being stored
+    broken = site("https://bad.org/")
+    broken["external_domains"]["cdn.example.org"] = None
+    store.save_site(broken, log)
+    store.save_site(site("https://c.org/"), log)
+    store.close()
+
+    assert not store.writer.is_alive()
+    assert store.completed_sites() == {"https://a.org/", "https://c.org/"}
+    assert "could not store https://bad.org/" in capsys.readouterr().out
@@ -0,0 +1,58 @@
+from dependency_index import DependencyIndex, print_report
+
+
+def domain(nameservers, asns, asns6=()):
+    return {"authoritative_name_servers": {ns: {"ip": "192.0.2.53"} for ns in nameservers},
+            "ip_addresses": {"192.0.2.%d" % asn: {"asn": asn, "as_org": "AS%d-ORG" % asn}
+                             for asn in asns},
+            "ip6_addresses": {"2001:db8::%d" % asn: {"asn": asn, "as_org": "AS%d-ORG" % asn}
+                              for asn in asns6}}
+
+
+SITES = [
+    ("a.json", {"top_url": "https://a.org/", "external_domains": {
+        "cdn.net": domain(["NS1.CDN.NET."], [64500]),
+        "fonts.com": domain(["ns.dns.com."], [64501])}}),
+    ("b.json", {"top_url": "https://b.org/", "external_domains": {
+        "cdn.net": domain(["ns1.cdn.net."], [64500])}}),
+    # an IPv6-only dependency
+    ("c.json", {"top_url": "https://c.org/", "external_domains": {
+        "v6.net": domain(["ns.dns.com."], [], [64502])}}),
+]
+
+
+def site_names(index, site_ids):
+    return sorted(index.sites.names[i] for i in site_ids)
+
+
+def test_build_and_query(tmp_path):
+    index = DependencyIndex.build(SITES)
+
+    assert site_names(index, index.domain_blast_radius("cdn.net")) == ["https://a.org/",
+                                                                       "https://b.org/"]
+    assert index.domain_blast_radius("unknown.net") == set()
+    assert site_names(index, index.ns_blast_radius("ns1.cdn.net.")) == ["https://a.org/",
+                                                                        "https://b.org/"]
+    assert site_names(index, index.ns_blast_radius("ns.dns.com.")) == ["https://a.org/",
+                                                                       "https://c.org/"]
+    assert site_names(index, index.asn_blast_radius(64502)) == ["https://c.org/"]
+
+    path = str(tmp_path / "index.pkl")
+    index.save(path)
+    loaded = DependencyIndex.load(path)
+    assert loaded.sites.names == index.sites.names
+    assert site_names(loaded, loaded.asn_blast_radius(64500)) == ["https://a.org/",
+                                                                  "https://b.org/"]
+
+
+def test_report(capsys):
+    index = DependencyIndex.build(SITES)
+
+    assert index.rank_domains(1) == [("cdn.net", 2)]
+    assert index.rank_nameservers(2) == [("ns.dns.com.", 2, 2), ("ns1.cdn.net.", 2, 1)]
+    assert index.rank_asns(1) == [(64500, "AS64500-ORG", 2, 1)]
+
+    print_report(index, 5)
+    out = capsys.readouterr().out
+    assert "SITES: 3" in out
+    assert "AS64502 AS64502-ORG" in out
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+import export_columnar
+import web_monster_support as wms
+
+SITE = {
+    "top_url": "https://site.org/",
+    "top_domain": "site.org",
+    "ip_addresses": {"203.0.113.5": {"lat": 40.4, "long": -79.9}},
+    "external_resources": {"https://cdn.example.org/app.js": {"count": 3, "type": "script"}},
+    "external_domains": {
+        "cdn.example.org": {
+            "resources": {"total": 3, "script": 3},
+            "authoritative_name_servers": {"ns1.example.org.": {"ip": "192.0.2.53", "asn": 64500,
+                                                                "asn_org": "EXAMPLE"}},
+            "ip_addresses": {"192.0.2.10": {"lat": 51.5, "long": -0.1, "asn": 64500,
+                                            "as_org": "EXAMPLE-CDN"}},
+            "ip6_addresses": {"2001:db8::10": {"lat": 51.5, "long": -0.1, "asn": 64500,
+                                               "as_org": "EXAMPLE-CDN"}}
+        }
+    }
+}
+
+
+def test_flatten_site():
+    rows = export_columnar.flatten_site(0, SITE, "corpus/a.json")
+
+    assert rows["sites"] == [(0, "https://site.org/", "site.org", "corpus/a.json")]
+    assert rows["resources"] == [(0, "https://cdn.example.org/app.js", "cdn.example.org",
+                                  "script", 3)]
+    assert [row[:3] for row in rows["ips"]] == [(0, None, "203.0.113.5"),
+                                                (0, "cdn.example.org", "192.0.2.10"),
+                                                (0, "cdn.example.org", "2001:db8::10")]
+    assert rows["nameservers"] == [(0, "cdn.example.org", "ns1.example.org.", "192.0.2.53", None,
+                                    None, 64500, "EXAMPLE")]
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_export_round_trip(tmp_path, fmt):
+    pa = pytest.importorskip("pyarrow")
+
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    for i in range(3):
+        site = dict(SITE, top_url="https://site%d.org/" % i)
+        (corpus / ("%d.json" % i)).write_text(json.dumps(site))
+
+    output_dir = tmp_path / "columnar"
+    counts = export_columnar.export(wms.iter_output_files([str(corpus)]), str(output_dir), fmt,
+                                    batch_size=2)
+    assert counts == {"sites": 3, "domains": 3, "resources": 3, "ips": 9, "nameservers": 3}
+
+    def read(table):
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            return pq.read_table(str(output_dir / (table + ".parquet")))
+        import pyarrow.ipc
+        with pa.OSFile(str(output_dir / (table + ".arrows"))) as f:
+            return pyarrow.ipc.open_stream(f).read_all()
+
+    sites = read("sites")
+    assert sites.schema == export_columnar.arrow_schema("sites")
+    assert sorted(sites.column("top_url").to_pylist()) == ["https://site%d.org/" % i
+                                                           for i in range(3)]
+
+    ips = read("ips").to_pylist()
+    assert sorted(row["ip"] for row in ips) == sorted(["203.0.113.5", "192.0.2.10",
+                                                        "2001:db8::10"] * 3)
+    assert {row["asn"] for row in ips if row["domain"] is not None} == {64500}
@@ -0,0 +1,98 @@
+import socket
+import threading
+from urllib.error import HTTPError, URLError
+
+import pytest
+
+import globals
+import web_monster
+
+
+@pytest.fixture
+def long_header_server():
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(8)
+
+    def serve():
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            with conn:
+                conn.recv(65536)
+                conn.sendall(b"HTTP/1.1 200 OK\r\nX-Padding: " + b"a" * 70000 + b"\r\n\r\n")
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield "http://127.0.0.1:%d/" % listener.getsockname()[1]
+    listener.close()
+
+
+def test_malformed_responses_are_recorded_not_raised(long_header_server):
+    actual_url, page_source, error = web_monster.get_webpage_source(long_header_server)
+
+    assert actual_url is None and page_source is None
+    assert error.startswith("LineTooLong")
+
+
+def test_only_timeouts_resets_and_overload_are_transient():
+    assert web_monster.is_transient_error(URLError(socket.timeout("timed out")))
+    assert web_monster.is_transient_error(URLError(ConnectionResetError()))
+    assert web_monster.is_transient_error(HTTPError("http://a/", 503, "", {}, None))
+    assert not web_monster.is_transient_error(HTTPError("http://a/", 404, "", {}, None))
+    assert not web_monster.is_transient_error(URLError(socket.gaierror(-2, "Name or service not known")))
+    assert not web_monster.is_transient_error(URLError("unknown url type: ftp"))
+
+
+def test_negative_retries_still_fetch_once(monkeypatch):
+    globals.init()
+    monkeypatch.setattr(globals, "RETRIES", -1)
+    calls = []
+
+    def fetch_once(url):
+        calls.append(url)
+        raise URLError(socket.timeout("timed out"))
+
+    monkeypatch.setattr(web_monster, "fetch_once", fetch_once)
+    actual_url, page_source, error = web_monster.get_webpage_source("http://retries.invalid/")
+
+    assert calls == ["http://retries.invalid/"]
+    assert error.startswith("URLError")
+
+
+def test_connection_failures_open_the_breaker_without_retries(monkeypatch):
+    globals.init()
+    monkeypatch.setattr(globals, "BREAKER_THRESHOLD", 2)
+    monkeypatch.setattr(web_monster, "HOST_BREAKERS", {})
+    calls = []
+
+    def fetch_once(url):
+        calls.append(url)
+        raise URLError(ConnectionRefusedError(111, "Connection refused"))
+
+    monkeypatch.setattr(web_monster, "fetch_once", fetch_once)
+    for page in ("a", "b", "c"):
+        web_monster.get_webpage_source("http://refused.invalid/" + page)
+
+    assert calls == ["http://refused.invalid/a", "http://refused.invalid/b"]
+    assert web_monster.breaker_open("refused.invalid")
+
+
+def test_http_error_status_resets_the_breaker(monkeypatch):
+    globals.init()
+    monkeypatch.setattr(globals, "BREAKER_THRESHOLD", 2)
+    monkeypatch.setattr(web_monster, "HOST_BREAKERS", {})
+    errors = [URLError(socket.gaierror(-2, "Name or service not known")),
+              HTTPError("http://flaky.invalid/", 404, "Not Found", {}, None),
+              URLError(socket.gaierror(-2, "Name or service not known"))]
+
+    def fetch_once(url):
+        raise errors.pop(0)
+
+    monkeypatch.setattr(web_monster, "fetch_once", fetch_once)
+    for _ in range(3):
+        web_monster.get_webpage_source("http://flaky.invalid/")
+
+    assert not web_monster.breaker_open("flaky.invalid")
+    assert web_monster.HOST_BREAKERS["flaky.invalid"]["failures"] == 1
@@ -0,0 +1,84 @@
+import pytest
+
+import globals
+import web_monster
+import web_monster_support as wms
+
+TOP_URL = "http://example.com/"
+
+
+@pytest.fixture
+def top_dict(monkeypatch):
+    globals.init()
+    monkeypatch.setattr(globals, "TOP_URLS", {})
+    monkeypatch.setattr(globals, "TOP_LOGS", {})
+    monkeypatch.setattr(globals, "ROBOTS", False)
+    monkeypatch.setattr(globals, "DEPTH_WEIGHT", 0.1)
+    wms.initialize_dicts([TOP_URL])
+    return globals.TOP_URLS[wms.cleanup_url(TOP_URL)]
+
+
+@pytest.fixture
+def fetched(monkeypatch):
+    # stands in for web_monster.fetch_url: records the page as crawled without any network access
+    order = []
+
+    def fetch_url(url, top_dict):
+        top_log = globals.TOP_LOGS[top_dict["top_url"]]
+        order.append(url)
+        top_log["internal_urls"].add(url)
+        section, parent, _ = web_monster.url_path_keys(url)
+        top_log["path_counts"][("section", section)] += 1
+        top_log["path_counts"][("parent", parent)] += 1
+
+    monkeypatch.setattr(web_monster, "fetch_url", fetch_url)
+    return order
+
+
+def test_score_prefers_unseen_sections_and_shallow_pages(top_dict):
+    top_log = globals.TOP_LOGS[top_dict["top_url"]]
+    top_log["path_counts"][("section", "news")] += 5
+    top_log["path_counts"][("parent", "news")] += 5
+
+    unseen = web_monster.score_url("http://example.com/sports/a", top_log)
+    crawled = web_monster.score_url("http://example.com/news/a", top_log)
+    deep = web_monster.score_url("http://example.com/sports/a/b/c", top_log)
+
+    assert unseen > crawled
+    assert unseen > deep
+
+
+def test_frontier_rescores_urls_from_crawled_sections(top_dict, fetched):
+    for path in ("news/a", "news/b", "about/x"):
+        web_monster.enqueue_url("http://example.com/" + path, top_dict)
+
+    web_monster.crawl_frontier(top_dict)
+
+    # news/b was queued ahead of about/x with the same score, but once news/a is crawled its score
+    # drops and about/x goes first
+    assert [url.split("example.com/")[1] for url in fetched] == ["news/a", "about/x", "news/b"]
+
+
+def test_frontier_stops_at_max_pages(top_dict, fetched, monkeypatch):
+    monkeypatch.setattr(globals, "MAX_PAGES", 2)
+    for path in ("a", "b", "c", "d"):
+        web_monster.enqueue_url("http://example.com/" + path, top_dict)
+
+    web_monster.crawl_frontier(top_dict)
+
+    assert len(fetched) == 2
+    assert len(globals.TOP_LOGS[top_dict["top_url"]]["frontier"]) == 2
+
+
+def test_budget_spent_after_patience_stale_pages(top_dict, monkeypatch):
+    monkeypatch.setattr(globals, "MAX_PAGES", 100)
+    monkeypatch.setattr(globals, "PATIENCE", 3)
+    top_log = globals.TOP_LOGS[top_dict["top_url"]]
+
+    top_log["stale_pages"] = 2
+    assert not web_monster.budget_spent(top_log)
+    top_log["stale_pages"] = 3
+    assert web_monster.budget_spent(top_log)
+
+    monkeypatch.setattr(globals, "PATIENCE", 0)
+    assert not web_monster.budget_spent(top_log)
@@ -0,0 +1,118 @@
+import pytest
+
+import web_monster_support as wms
+
+
+def test_iter_input_streams_cleaned_unique_urls(tmp_path):
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("https://www.cmu.edu/ini/\n\nhttps://cmu.edu/ini/\n  https://pgh2o.com  \n")
+
+    assert list(wms.iter_input(str(input_file))) == ["https://cmu.edu/ini/", "https://pgh2o.com/"]
+
+
+def test_interleave_by_host_spreads_registrable_domains():
+    urls = ["https://a.com/", "https://a.com/x/", "https://news.a.com/", "https://b.org/",
+            "https://bbc.co.uk/", "https://news.bbc.co.uk/"]
+
+    assert list(wms.interleave_by_host(urls, window=10)) == [
+        "https://a.com/", "https://b.org/", "https://bbc.co.uk/",
+        "https://a.com/x/", "https://news.bbc.co.uk/", "https://news.a.com/"]
+
+
+def test_interleave_by_host_keeps_every_url_with_a_small_window():
+    urls = ["https://site%d.com/" % (i % 3) + str(i) + "/" for i in range(20)]
+
+    assert sorted(wms.interleave_by_host(iter(urls), window=2)) == sorted(urls)
+
+
+def test_dynamic_engine_streams_and_releases_sites(tmp_path, monkeypatch):
+    import argparse
+    import globals
+    import dynamic_reading
+
+    class FakeDriver:
+        def get(self, url):
+            # every site is allocated only once the browser gets to it
+            assert list(globals.TOP_URLS) == [url]
+
+        def get_log(self, kind):
+            return []
+
+        def quit(self):
+            pass
+
+    globals.init()
+    monkeypatch.setattr(globals, "TOP_URLS", {})
+    monkeypatch.setattr(globals, "TOP_LOGS", {})
+    monkeypatch.setattr(dynamic_reading, "setup_driver", lambda *args: FakeDriver())
+    monkeypatch.setattr(dynamic_reading.wmi, "set_top_ip4_info", lambda url, top_dict: None)
+
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("https://a.com/\nhttps://b.org/\n")
+    args = argparse.Namespace(input_file=str(input_file), output_dir=str(tmp_path / "out"),
+                              chrome_driver=None, browser_cache_dir=None, browser_cache_size=None)
+    dynamic_reading.run(args)
+
+    assert globals.TOP_URLS == {} and globals.TOP_LOGS == {}
+    assert len(list((tmp_path / "out").glob("*.json"))) == 2
+
+
+def test_cache_stats_counts_each_cached_request_once():
+    import dynamic_reading
+
+    events = [
+        {"method": "Network.responseReceived", "params": {"requestId": "1", "response": {}}},
+        {"method": "Network.responseReceived",
+         "params": {"requestId": "2", "response": {"fromDiskCache": True}}},
+        {"method": "Network.requestServedFromCache", "params": {"requestId": "2"}},
+        {"method": "Network.responseReceived",
+         "params": {"requestId": "3", "response": {"fromPrefetchCache": True}}},
+        {"method": "Network.requestWillBeSent", "params": {"requestId": "4"}},
+    ]
+
+    assert dynamic_reading.cache_stats(events) == (3, 2)
+    assert dynamic_reading.hit_rate(3, 2) == pytest.approx(66.67, abs=0.01)
+    assert dynamic_reading.hit_rate(0, 0) == 0.0
+
+
+def test_dynamic_engine_reports_cache_hit_rate(tmp_path, monkeypatch, capsys):
+    import argparse
+    import json
+    import globals
+    import dynamic_reading
+
+    def entry(method, request_id, response=None):
+        params = {"requestId": request_id}
+        if response is not None:
+            params["response"] = response
+        return {"message": json.dumps({"message": {"method": method, "params": params}})}
+
+    class FakeDriver:
+        def get(self, url):
+            pass
+
+        def get_log(self, kind):
+            return [entry("Network.responseReceived", "1", {"url": "https://a.com/"}),
+                    entry("Network.responseReceived", "2", {"url": "https://cdn.example.org/app.js",
+                                                            "fromDiskCache": True})]
+
+        def quit(self):
+            pass
+
+    globals.init()
+    monkeypatch.setattr(globals, "TOP_URLS", {})
+    monkeypatch.setattr(globals, "TOP_LOGS", {})
+    monkeypatch.setattr(dynamic_reading, "CACHE_TOTALS", {"responses": 0, "cached": 0})
+    monkeypatch.setattr(dynamic_reading, "setup_driver", lambda *args: FakeDriver())
+    monkeypatch.setattr(dynamic_reading, "evaluate_responses", lambda *args: None)
+    monkeypatch.setattr(dynamic_reading.wmi, "set_top_ip4_info", lambda url, top_dict: None)
+
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("https://a.com/\nhttps://b.org/\n")
+    args = argparse.Namespace(input_file=str(input_file), output_dir=str(tmp_path / "out"),
+                              chrome_driver=None, browser_cache_dir=None, browser_cache_size=None)
+    dynamic_reading.run(args)
+
+    out = capsys.readouterr().out
+    assert out.count("CACHE: 1/2 responses cached (50.0%)") == 2
+    assert "CACHE TOTAL: 2/4 responses cached (50.0%)" in out
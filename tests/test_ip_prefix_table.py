@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+import globals
+import ip_prefix_table
+
+IPS = ["127.0.0.1", "127.255.255.255", "192.0.2.0", "192.0.2.77", "198.51.100.255", "10.0.0.1",
+       "0.0.0.0", "255.255.255.255"]
+
+
+@pytest.fixture
+def table_dir(mmdb_files, tmp_path, monkeypatch):
+    pytest.importorskip("numpy")
+    pytest.importorskip("maxminddb")
+
+    globals.init()
+    monkeypatch.setattr(globals, "READER_PATHS", dict(mmdb_files))
+    directory = str(tmp_path / "prefix_table")
+    assert ip_prefix_table.build(directory) == (3, 3)
+    return directory
+
+
+def mmdb_lookups(mmdb_files, ip_address):
+    import geoip2.database
+    import geoip2.errors
+
+    with geoip2.database.Reader(mmdb_files["GEO_LIB"]) as city, \
+            geoip2.database.Reader(mmdb_files["ASN_LIB"]) as asn:
+        try:
+            location = city.city(ip_address).location
+            geo = location.latitude, location.longitude
+        except geoip2.errors.AddressNotFoundError:
+            geo = None, None
+        try:
+            record = asn.asn(ip_address)
+            as_info = record.autonomous_system_number, record.autonomous_system_organization
+        except geoip2.errors.AddressNotFoundError:
+            as_info = None, None
+    return geo, as_info
+
+
+def test_lookups_match_the_mmdb_readers(table_dir, mmdb_files):
+    pytest.importorskip("geoip2")
+    table = ip_prefix_table.load(table_dir)
+
+    expected = [mmdb_lookups(mmdb_files, ip) for ip in IPS]
+    assert [(table.geo(ip), table.asn(ip)) for ip in IPS] == expected
+    assert list(zip(table.lookup_geo(IPS), table.lookup_asn(IPS))) == expected
+    assert table.geo("2001:db8::1") is None and table.asn("2001:db8::1") is None
+
+
+def test_check_detects_stale_tables(table_dir, mmdb_files):
+    assert ip_prefix_table.is_fresh(table_dir)
+
+    stat = os.stat(mmdb_files["ASN_LIB"])
+    os.utime(mmdb_files["ASN_LIB"], (stat.st_atime, stat.st_mtime + 60))
+    try:
+        assert not ip_prefix_table.is_fresh(table_dir)
+        assert ip_prefix_table.load(table_dir) is None
+    finally:
+        os.utime(mmdb_files["ASN_LIB"], (stat.st_atime, stat.st_mtime))
+
+    assert not ip_prefix_table.is_fresh(str(os.path.dirname(table_dir)))
@@ -0,0 +1,86 @@
+import os
+from collections import Counter
+
+import pytest
+
+import link_extractor
+
+PAGES = {
+    "root.org": ['https://www.a.com/x', 'https://a.com/y', 'https://b.net/', '/local', 'https://root.org/'],
+    "a.com": ['https://c.io/', 'https://b.net/'],
+    "b.net": ['https://a.com/'],
+    "c.io": [],
+}
+
+
+@pytest.fixture
+def fake_pages(monkeypatch):
+    pytest.importorskip("requests")
+    from lxml import html
+
+    fetched = []
+
+    def getPage(url, session):
+        fetched.append(url)
+        links = PAGES.get(url)
+        if links is None:
+            return None
+        return html.fromstring("<html><body>%s</body></html>" %
+                               "".join('<a href="%s">x</a>' % link for link in links))
+
+    monkeypatch.setattr(link_extractor, "getPage", getPage)
+    return fetched
+
+
+def test_build_and_render_graph(fake_pages):
+    graph, parents = link_extractor.buildGraph("root.org", 2, 2)
+
+    assert graph["root.org"] == Counter({"a.com": 2, "b.net": 1})
+    assert parents == {"root.org": None, "a.com": "root.org", "b.net": "root.org", "c.io": "a.com"}
+    assert sorted(fake_pages) == ["a.com", "b.net", "root.org"]
+
+    assert list(link_extractor.renderGraph(graph, parents, "root.org")) == [
+        "root.org",
+        "├── a.com (2)",
+        "│   ├── c.io (1)",
+        "│   └── b.net (1)",
+        "└── b.net (1)",
+        "    └── a.com (1)",
+    ]
+
+
+def test_cache_skips_fetches_and_survives_restarts(fake_pages, tmp_path):
+    directory = str(tmp_path / "links")
+    link_extractor.buildGraph("root.org", 2, 2, link_extractor.LinkCache(16, directory))
+    fake_pages.clear()
+
+    # a fresh cache over the same directory, as in a later run
+    cache = link_extractor.LinkCache(16, directory)
+    graph, _ = link_extractor.buildGraph("root.org", 2, 2, cache)
+
+    assert fake_pages == []
+    assert graph["a.com"] == Counter({"c.io": 1, "b.net": 1})
+    assert cache.summary() == "LINK CACHE: 3 hits, 0 misses (100.0% hit rate)"
+    assert not [name for name in os.listdir(directory) if name.endswith(".tmp")]
+
+
+def test_unreadable_cache_entry_is_a_miss(fake_pages, tmp_path):
+    cache = link_extractor.LinkCache(16, str(tmp_path))
+    with open(cache.path("a.com"), 'w') as f:
+        f.write('{"c.io": 1, "b.n')
+
+    graph, _ = link_extractor.buildGraph("root.org", 2, 2, cache)
+
+    assert "a.com" in fake_pages
+    assert graph["a.com"] == Counter({"c.io": 1, "b.net": 1})
+    assert link_extractor.LinkCache(16, str(tmp_path)).get("a.com") == graph["a.com"]
+
+
+def test_lru_evicts_the_least_recently_used():
+    cache = link_extractor.LinkCache(2)
+    cache.put("a.com", Counter())
+    cache.put("b.net", Counter())
+    cache.get("a.com")
+    cache.put("c.io", Counter())
+
+    assert list(cache.entries) == ["a.com", "c.io"]
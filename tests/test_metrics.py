@@ -0,0 +1,57 @@
+import urllib.request
+
+import web_monster_metrics as wmm
+from test_crawl_golden import crawl
+
+
+def scrape(server):
+    url = "http://127.0.0.1:%d/metrics" % server.server_address[1]
+    with urllib.request.urlopen(url, timeout=5) as response:
+        assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        body = response.read().decode("utf-8")
+
+    samples = {}
+    for line in body.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_histogram_buckets_are_cumulative():
+    wmm.observe("test_seconds", 0.003)
+    wmm.observe("test_seconds", 0.3)
+    histogram = wmm.HISTOGRAMS[("test_seconds", ())]
+
+    assert histogram[wmm.BUCKETS.index(0.005)] == 1
+    assert histogram[wmm.BUCKETS.index(0.5)] == 2
+    assert histogram[-1] == 2
+    wmm.HISTOGRAMS.pop(("test_seconds", ()))
+
+
+def test_metrics_endpoint_during_crawl(crawl_env, http_site, tmp_path):
+    server = wmm.start_server(0)
+    try:
+        before = scrape(server)
+        crawl(http_site, tmp_path, "serial")
+        after = scrape(server)
+    finally:
+        server.shutdown()
+
+    def delta(name):
+        return after.get(name, 0) - before.get(name, 0)
+
+    assert delta("crawl_sites_total") == 2
+    assert delta("crawl_pages_total") > 0
+    assert after["crawl_sites_in_flight"] == 0
+    assert not any(name.startswith("crawl_frontier_depth") for name in after)
+    assert delta('crawl_fetch_seconds_count') >= delta("crawl_pages_total")
+    assert delta('crawl_output_seconds_count') == 2
+    # one observation per NS lookup, however many zone levels it walked
+    assert delta('crawl_dns_seconds_count{query="ns"}') == \
+        delta('crawl_cache_requests_total{cache="ns",result="miss"}') > 0
+    assert after['crawl_geoip_cache_requests_total{db="city",result="hit"}'] > 0
+    assert not any(name.startswith("crawl_cache_requests_total{cache=\"geoip\"") for name in after)
+    # both sites use the same external domains, so the second one is served from the NS cache
+    assert delta('crawl_cache_requests_total{cache="ns",result="hit"}') > 0
+    assert after["process_resident_memory_bytes"] > 0
@@ -0,0 +1,83 @@
+import gzip
+import io
+
+import pytest
+
+import globals
+import web_monster
+import web_monster_robots as wmr
+
+ROBOTS = b"""User-agent: *
+Allow: /private/press/
+Disallow: /private/
+Sitemap: http://example.com/sitemap_index.xml
+"""
+
+SITEMAP_INDEX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>http://example.com/sitemap-news.xml.gz</loc></sitemap>
+</sitemapindex>
+"""
+
+SITEMAP = b"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <url><loc>https://example.com/news/a/</loc></url>
+  <url><loc>http://www.example.com/news/b/</loc></url>
+  <url><loc>http://other.example.org/news/c/</loc></url>
+</urlset>
+"""
+
+
+@pytest.fixture
+def responses(monkeypatch):
+    # url -> (status, body) served in place of the network
+    served = {}
+    monkeypatch.setattr(wmr, "ROBOTS_CACHE", {})
+    monkeypatch.setattr(wmr, "fetch", lambda url: served.get(url, (404, None)))
+    return served
+
+
+def test_robots_rules(responses):
+    responses["http://example.com/robots.txt"] = (200, ROBOTS)
+
+    assert wmr.can_fetch("http://example.com/news/")
+    assert not wmr.can_fetch("http://example.com/private/report/")
+    assert wmr.can_fetch("http://example.com/private/press/release/")
+
+
+@pytest.mark.parametrize("status, allowed", [(404, True), (403, True), (503, False), (None, False)])
+def test_missing_robots(responses, status, allowed):
+    responses["http://example.com/robots.txt"] = (status, None)
+
+    assert wmr.can_fetch("http://example.com/news/") == allowed
+
+
+def test_open_breaker_disallows_everything(monkeypatch):
+    globals.init()
+    monkeypatch.setattr(wmr, "ROBOTS_CACHE", {})
+    monkeypatch.setattr(web_monster, "HOST_BREAKERS",
+                        {"down.invalid": {"failures": 5, "open_until": float("inf")}})
+
+    assert not wmr.can_fetch("http://down.invalid/news/")
+
+
+def test_gzipped_sitemap_is_streamed():
+    entries = list(wmr.iter_sitemap(io.BytesIO(gzip.compress(SITEMAP))))
+
+    assert entries == [("url", "https://example.com/news/a/"), ("url", "http://www.example.com/news/b/"),
+                       ("url", "http://other.example.org/news/c/")]
+
+
+def test_sitemap_index_seeds_pages_under_top_url_ignoring_scheme(responses, monkeypatch):
+    globals.init()
+    monkeypatch.setattr(globals, "SITEMAP_MAX_FILES", 10)
+    monkeypatch.setattr(globals, "SITEMAP_MAX_URLS", 100)
+    responses["http://example.com/robots.txt"] = (200, ROBOTS)
+    responses["http://example.com/sitemap_index.xml"] = (200, SITEMAP_INDEX)
+    responses["http://example.com/sitemap-news.xml.gz"] = (200, gzip.compress(SITEMAP))
+
+    seeded = []
+    count = wmr.seed_from_sitemaps("http://example.com/", seeded.append)
+
+    assert count == 2
+    assert seeded == ["https://example.com/news/a/", "http://www.example.com/news/b/"]
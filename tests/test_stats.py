@@ -0,0 +1,75 @@
+import json
+import time
+
+import web_monster_stats as wms_stats
+
+
+def site_summary(domains, asns=None, resources=1):
+    return {
+        "top_url": "http://example.com/",
+        "domains": domains,
+        "resources": resources,
+        "tag_counts": {"script": len(domains)},
+        "ns_providers": ["ns.example"],
+        "asns": asns or {},
+        "geo_cells": ["40,-80"]
+    }
+
+
+def test_top_k_counter_keeps_the_most_frequent_half():
+    counter = wms_stats.TopKCounter(capacity=4)
+    counter.update(["a", "a", "a", "b", "b", "c", "d"])
+    assert len(counter.counts) == 4
+
+    counter.update(["e"])
+    assert dict(counter.counts) == {"a": 3, "b": 2}
+    assert counter.top(1) == [("a", 3)]
+
+
+def test_histogram_power_of_two_buckets():
+    histogram = wms_stats.Histogram()
+    for value in (0, 1, 2, 3, 8, 15, 16):
+        histogram.add(value)
+
+    assert histogram.to_dict() == {"0": 1, "1": 1, "2": 2, "8": 2, "16": 1}
+
+
+def test_aggregator_snapshot(tmp_path):
+    aggregator = wms_stats.RunningAggregator(str(tmp_path / "stats.json"), flush_interval=60)
+    try:
+        aggregator.add(site_summary(["a.com", "b.com"], {15169: "GOOGLE"}, resources=3))
+        aggregator.add(site_summary(["a.com"], {15169: "GOOGLE"}))
+        snapshot = aggregator.snapshot()
+    finally:
+        aggregator.close()
+
+    assert snapshot["sites"] == 2
+    assert snapshot["top_domains"] == [("a.com", 2), ("b.com", 1)]
+    assert snapshot["top_asns"] == [(15169, "GOOGLE", 2)]
+    assert snapshot["top_geo_cells"] == [("40,-80", 2)]
+    assert snapshot["resources_by_tag"] == {"script": 3}
+    assert snapshot["resources_per_site"] == {"1": 1, "2": 1}
+
+
+def test_aggregator_flushes_on_timer_without_sites(tmp_path):
+    output_file = tmp_path / "stats" / "stats.json"
+    aggregator = wms_stats.RunningAggregator(str(output_file), flush_interval=0.05)
+    try:
+        deadline = time.time() + 5
+        while not output_file.exists() and time.time() < deadline:
+            time.sleep(0.01)
+        assert json.loads(output_file.read_text())["sites"] == 0
+    finally:
+        aggregator.close()
+    assert not (tmp_path / "stats" / "stats.json.tmp").exists()
+
+
+def test_aggregator_close_writes_final_snapshot(tmp_path):
+    output_file = tmp_path / "stats.json"
+    aggregator = wms_stats.RunningAggregator(str(output_file), flush_interval=3600)
+    aggregator.add(site_summary(["a.com"]))
+    assert not output_file.exists()
+
+    aggregator.close()
+    assert json.loads(output_file.read_text())["sites"] == 1
+    assert not aggregator.timer.is_alive()
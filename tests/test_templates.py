@@ -0,0 +1,57 @@
+import pytest
+
+import globals
+import web_monster
+import web_monster_support as wms
+
+
+@pytest.mark.parametrize("url, template", [
+    ("http://a.com/", "/"),
+    ("http://a.com/about", "/about"),
+    ("http://a.com/item/12345", "/item/{n}"),
+    ("http://a.com/2024/05/story", "/{n}/{n}/story"),
+    ("http://a.com/p/3f2a9c1e-77aa-4b1e", "/p/{id}"),
+    ("http://a.com/p/DEADBEEF01", "/p/{id}"),
+    ("http://a.com/u/user12345", "/u/{id}"),
+    ("http://a.com/v2/api", "/v2/api"),
+    ("http://a.com/blog/this-is-a-long-post/", "/blog/{slug}/"),
+    ("http://a.com/s?q=1&page=2&q=3", "/s?page=&q="),
+    ("http://a.com/s?page=2&q=", "/s?page=&q="),
+])
+def test_url_template(url, template):
+    assert wms.url_template(url) == template
+
+
+def test_template_keys_wildcard_the_last_segment():
+    assert web_monster.template_keys("http://a.com/tag/pirates/") == ["/tag/pirates/", "/tag/{*}"]
+    assert web_monster.template_keys("http://a.com/about") == ["/about"]
+
+
+def test_template_saturates_after_repeated_fingerprints(monkeypatch):
+    monkeypatch.setattr(globals, "TEMPLATE_LIMIT", 2)
+    top_log = {"templates": {}}
+    resources = {("script", "cdn.example")}
+
+    web_monster.record_template("http://a.com/item/1", resources, top_log)
+    web_monster.record_template("http://a.com/item/2", resources, top_log)
+    assert not web_monster.template_saturated("http://a.com/item/3", top_log)
+
+    web_monster.record_template("http://a.com/item/3", resources, top_log)
+    assert web_monster.template_saturated("http://a.com/item/4", top_log)
+    assert not web_monster.template_saturated("http://a.com/about", top_log)
+
+    monkeypatch.setattr(globals, "TEMPLATE_LIMIT", 0)
+    assert not web_monster.template_saturated("http://a.com/item/4", top_log)
+
+
+def test_new_fingerprint_resets_the_repeat_count(monkeypatch):
+    monkeypatch.setattr(globals, "TEMPLATE_LIMIT", 2)
+    top_log = {"templates": {}}
+
+    web_monster.record_template("http://a.com/item/1", {("script", "a.example")}, top_log)
+    web_monster.record_template("http://a.com/item/2", {("script", "a.example")}, top_log)
+    web_monster.record_template("http://a.com/item/3", {("img", "b.example")}, top_log)
+    web_monster.record_template("http://a.com/item/4", {("script", "a.example")}, top_log)
+
+    assert top_log["templates"]["/item/{n}"]["repeats"] == 1
+    assert not web_monster.template_saturated("http://a.com/item/5", top_log)
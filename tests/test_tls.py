@@ -0,0 +1,144 @@
+import shutil
+import ssl
+import subprocess
+import sys
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import globals
+import web_monster_tls as wmt
+
+
+@pytest.fixture
+def https_server(tmp_path, monkeypatch):
+    if shutil.which("openssl") is None:
+        pytest.skip("openssl is needed to make a test certificate")
+
+    cert, key = str(tmp_path / "cert.pem"), str(tmp_path / "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "30",
+                    "-keyout", key, "-out", cert, "-subj", "/O=Test CA Org/CN=Test Issuer",
+                    "-addext", "subjectAltName=DNS:localhost,DNS:www.localhost"],
+                   check=True, capture_output=True)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = b"<html><body>hello</body></html>"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    globals.init()
+    monkeypatch.setattr(globals, "TLS_CACHE", {})
+    monkeypatch.setattr(wmt, "SESSIONS", {})
+    yield server.server_address[1]
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_tls_info_is_captured_once(https_server):
+    pytest.importorskip("cryptography")
+    info = wmt.get_tls_info("localhost", https_server, "127.0.0.1")
+
+    assert info["issuer"] == "Test Issuer"
+    assert info["issuer_org"] == "Test CA Org"
+    assert info["san"] == ["localhost", "www.localhost"]
+    assert info["expires"].endswith("Z")
+    assert info["protocol"].startswith("TLS")
+    assert info["cipher"]
+    assert wmt.get_tls_info("localhost", https_server, "127.0.0.1") is info
+
+
+def test_page_fetches_resume_the_hosts_session(https_server):
+    import web_monster
+    import web_monster_metrics as wmm
+
+    resumed_key = ("crawl_tls_handshakes_total", (("resumed", "true"),))
+    resumed = wmm.VALUES.get(resumed_key, 0)
+
+    url = "https://localhost:%d/" % https_server
+    for _ in range(3):
+        actual_url, page_source = web_monster.fetch_once(url)
+        assert page_source == b"<html><body>hello</body></html>"
+
+    # the first fetch does a full handshake, the others resume its session
+    assert wmm.VALUES.get(resumed_key, 0) - resumed == 2
+    assert wmt.session_key("localhost", https_server) in wmt.SESSIONS
+
+
+def test_external_domain_netloc_port_is_not_part_of_the_host(https_server):
+    pytest.importorskip("cryptography")
+    top_dict = {"external_domains": {"localhost:%d" % https_server: {
+        "ip_addresses": {"127.0.0.1": {}}}}}
+
+    wmt.set_tls_info("localhost:%d" % https_server, top_dict,
+                     "https://localhost:%d/app.js" % https_server)
+
+    assert top_dict["external_domains"]["localhost:%d" % https_server]["tls"]["issuer"] == \
+        "Test Issuer"
+    assert list(globals.TLS_CACHE) == ["localhost:%d" % https_server]
+
+
+def test_tunnelled_sessions_are_keyed_on_the_tunnelled_host(https_server, monkeypatch):
+    # stands in for the proxy: the "tunnel" is a direct connection to the server
+    def connect(conn):
+        conn.sock = wmt.socket.create_connection(("127.0.0.1", https_server))
+
+    monkeypatch.setattr(wmt.http.client.HTTPConnection, "connect", connect)
+    conn = wmt.ResumingHTTPSConnection("proxy.invalid", 3128, context=wmt.CONTEXT)
+    conn.set_tunnel("localhost", https_server)
+    conn.connect()
+    conn.request("GET", "/")
+    conn.getresponse().read()
+    conn.close()
+
+    assert list(wmt.SESSIONS) == ["localhost:%d" % https_server]
+
+
+def test_certificates_need_cryptography(monkeypatch, capsys):
+    monkeypatch.setitem(sys.modules, "cryptography", None)
+    monkeypatch.setattr(wmt, "DECODE_WARNED", False)
+
+    for _ in range(2):
+        assert wmt.decode_cert(b"not a certificate") == {
+            "issuer": None, "issuer_org": None, "subject": None, "san": [], "expires": None}
+    assert capsys.readouterr().out.count("WARNING (TLS)") == 1
+
+
+def test_probe_session_is_resumed_by_the_page_fetch(https_server):
+    import web_monster
+    import web_monster_metrics as wmm
+
+    resumed_key = ("crawl_tls_handshakes_total", (("resumed", "true"),))
+    wmt.handshake("localhost", https_server, "127.0.0.1")
+    session = wmt.SESSIONS[wmt.session_key("localhost", https_server)]
+    assert session.has_ticket
+
+    resumed = wmm.VALUES.get(resumed_key, 0)
+    web_monster.fetch_once("https://localhost:%d/" % https_server)
+    assert wmm.VALUES.get(resumed_key, 0) - resumed == 1
+
+
+def test_sessions_without_a_ticket_are_not_stored(monkeypatch):
+    class Session:
+        has_ticket = False
+
+    class Socket:
+        session = Session()
+
+    monkeypatch.setattr(wmt, "SESSIONS", {})
+    wmt.remember_session("localhost", 443, Socket())
+    assert wmt.SESSIONS == {}
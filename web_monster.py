@@ -4,88 +4,145 @@ REFERENCES:
     https://stackoverflow.com/questions/31666584/beutifulsoup-to-extract-all-external-resources-from-html
 '''
 
-import json
-import os
-import hashlib
-import ssl
-import argparse
 import random
+import heapq
+import socket
+import threading
+import time
 import globals
 import web_monster_support as wms
 import web_monster_ip as wmi
+import web_monster_stats as wms_stats
+import web_monster_robots as wmr
+import web_monster_metrics as wmm
+import web_monster_tls as wmt
 
 # URL / HTML Parsing Imports
-from urllib.error import HTTPError
+from urllib.error import HTTPError, URLError
 import urllib.request
 from urllib.parse import urlparse
-from bs4 import BeautifulSoup
-from http.client import InvalidURL
+from http.client import HTTPException, IncompleteRead
 
 # Threading / Concurrency Imports
 from concurrent import futures
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 globals.init()
 
+# host -> {"failures": consecutive failed fetches, "open_until": monotonic time}
+HOST_BREAKERS = {}
+BREAKER_LOCK = threading.Lock()
+
 
 # ==================================================================================================
-# Takes in an input file path, where the input file is a list of newline separated top level URLs
-# to crawl. Starts filling out the TOP_URLS global dictionary.
+# Per host circuit breaker. After BREAKER_THRESHOLD failed fetches in a row a host is not contacted
+# again for BREAKER_COOLDOWN seconds
+
+def breaker_open(host):
+    with BREAKER_LOCK:
+        breaker = HOST_BREAKERS.get(host)
+        return breaker is not None and breaker["open_until"] > time.monotonic()
 
-def parse_input(input_file):
-    with open(input_file, 'r') as f:
-        top_urls = f.readlines()
 
-    # get rid of newlines, etc
-    top_urls = [x.strip() for x in top_urls]
+def breaker_record(host, success):
+    with BREAKER_LOCK:
+        if success:
+            HOST_BREAKERS.pop(host, None)
+            return
 
-    wms.initialize_dicts(top_urls)
+        breaker = HOST_BREAKERS.setdefault(host, {"failures": 0, "open_until": 0})
+        breaker["failures"] += 1
+        if breaker["failures"] >= globals.BREAKER_THRESHOLD:
+            print("ERROR (BREAKER): too many failures, pausing host " + host)
+            breaker["open_until"] = time.monotonic() + globals.BREAKER_COOLDOWN
 
 
 # ==================================================================================================
-# Outputs a JSON file for each website crawled
+# Returns true if a failed fetch is worth retrying (timeouts, resets, overloaded servers). urllib
+# wraps errors raised while connecting in a URLError, whose reason is the original error
+
+def is_transient_error(e):
+    if isinstance(e, HTTPError):
+        return e.code in (429, 500, 502, 503, 504)
 
-def output_to_json(output_directory, url):
-    # make filename hash of the top url because linux doesn't like :./ in the file name
-    hash_object = hashlib.sha1(str.encode(globals.TOP_URLS[url]["top_url"]))
-    hex_dig = hash_object.hexdigest()
+    if isinstance(e, URLError):
+        e = e.reason
 
-    json_file = os.path.join(output_directory, str(hex_dig) + ".json")
+    return isinstance(e, (socket.timeout, ConnectionResetError, ConnectionAbortedError,
+                          IncompleteRead))
 
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
 
-    with open(json_file, 'w') as fp:
-        json.dump(globals.TOP_URLS[url], fp)
+# ==================================================================================================
+# Opens the URL and reads the whole body, giving up if reading takes longer than READ_TIMEOUT
+
+def fetch_once(url):
+    user_agent = random.choice(globals.USR_AGNTS)
+
+    request = urllib.request.Request(url, headers={'User-Agent': user_agent})
+    deadline = time.monotonic() + globals.READ_TIMEOUT
+
+    # the timeout bounds connecting and every single socket read. HTTPS connections go through the
+    # shared TLS context and resume the host's last session (see web_monster_tls.py)
+    with wmt.OPENER.open(request, timeout=globals.CONNECT_TIMEOUT) as response:
+        actual_url = response.geturl()
+        chunks = []
+        while True:
+            if time.monotonic() > deadline:
+                raise socket.timeout("read deadline of " + str(globals.READ_TIMEOUT) + "s exceeded")
+            chunk = response.read(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+
+    return actual_url, b"".join(chunks)
 
 
 # ==================================================================================================
-# Takes in a URL string and returns the actual URL the page was located at (to handle re-directs)
-# and the page source itself
+# Takes in a URL string and returns the actual URL the page was located at (to handle re-directs),
+# the page source itself and, if the page could not be fetched, the reason why. Transient errors
+# are retried up to RETRIES times with jittered exponential backoff
 
 def get_webpage_source(url):
-    try:
-        # ------------------------------------------------------------------------------------------
-        # WARNING THIS MIGHT BE SOME KIND OF HORRIBLE SECURITY FLAW (gets rid of SSL error though)
+    actual_url, page_source, error, status = fetch_page(url)
+    return actual_url, page_source, error
 
-        ctx_no_secure = ssl.create_default_context()
-        ctx_no_secure.set_ciphers('HIGH:!DH:!aNULL')
-        ctx_no_secure.check_hostname = False
-        ctx_no_secure.verify_mode = ssl.CERT_NONE
-        # ------------------------------------------------------------------------------------------
-        user_agent = random.choice(globals.USR_AGNTS)
-        headers = {'User-Agent': user_agent}
 
-        request = urllib.request.Request(url, headers={'User-Agent': user_agent})
-        page_source = urllib.request.urlopen(request, context=ctx_no_secure)
-        actual_url = page_source.geturl()
+# ==================================================================================================
+# get_webpage_source, also returning the HTTP status of the last attempt: 200 for a page, the
+# error status if the server sent one, or None if no response was received
+
+def fetch_page(url):
+    host = urlparse(url).netloc
+
+    if breaker_open(host):
+        wmm.inc("crawl_errors_total", kind="circuit_open")
+        return None, None, "circuit open for " + host, None
+
+    retries = max(0, globals.RETRIES)
+    for attempt in range(retries + 1):
+        try:
+            with wmm.timer("crawl_fetch_seconds"):
+                actual_url, page_source = fetch_once(url)
+            breaker_record(host, True)
+            return actual_url, page_source, None, 200
+
+        except (URLError, HTTPException, ValueError, OSError) as e:
+            wmm.inc("crawl_errors_total", kind=type(e).__name__)
+            reason = type(e).__name__ + ": " + str(e)
+            print("ERROR (URL): " + reason)
+            print("URL: " + url)
 
-    except (HTTPError, InvalidURL) as e:
-        print("ERROR (URL): " + str(e))
-        print("URL: " + url)
-        return None, None
+            # an error status means the host is up and answering. Any other connection failure
+            # counts toward its breaker, whether or not it is worth retrying
+            if isinstance(e, HTTPError) and not is_transient_error(e):
+                breaker_record(host, True)
+            elif isinstance(e, OSError) or is_transient_error(e):
+                breaker_record(host, False)
 
-    return actual_url, page_source
+            if not is_transient_error(e) or attempt == retries or breaker_open(host):
+                return None, None, reason, e.code if isinstance(e, HTTPError) else None
+
+            time.sleep(random.uniform(0, globals.RETRY_BACKOFF * 2 ** attempt))
 
 
 # ==================================================================================================
@@ -154,31 +211,31 @@ def append_external_domain(top_dict, resource_url, resource_type):
         # Set the authoritative NS info
         ns_dict = wmi.set_auth_ns_info(domain, top_dict, None)
 
+        # Set the CNAME chain / CDN zone and IPv6 address info. Its A answer also gives the IPv4
+        # addresses
+        ip_4_addresses = None
+        if globals.RESOLVE_CNAME:
+            ip_4_addresses = wmi.set_cname_info(domain, top_dict)["ip4_addresses"]
+
         # Set the IPv4 address info
-        wmi.set_ip4_info(domain, top_dict, ns_dict)
+        wmi.set_ip4_info(domain, top_dict, ns_dict, ip_4_addresses)
+
+        # Set the certificate and TLS handshake info
+        if globals.CAPTURE_TLS:
+            wmt.set_tls_info(domain, top_dict, resource_url)
 
 
 # ==================================================================================================
 def dont_traverse_higher_urls(resource_url, top_dict):
-    top_url = top_dict["top_url"]
-
-    # ignore difference between http and https
-    base_urls = set()
-    base_urls.add(top_url)
-    if top_url.startswith("https:"):
-        base_urls.add(top_url.replace("https:", "http:"))
-    elif top_url.startswith("http:"):
-        base_urls.add(top_url.replace("http:", "https:"))
-
-    if resource_url.startswith(tuple(base_urls)):
-        analyze_url(resource_url, top_dict)
+    if wms.is_under_top_url(resource_url, top_dict["top_url"]):
+        enqueue_url(resource_url, top_dict)
 
 
 # ==================================================================================================
 # Finds all URLs of a certain "tag" type in the HTML document. Determines whether resource is
 # internal or external and commences further processing accordingly
 
-def parse_resources(tag, attr, soup, top_dict, current_url):
+def parse_resources(tag, attr, soup, top_dict, current_url, page_resources):
     for t in soup.findAll(tag):
         try:
             resource_url = wms.cleanup_url(t[attr])
@@ -188,8 +245,9 @@ def parse_resources(tag, attr, soup, top_dict, current_url):
             if is_valid_external_resource(top_dict["top_url"], resource_url):
                 append_external_resource(top_dict, resource_url, tag)
                 append_external_domain(top_dict, resource_url, tag)
+                page_resources.add((tag, wms.url_to_domain(resource_url)))
             # --------------------------------------------------------------------------------------
-            # Internal Link (parse down this page)
+            # Internal Link (queue this page to be parsed)
 
             elif tag == "a":
                 # Full URL
@@ -201,11 +259,11 @@ def parse_resources(tag, attr, soup, top_dict, current_url):
                     # handle absolute path by combining with top_url
                     if resource_url[0] == '/':
                         resource_url = top_dict["top_url"] + resource_url[1:]
-                        analyze_url(resource_url, top_dict)
+                        enqueue_url(resource_url, top_dict)
 
                     # handle relative path by combining with valid current_url
                     elif current_url.endswith("/"):
-                        analyze_url(current_url + resource_url, top_dict)
+                        enqueue_url(current_url + resource_url, top_dict)
 
             # --------------------------------------------------------------------------------------
         except KeyError:
@@ -229,25 +287,160 @@ def is_new_valid_internal_url(url, top_dict):
 
 
 # ==================================================================================================
+# Parses all resources on the page, returns the set of (tag, external domain) pairs it includes
+
 def get_links(soup, top_dict, current_url):
+    page_resources = set()
+
     for tagType in wms.HTML_ELEMENTS.keys():
         urlFields = wms.HTML_ELEMENTS[tagType]
 
         for urlField in urlFields:
-            parse_resources(tagType, urlField, soup, top_dict, current_url)
+            parse_resources(tagType, urlField, soup, top_dict, current_url, page_resources)
+
+    return page_resources
 
 
 # ==================================================================================================
-def analyze_url(url, top_dict):
-    if len(globals.TOP_LOGS[top_dict["top_url"]]["internal_urls"]) >= 175:
-        return
+# Keys of the template clusters a URL belongs to: its exact path shape and, for pages at least two
+# levels deep, the shape with the last segment wildcarded (so /tag/pirates/ and /tag/steelers/
+# cluster together)
+
+def template_keys(url):
+    template = wms.url_template(url)
+    keys = [template]
+
+    path, _, query = template.partition("?")
+    segments = [segment for segment in path.split("/") if segment]
+    if len(segments) >= 2:
+        keys.append("/" + "/".join(segments[:-1]) + "/{*}" + ("?" + query if query else ""))
+
+    return keys
+
+
+# ==================================================================================================
+# Returns true if TEMPLATE_LIMIT pages in a row from one of the URL's template clusters included a
+# set of external resources that had already been seen on that cluster
 
+def template_saturated(url, top_log):
+    if not globals.TEMPLATE_LIMIT:
+        return False
+
+    for key in template_keys(url):
+        template = top_log["templates"].get(key)
+        if template and template["repeats"] >= globals.TEMPLATE_LIMIT:
+            return True
+
+    return False
+
+
+# ==================================================================================================
+def record_template(url, page_resources, top_log):
+    fingerprint = wms.resource_fingerprint(page_resources)
+
+    for key in template_keys(url):
+        template = top_log["templates"].setdefault(key, {"fingerprints": set(), "repeats": 0})
+        if fingerprint in template["fingerprints"]:
+            template["repeats"] += 1
+        else:
+            template["fingerprints"].add(fingerprint)
+            template["repeats"] = 0
+
+
+# ==================================================================================================
+# Returns the keys used to judge how novel a URL is: its top level section (/news/), its parent path
+# and its depth
+
+def url_path_keys(url):
+    segments = [segment for segment in urlparse(url).path.split("/") if segment]
+    section = segments[0] if segments else ""
+    parent = "/".join(segments[:-1])
+    return section, parent, len(segments)
+
+
+# ==================================================================================================
+# Scores a URL by how likely it is to turn up new external dependencies. Pages in sections and
+# directories we haven't fetched much of yet score high, deep pages score low
+
+def score_url(url, top_log):
+    section, parent, depth = url_path_keys(url)
+    path_counts = top_log["path_counts"]
+
+    return 1.0 / (1 + path_counts[("section", section)]) + \
+        0.5 / (1 + path_counts[("parent", parent)]) - globals.DEPTH_WEIGHT * depth
+
+
+# ==================================================================================================
+# Adds an internal URL to the site's crawl frontier if it hasn't been seen before
+
+def enqueue_url(url, top_dict):
     url = wms.cleanup_url(url)
+    top_log = globals.TOP_LOGS[top_dict["top_url"]]
+
+    if url in top_log["queued"] or not is_new_valid_internal_url(url, top_dict) or \
+            template_saturated(url, top_log):
+        return
+
+    if globals.ROBOTS and not wmr.can_fetch(url):
+        top_log["error_urls"].add(url)
+        top_log["error_reasons"][url] = "disallowed by robots.txt"
+        return
+
+    top_log["queued"].add(url)
+    top_log["pushes"] += 1
+    heapq.heappush(top_log["frontier"], (-score_url(url, top_log), top_log["pushes"], url))
+
+
+# ==================================================================================================
+# Returns true once the site's page budget is spent, or once the last PATIENCE pages in a row have
+# not turned up any new external domain
+
+def budget_spent(top_log):
+    if len(top_log["internal_urls"]) >= globals.MAX_PAGES:
+        return True
+
+    if globals.PATIENCE and top_log["stale_pages"] >= globals.PATIENCE:
+        print("\tNo new external domains in " + str(top_log["stale_pages"]) + " pages, stopping")
+        return True
+
+    return False
+
+
+# ==================================================================================================
+# Fetches and parses pages from the frontier, best score first. Scores are computed when a URL is
+# queued and go down as its section gets crawled, so a popped URL is re-scored and put back if it
+# is no longer the best
+
+def crawl_frontier(top_dict):
+    top_log = globals.TOP_LOGS[top_dict["top_url"]]
+    frontier = top_log["frontier"]
+
+    while frontier and not budget_spent(top_log):
+        wmm.set_gauge("crawl_frontier_depth", len(frontier), site=top_dict["top_url"])
+        old_score, push_id, url = heapq.heappop(frontier)
+        new_score = -score_url(url, top_log)
+
+        if new_score > old_score and frontier and new_score > frontier[0][0]:
+            heapq.heappush(frontier, (new_score, push_id, url))
+            continue
+
+        # the URL's template may have become saturated since it was queued
+        if template_saturated(url, top_log):
+            continue
+
+        fetch_url(url, top_dict)
+
+    wmm.remove("crawl_frontier_depth", site=top_dict["top_url"])
+
+
+# ==================================================================================================
+def fetch_url(url, top_dict):
+    top_log = globals.TOP_LOGS[top_dict["top_url"]]
 
     if is_new_valid_internal_url(url, top_dict):
-        actual_url, page_source = get_webpage_source(url)
+        actual_url, page_source, error = get_webpage_source(url)
 
-        if actual_url and page_source:
+        if actual_url and page_source is not None:
             # --------------------------------------------------------------------------------------
             actual_url = wms.cleanup_url(actual_url)
             # Handle rare case where URL re-directed
@@ -256,68 +449,196 @@ def analyze_url(url, top_dict):
             if url != actual_url:
                 if not is_new_valid_internal_url(actual_url, top_dict) or \
                         is_valid_external_resource(actual_url, top_dict["top_url"]):
-                    globals.TOP_LOGS[top_dict["top_url"]]["error_urls"].add(url)
+                    top_log["error_urls"].add(url)
+                    top_log["error_reasons"][url] = "redirected to " + actual_url
                     return
 
                 url = actual_url
             # --------------------------------------------------------------------------------------
             print("\tNew Internal URL: " + url)
-            globals.TOP_LOGS[top_dict["top_url"]]["internal_urls"].add(url)
+            top_log["internal_urls"].add(url)
+            wmm.inc("crawl_pages_total")
+
+            section, parent, _ = url_path_keys(url)
+            top_log["path_counts"][("section", section)] += 1
+            top_log["path_counts"][("parent", parent)] += 1
+
+            # deferred so workers that never parse a page don't pay for importing bs4 / lxml
+            from bs4 import BeautifulSoup
             soup = BeautifulSoup(page_source, "lxml")
-            get_links(soup, top_dict, url)
+
+            known_domains = len(top_dict["external_domains"])
+            page_resources = get_links(soup, top_dict, url)
+            record_template(url, page_resources, top_log)
+
+            if len(top_dict["external_domains"]) > known_domains:
+                top_log["stale_pages"] = 0
+            else:
+                top_log["stale_pages"] += 1
         else:
-            globals.TOP_LOGS[top_dict["top_url"]]["error_urls"].add(url)
+            top_log["error_urls"].add(url)
+            top_log["error_reasons"][url] = error
+
+
+# ==================================================================================================
+# Crawls a site starting from url, and optionally its sitemaps, following internal links in
+# priority order
+
+def analyze_url(url, top_dict):
+    url = wms.cleanup_url(url)
+
+    enqueue_url(url, top_dict)
+    if globals.SITEMAPS:
+        seeded = wmr.seed_from_sitemaps(top_dict["top_url"],
+                                        lambda page_url: enqueue_url(page_url, top_dict))
+        print("\tSeeded " + str(seeded) + " URLs from sitemaps")
+
+    crawl_frontier(top_dict)
 
     return url
 
 
 # ==================================================================================================
-def thread_start(url, top_dict, output_dir):
+# Gathers all the data for one site
+
+def crawl_site(url, top_dict):
+    wmm.inc("crawl_sites_in_flight")
+    try:
+        # Get IPv4 addresses
+        wmi.set_top_ip4_info(url, top_dict)
+
+        if globals.CAPTURE_TLS:
+            wmt.set_top_tls_info(url, top_dict)
 
-    # Get IPv4 addresses
-    ip_4_addresses = wmi.get_ip4_addrs(url, None)
+        analyze_url(url, top_dict)
+    finally:
+        wmm.inc("crawl_sites_in_flight", -1)
 
-    # Initialize ip_addresses
-    top_dict["ip_addresses"] = {}
-    for ip_address in ip_4_addresses:
-        # Get latitude and longitude by IP address
-        lat, long = wmi.get_ip_geo(ip_address)
-        top_dict["ip_addresses"][ip_address] = {
-            "lat": lat,
-            "long": long,
-        }
 
-    u = analyze_url(url, top_dict)
-    output_to_json(output_dir, u)
+# ==================================================================================================
+# Saves a crawled site's results and frees them
+
+def finish_site(top_dict, output_dir):
+    wms.output_to_json(output_dir, top_dict)
 
+    wms_stats.record_site(top_dict)
+    if globals.DB is not None:
+        globals.DB.save_site(top_dict, globals.TOP_LOGS[top_dict["top_url"]])
     wms.free_up_memory(top_dict)
-    print("WEBSITE " + u + " THREAD DONE")
+    wmm.inc("crawl_sites_total")
+
+    # drop the site's entries entirely so memory doesn't grow with the length of the input
+    globals.TOP_URLS.pop(top_dict["top_url"], None)
+    globals.TOP_LOGS.pop(top_dict["top_url"], None)
+    print("WEBSITE " + top_dict["top_url"] + " THREAD DONE")
 
 
 # ==================================================================================================
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Crawl webpages for 3rd party links.")
-    parser.add_argument("-i", dest="input_file", type=str, help="File containing list of top-level domains to scan", default="./cmu_input.txt")
-    parser.add_argument("-o", dest="output_dir", type=str, help="Directory to output JSON results", default="./data/")
-    args = parser.parse_args()
+def thread_start(url, top_dict, output_dir):
+    crawl_site(url, top_dict)
+    finish_site(top_dict, output_dir)
+
+
+# ==================================================================================================
+# Entry point of a worker process: crawls one site with the parent's settings and sends its results
+# back, the parent then saves them with finish_site
+
+def process_start(url, settings):
+    globals.apply_settings(settings)
+    wms.initialize_dicts([url])
+
+    crawl_site(url, globals.TOP_URLS[url])
+
+    return globals.TOP_URLS.pop(url), globals.TOP_LOGS.pop(url)
 
-    parse_input(args.input_file)
 
-    threads = []
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        for top_url in globals.TOP_URLS.keys():
+# ==================================================================================================
+# Streams the top level URLs to crawl from the input file, interleaved by registrable domain and
+# without the sites already stored in the database
+
+def schedule_sites(input_file):
+    completed = globals.DB.completed_sites() if globals.DB is not None else set()
+
+    for top_url in wms.interleave_by_host(wms.iter_input(input_file), globals.INTERLEAVE_WINDOW):
+        if top_url not in completed:
             print("ANALYZING WEBSITE: " + top_url)
-            threads.append(executor.submit(thread_start, top_url, globals.TOP_URLS[top_url],
-                                           args.output_dir))
-
-    # wait for threads to finish
-    for f in futures.as_completed(threads):
-        pass
-
-    '''
-    # FOR TESTING PURPOSES ONLY
-    for top_url in globals.TOP_URLS.keys():
-        print("ANALYZING WEBSITE: " + top_url)
-        thread_start(top_url, globals.TOP_URLS[top_url], args.output_dir)
-    '''
+            yield top_url
+
+
+# ==================================================================================================
+# Submits one job per site to the executor, keeping at most queue_size jobs submitted at a time so
+# the input is consumed only as fast as it is crawled. on_done(future, top_url) is called for each
+# finished job
+
+def run_bounded(executor, sites, submit, on_done, queue_size):
+    pending = {}
+
+    for top_url in sites:
+        while len(pending) >= queue_size:
+            done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for f in done:
+                on_done(f, pending.pop(f))
+
+        pending[submit(top_url)] = top_url
+
+    for f in futures.as_completed(list(pending)):
+        on_done(f, pending.pop(f))
+
+
+# ==================================================================================================
+# Static crawl engine: crawls every top level URL in the input file, one at a time ("serial"), on a
+# pool of worker threads ("thread", the default) or on a pool of worker processes ("process"). A
+# site's state is only allocated once it is scheduled
+
+def run(args):
+    mode = getattr(args, "mode", "thread")
+    queue_size = getattr(args, "queue_size", 0) or args.workers * 2
+    sites = schedule_sites(args.input_file)
+
+    def start_thread(top_url):
+        wms.initialize_dicts([top_url])
+        return executor.submit(thread_start, top_url, globals.TOP_URLS[top_url], args.output_dir)
+
+    def thread_done(f, top_url):
+        if f.exception() is not None:
+            wmm.inc("crawl_errors_total", kind="worker")
+            print("ERROR (WORKER): " + top_url + " " + str(f.exception()))
+
+    # the parent tracks in-flight sites of worker processes, their other metrics stay in the workers
+    def start_process(top_url):
+        wmm.inc("crawl_sites_in_flight")
+        return executor.submit(process_start, top_url, globals.settings())
+
+    def process_done(f, top_url):
+        wmm.inc("crawl_sites_in_flight", -1)
+        try:
+            top_dict, top_log = f.result()
+        except Exception as e:
+            wmm.inc("crawl_errors_total", kind="worker")
+            print("ERROR (WORKER): " + top_url + " " + str(e))
+            return
+
+        globals.TOP_URLS[top_url] = top_dict
+        globals.TOP_LOGS[top_url] = top_log
+        finish_site(top_dict, args.output_dir)
+
+    if mode == "serial":
+        for top_url in sites:
+            wms.initialize_dicts([top_url])
+            thread_start(top_url, globals.TOP_URLS[top_url], args.output_dir)
+
+    elif mode == "process":
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            run_bounded(executor, sites, start_process, process_done, queue_size)
+
+    else:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            run_bounded(executor, sites, start_thread, thread_done, queue_size)
+
     print("CRAWL COMPLETE!")
+
+
+# ==================================================================================================
+if __name__ == "__main__":
+    import crawl
+    crawl.main(engines=["static"])
@@ -0,0 +1,229 @@
+'''
+SQLite storage for crawl results and crawl logs. Crawl threads hand finished sites to a
+ResultStore, which queues them for a single writer thread; the writer inserts them into normalized
+tables in batched transactions on a WAL mode database, so crawl threads never wait on the disk and
+the database can be queried while a crawl is running. Sites already stored are skipped when a
+crawl is restarted with the same database.
+'''
+
+import queue
+import sqlite3
+import threading
+import time
+import web_monster_support as wms
+
+RESOURCE_TYPES = list(wms.HTML_ELEMENTS.keys())
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sites (
+    id INTEGER PRIMARY KEY,
+    top_url TEXT UNIQUE NOT NULL,
+    top_domain TEXT,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    site_id INTEGER NOT NULL REFERENCES sites(id),
+    url TEXT NOT NULL,
+    status TEXT NOT NULL,
+    reason TEXT
+);
+CREATE TABLE IF NOT EXISTS domains (
+    site_id INTEGER NOT NULL REFERENCES sites(id),
+    domain TEXT NOT NULL,
+    total INTEGER,
+    """ + ",\n    ".join(tag + " INTEGER" for tag in RESOURCE_TYPES) + """
+);
+CREATE TABLE IF NOT EXISTS resources (
+    site_id INTEGER NOT NULL REFERENCES sites(id),
+    url TEXT NOT NULL,
+    domain TEXT,
+    type TEXT,
+    count INTEGER
+);
+CREATE TABLE IF NOT EXISTS ips (
+    site_id INTEGER NOT NULL REFERENCES sites(id),
+    domain TEXT,
+    ip TEXT NOT NULL,
+    lat REAL,
+    long REAL,
+    asn INTEGER,
+    as_org TEXT
+);
+CREATE TABLE IF NOT EXISTS nameservers (
+    site_id INTEGER NOT NULL REFERENCES sites(id),
+    domain TEXT NOT NULL,
+    nameserver TEXT NOT NULL,
+    ip TEXT,
+    lat REAL,
+    long REAL,
+    asn INTEGER,
+    asn_org TEXT
+);
+CREATE TABLE IF NOT EXISTS certificates (
+    site_id INTEGER NOT NULL REFERENCES sites(id),
+    domain TEXT,
+    issuer TEXT,
+    issuer_org TEXT,
+    subject TEXT,
+    san TEXT,
+    expires TEXT,
+    protocol TEXT,
+    cipher TEXT
+);
+CREATE INDEX IF NOT EXISTS pages_site ON pages(site_id);
+CREATE INDEX IF NOT EXISTS domains_site ON domains(site_id);
+CREATE INDEX IF NOT EXISTS domains_domain ON domains(domain);
+CREATE INDEX IF NOT EXISTS resources_site ON resources(site_id);
+CREATE INDEX IF NOT EXISTS ips_site ON ips(site_id);
+CREATE INDEX IF NOT EXISTS nameservers_site ON nameservers(site_id);
+CREATE INDEX IF NOT EXISTS nameservers_nameserver ON nameservers(nameserver);
+CREATE INDEX IF NOT EXISTS certificates_site ON certificates(site_id);
+CREATE INDEX IF NOT EXISTS certificates_issuer_org ON certificates(issuer_org);
+"""
+
+SITE_TABLES = ("pages", "domains", "resources", "ips", "nameservers", "certificates")
+
+
+# ==================================================================================================
+def connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+# ==================================================================================================
+# Inserts one finished site. Rows left by an earlier, interrupted write of the same site are
+# replaced
+
+def insert_site(conn, top_dict, internal_urls, error_reasons):
+    top_url = top_dict["top_url"]
+
+    row = conn.execute("SELECT id FROM sites WHERE top_url = ?", (top_url,)).fetchone()
+    if row:
+        site_id = row[0]
+        for table in SITE_TABLES:
+            conn.execute("DELETE FROM " + table + " WHERE site_id = ?", (site_id,))
+        conn.execute("UPDATE sites SET top_domain = ?, finished = ? WHERE id = ?",
+                     (top_dict.get("top_domain"), time.time(), site_id))
+    else:
+        site_id = conn.execute("INSERT INTO sites (top_url, top_domain, finished) VALUES (?, ?, ?)",
+                               (top_url, top_dict.get("top_domain"), time.time())).lastrowid
+
+    conn.executemany("INSERT INTO pages VALUES (?, ?, 'internal', NULL)",
+                     ((site_id, url) for url in internal_urls))
+    conn.executemany("INSERT INTO pages VALUES (?, ?, 'error', ?)",
+                     ((site_id, url, reason) for url, reason in error_reasons.items()))
+
+    conn.executemany("INSERT INTO ips VALUES (?, NULL, ?, ?, ?, NULL, NULL)",
+                     ((site_id, ip, info.get("lat"), info.get("long")) for ip, info in
+                      (top_dict.get("ip_addresses") or {}).items()))
+
+    insert_certificate(conn, site_id, None, top_dict.get("tls"))
+
+    conn.executemany("INSERT INTO resources VALUES (?, ?, ?, ?, ?)",
+                     ((site_id, url, wms.url_to_domain(url), info.get("type"), info.get("count"))
+                      for url, info in (top_dict.get("external_resources") or {}).items()))
+
+    for domain, info in (top_dict.get("external_domains") or {}).items():
+        counts = info.get("resources") or {}
+        conn.execute("INSERT INTO domains VALUES (" + ", ".join("?" * (3 + len(RESOURCE_TYPES))) +
+                     ")", (site_id, domain, counts.get("total")) +
+                     tuple(counts.get(tag) for tag in RESOURCE_TYPES))
+
+        conn.executemany("INSERT INTO ips VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         ((site_id, domain, ip, ip_info.get("lat"), ip_info.get("long"),
+                           ip_info.get("asn"), ip_info.get("as_org")) for ip, ip_info in
+                          list((info.get("ip_addresses") or {}).items()) +
+                          list((info.get("ip6_addresses") or {}).items())))
+
+        conn.executemany("INSERT INTO nameservers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         ((site_id, domain, ns, ns_info.get("ip"), ns_info.get("lat"),
+                           ns_info.get("long"), ns_info.get("asn"), ns_info.get("asn_org"))
+                          for ns, ns_info in (info.get("authoritative_name_servers") or {}).items()))
+
+        insert_certificate(conn, site_id, domain, info.get("tls"))
+
+
+# ==================================================================================================
+# Certificates of the site itself have a NULL domain. The SAN list is stored comma separated
+
+def insert_certificate(conn, site_id, domain, tls):
+    if not tls:
+        return
+
+    conn.execute("INSERT INTO certificates VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                 (site_id, domain, tls.get("issuer"), tls.get("issuer_org"), tls.get("subject"),
+                  ",".join(tls.get("san") or []), tls.get("expires"), tls.get("protocol"),
+                  tls.get("cipher")))
+
+
+# ==================================================================================================
+class ResultStore:
+    def __init__(self, path, batch_size=50, flush_interval=2.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+
+        # created here so schema errors surface before the crawl starts, used only by the writer
+        self.conn = connect(path)
+        self.writer = threading.Thread(target=self.write_loop, name="result-store", daemon=True)
+        self.writer.start()
+
+    # Top URLs of all sites already stored, used to resume an interrupted crawl
+    def completed_sites(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            return set(row[0] for row in conn.execute("SELECT top_url FROM sites"))
+        finally:
+            conn.close()
+
+    # Queues a finished site. Only references are kept, so the caller may drop its own afterwards
+    def save_site(self, top_dict, top_log):
+        internal_urls = top_log.get("internal_urls", set())
+        error_reasons = dict.fromkeys(top_log.get("error_urls", set()))
+        error_reasons.update(top_log.get("error_reasons", {}))
+        self.queue.put((dict(top_dict), internal_urls, error_reasons))
+
+    def write_loop(self):
+        done = False
+        while not done:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            if None in batch:
+                done = True
+                batch = [item for item in batch if item is not None]
+
+            try:
+                with self.conn:
+                    for top_dict, internal_urls, error_reasons in batch:
+                        insert_site(self.conn, top_dict, internal_urls, error_reasons)
+            # anything a site's data can raise, not just sqlite errors, so the writer never dies
+            except Exception as e:
+                print("ERROR (DB): batch of " + str(len(batch)) + " sites failed, retrying one at a "
+                      "time: " + str(e))
+                self.write_each(batch)
+
+        self.conn.close()
+
+    # Writes the sites of a failed batch in a transaction each, so one bad site only loses itself
+    def write_each(self, batch):
+        for top_dict, internal_urls, error_reasons in batch:
+            try:
+                with self.conn:
+                    insert_site(self.conn, top_dict, internal_urls, error_reasons)
+            except Exception as e:
+                print("ERROR (DB): could not store " + str(top_dict.get("top_url")) + ": " + str(e))
+
+    # Writes everything still queued and stops the writer thread
+    def close(self):
+        self.queue.put(None)
+        self.writer.join()
@@ -4,13 +4,16 @@ REFERENCES:
         -- get_auth_ns is largely based on the top answer to this stack overflow question
 '''
 
-import dns.resolver
 import web_monster_support as wms
+import web_monster_metrics as wmm
 import globals
 import os
 import sys
 import json
 import random
+import socket
+import time
+from functools import lru_cache
 
 
 # ==================================================================================================
@@ -21,14 +24,44 @@ def log_dns(logfile, logstring):
 
 
 # ==================================================================================================
-# Wrapper function meant to be called from the main web monster file
+# Returns the resolver used for recursive lookups: the system one, or globals.DNS_SERVER if set
+
+def get_resolver():
+    import dns.resolver
+
+    if globals.DNS_SERVER:
+        resolver = dns.resolver.Resolver(configure=False)
+        resolver.nameservers = [globals.DNS_SERVER]
+        resolver.port = globals.DNS_PORT
+    else:
+        resolver = dns.resolver.get_default_resolver()
+
+    resolver.timeout = 8
+    resolver.lifetime = 8
+    return resolver
+
+
+# ==================================================================================================
+# Wrapper function meant to be called from the main web monster file. Results are kept in the shared
+# NS_CACHE so a domain used by many sites (or by several engines in one process) is resolved once
 
 def set_auth_ns_info(domain, top_dict, logfile):
-    try:
-        ns_dict = bolster_auth_ns_data(get_auth_ns(domain, logfile, 0))
-    except Exception as e:
-        print("ERROR (DNS-NS): " + str(e))
-        ns_dict = None
+    if domain in globals.NS_CACHE:
+        wmm.inc("crawl_cache_requests_total", cache="ns", result="hit")
+        ns_dict = globals.NS_CACHE[domain]
+    else:
+        wmm.inc("crawl_cache_requests_total", cache="ns", result="miss")
+        try:
+            # timed here rather than on get_auth_ns, which recurses once per zone level
+            with wmm.timer("crawl_dns_seconds", query="ns"):
+                nameservers = get_auth_ns(domain, logfile, 0)
+            ns_dict = bolster_auth_ns_data(nameservers)
+        except Exception as e:
+            wmm.inc("crawl_errors_total", kind="dns")
+            print("ERROR (DNS-NS): " + str(e))
+            ns_dict = None
+
+        globals.NS_CACHE[domain] = ns_dict
 
     top_dict["external_domains"][domain]["authoritative_name_servers"] = ns_dict
     return ns_dict
@@ -42,23 +75,30 @@ def get_auth_ns(domain, logfile, level):
     if level >= 5:
         raise Exception("LEVEL FIVE HIT")
 
+    import dns.message
+    import dns.query
+
     try:
         dns_name = dns.name.from_text(domain)
 
-        default = dns.resolver.get_default_resolver()
-        default.timeout = 8
-        default.lifetime = 8
+        default = get_resolver()
         nameserver = default.nameservers[0]
 
         log_dns(logfile, "DNS Name From Text = " + str(dns_name) + "\n")
         log_dns(logfile, "Default Nameserver = " + nameserver + "\n")
 
         query = dns.message.make_query(dns_name, dns.rdatatype.NS)
-        response = dns.query.udp(query, nameserver, timeout=8)
+        response = dns.query.udp(query, nameserver, timeout=8, port=default.port)
         rcode = response.rcode()
 
         if rcode == dns.rcode.NOERROR:
-            if len(response.authority) > 0:
+            if len(response.answer) > 0 and response.answer[0].rdtype == dns.rdatatype.CNAME:
+                # an alias has no NS records of its own, its zone is the parent's
+                new_domain = dns_name.parent().to_text()
+                log_dns(logfile, "Alias, Parent Domain = " + new_domain + "\n")
+                return get_auth_ns(new_domain, logfile, level+1)
+
+            elif len(response.authority) > 0:
                 rrset = response.authority[0]
 
                 resp = rrset.to_text().split()
@@ -88,6 +128,7 @@ def get_auth_ns(domain, logfile, level):
             return None
 
     except Exception as e:
+        wmm.inc("crawl_errors_total", kind="dns")
         print("ERROR (DNS): " + str(e))
         return None
 
@@ -118,7 +159,10 @@ def bolster_auth_ns_data(nameservers):
 # ==================================================================================================
 # Get IPv4 addresses from url
 
+@wmm.timed("crawl_dns_seconds", query="a")
 def get_ip4_addrs(url, nameservers):
+    import dns.resolver
+
     ip_addresses = []
     domain_name = wms.url_to_domain(url)
 
@@ -127,9 +171,10 @@ def get_ip4_addrs(url, nameservers):
         if nameservers:
             try:
                 # try to query authoritative nameserver directly
-                resolvr = dns.resolver.Resolver()
+                resolvr = dns.resolver.Resolver(configure=False)
                 resolvr.timeout = 8
                 resolvr.lifetime = 8
+                resolvr.port = globals.DNS_PORT
 
                 ns_key = random.choice(list(nameservers.keys()))
                 resolvr.nameservers = [nameservers.get(ns_key).get("ip")]
@@ -138,17 +183,17 @@ def get_ip4_addrs(url, nameservers):
 
                 return ip_addresses
             except Exception as e:
+                wmm.inc("crawl_errors_total", kind="dns")
                 print("ERROR (DNS-NS): " + str(e))
 
         try:
-            default = dns.resolver.get_default_resolver()
-            default.timeout = 8
-            default.lifetime = 8
+            default = get_resolver()
             for answer in default.query(domain_name, 'A'):
                 ip_addresses.append(str(answer))
 
             return ip_addresses
         except Exception as e:
+            wmm.inc("crawl_errors_total", kind="dns")
             print("ERROR (DNS): " + str(e))
 
     return ip_addresses
@@ -157,8 +202,15 @@ def get_ip4_addrs(url, nameservers):
 # ==================================================================================================
 # Get the latitude and longitude of an IP address
 
+@lru_cache(maxsize=65536)
+@wmm.timed("crawl_geoip_seconds", db="city")
 def get_ip_geo(ip_address):
     try:
+        if globals.PREFIX_TABLE is not None:
+            result = globals.PREFIX_TABLE.geo(ip_address)
+            if result is not None:
+                return result
+
         geo_ip_data = globals.GEO_LIB.city(ip_address)
         if geo_ip_data:
             lat = geo_ip_data.location.latitude
@@ -166,6 +218,7 @@ def get_ip_geo(ip_address):
             return lat, long
 
     except Exception as e:
+        wmm.inc("crawl_errors_total", kind="geoip")
         print("ERROR (GEOIP): " + str(e))
 
     return None, None
@@ -174,24 +227,34 @@ def get_ip_geo(ip_address):
 # ==================================================================================================
 # Get the Autonomous System information for the IP address
 
+@lru_cache(maxsize=65536)
+@wmm.timed("crawl_geoip_seconds", db="asn")
 def get_ip_asn(ip_address):
     try:
+        if globals.PREFIX_TABLE is not None:
+            result = globals.PREFIX_TABLE.asn(ip_address)
+            if result is not None:
+                return result
+
         asn_ip_data = globals.ASN_LIB.asn(ip_address)
         if asn_ip_data:
             asn = asn_ip_data.autonomous_system_number
             as_org = asn_ip_data.autonomous_system_organization
             return asn, as_org
     except Exception as e:
+        wmm.inc("crawl_errors_total", kind="geoip")
         print("ERROR (ASNIP): " + str(e))
 
     return None, None
 
 
 # ==================================================================================================
-# Set the location info and IP address info for a given IP in the dictionary
+# Set the location info and IP address info for a given IP in the dictionary. ip_4_addresses, when
+# already resolved (see resolve_chain), saves the separate A query
 
-def set_ip4_info(domain, top_dict, nameservers):
-    ip_4_addresses = get_ip4_addrs(domain, nameservers)
+def set_ip4_info(domain, top_dict, nameservers, ip_4_addresses=None):
+    if ip_4_addresses is None:
+        ip_4_addresses = get_ip4_addrs(domain, nameservers)
 
     top_dict["external_domains"][domain]["ip_addresses"] = {}
     for ip_address in ip_4_addresses:
@@ -210,6 +273,182 @@ def set_ip4_info(domain, top_dict, nameservers):
         }
 
 
+# ==================================================================================================
+# Set the IP address and location info of the top level URL itself
+
+def set_top_ip4_info(url, top_dict):
+    ip_4_addresses = get_ip4_addrs(url, None)
+
+    top_dict["ip_addresses"] = {}
+    for ip_address in ip_4_addresses:
+        # Get latitude and longitude by IP address
+        lat, long = get_ip_geo(ip_address)
+        top_dict["ip_addresses"][ip_address] = {
+            "lat": lat,
+            "long": long,
+        }
+
+
+# ==================================================================================================
+# Sends the A and AAAA queries for a name back to back on one socket and collects both answers, so
+# the pair costs one round trip instead of two. Queries still unanswered, or answered with an error
+# other than NXDOMAIN (SERVFAIL, REFUSED, ...), are sent to the next configured nameserver; each one
+# gets an equal share of the resolver's lifetime. Returns {rdtype: response message or None}
+
+@wmm.timed("crawl_dns_seconds", query="a_aaaa")
+def query_batch(name, rdtypes=("A", "AAAA")):
+    resolver = get_resolver()
+    responses = {rdtype: None for rdtype in rdtypes}
+    wait = resolver.lifetime / max(1, len(resolver.nameservers))
+
+    for nameserver in resolver.nameservers:
+        missing = [rdtype for rdtype, response in responses.items() if response is None]
+        if not missing:
+            break
+        responses.update(query_nameserver(resolver, nameserver, name, missing, wait))
+
+    return responses
+
+
+# ==================================================================================================
+def query_nameserver(resolver, nameserver, name, rdtypes, wait):
+    import dns.flags
+    import dns.message
+    import dns.rcode
+
+    family = socket.AF_INET6 if ":" in nameserver else socket.AF_INET
+
+    queries = {}
+    for rdtype in rdtypes:
+        query = dns.message.make_query(name, rdtype)
+        queries[query.id] = (rdtype, query)
+
+    responses = {}
+    deadline = time.monotonic() + wait
+
+    with socket.socket(family, socket.SOCK_DGRAM) as sock:
+        for rdtype, query in queries.values():
+            sock.sendto(query.to_wire(), (nameserver, resolver.port))
+
+        while queries and time.monotonic() < deadline:
+            sock.settimeout(max(0.01, deadline - time.monotonic()))
+            try:
+                wire, _ = sock.recvfrom(65535)
+                response = dns.message.from_wire(wire)
+            except socket.timeout:
+                break
+            except Exception:
+                continue
+
+            if response.id not in queries:
+                continue
+            rdtype, query = queries.pop(response.id)
+
+            # answers too big for UDP are asked again the normal way (which falls back to TCP)
+            if response.flags & dns.flags.TC:
+                try:
+                    response = resolver.resolve(name, rdtype, raise_on_no_answer=False).response
+                except Exception:
+                    response = None
+
+            if response is not None and response.rcode() not in (dns.rcode.NOERROR,
+                                                                  dns.rcode.NXDOMAIN):
+                response = None
+            responses[rdtype] = response
+
+    return responses
+
+
+# ==================================================================================================
+# Follows the CNAME records in a response's answer section starting at name. Returns the chain of
+# CNAME targets (without trailing dots) and the addresses of type rdtype at its end
+
+def parse_chain(response, name, rdtype):
+    import dns.rdatatype
+
+    targets = {}
+    addresses = {}
+    for rrset in response.answer:
+        owner = rrset.name.to_text().lower()
+        if rrset.rdtype == dns.rdatatype.CNAME:
+            targets[owner] = rrset[0].target.to_text().lower()
+        elif rrset.rdtype == dns.rdatatype.from_text(rdtype):
+            addresses[owner] = [r.to_text() for r in rrset]
+
+    chain = []
+    current = name.lower().rstrip(".") + "."
+    while current in targets and len(chain) < 16:
+        current = targets[current]
+        chain.append(current.rstrip("."))
+
+    return chain, addresses.get(current, [])
+
+
+# ==================================================================================================
+# Resolves the full CNAME chain and the IPv4 / IPv6 addresses of a host name. ip4_addresses is None
+# if the A query got no usable response. Results are kept in the shared CNAME_CACHE, for the name
+# and for every name further down its chain, so hosts behind the same CDN hostname, and the same
+# hosts on other sites, are not queried again. Lookups that failed are not cached
+
+def resolve_chain(hostname):
+    hostname = hostname.lower().rstrip(".")
+    if hostname in globals.CNAME_CACHE:
+        wmm.inc("crawl_cache_requests_total", cache="cname", result="hit")
+        return globals.CNAME_CACHE[hostname]
+    wmm.inc("crawl_cache_requests_total", cache="cname", result="miss")
+
+    result = {"cname_chain": [], "ip4_addresses": None, "ip6_addresses": []}
+    answered = False
+    try:
+        responses = query_batch(hostname)
+        answered = all(response is not None for response in responses.values())
+        if responses.get("A") is not None:
+            result["cname_chain"], result["ip4_addresses"] = parse_chain(responses["A"], hostname,
+                                                                         "A")
+        if responses.get("AAAA") is not None:
+            chain, result["ip6_addresses"] = parse_chain(responses["AAAA"], hostname, "AAAA")
+            result["cname_chain"] = result["cname_chain"] or chain
+    except Exception as e:
+        wmm.inc("crawl_errors_total", kind="dns")
+        print("ERROR (DNS-CNAME): " + str(e))
+
+    if not answered:
+        return result
+
+    globals.CNAME_CACHE[hostname] = result
+    for i, name in enumerate(result["cname_chain"]):
+        globals.CNAME_CACHE.setdefault(name, {"cname_chain": result["cname_chain"][i + 1:],
+                                              "ip4_addresses": result["ip4_addresses"],
+                                              "ip6_addresses": result["ip6_addresses"]})
+    return result
+
+
+# ==================================================================================================
+# Set the CNAME chain, the CDN / hosting zone it ends in and the IPv6 address info for a domain.
+# Returns the resolved chain, whose IPv4 addresses set_ip4_info can use instead of querying again
+
+def set_cname_info(domain, top_dict):
+    result = resolve_chain(domain.split(":")[0])
+    chain = result["cname_chain"]
+
+    domain_dict = top_dict["external_domains"][domain]
+    domain_dict["cname_chain"] = chain
+    domain_dict["cdn_zone"] = wms.registrable_domain(chain[-1]) if chain else None
+
+    domain_dict["ip6_addresses"] = {}
+    for ip_address in result["ip6_addresses"]:
+        lat, long = get_ip_geo(ip_address)
+        asn, as_org = get_ip_asn(ip_address)
+        domain_dict["ip6_addresses"][ip_address] = {
+            "lat": lat,
+            "long": long,
+            "asn": asn,
+            "as_org": as_org
+        }
+
+    return result
+
+
 # ==================================================================================================
 # FOR TESTING PURPOSES ONLY
 if __name__ == "__main__":
@@ -0,0 +1,201 @@
+'''
+Live crawl metrics in the Prometheus text exposition format. The crawl updates counters, gauges and
+histograms kept in plain dictionaries (each update is a dictionary operation under one short lock);
+start_server() serves them on http://host:port/metrics from a daemon thread.
+
+Metrics of sites crawled in worker processes (--mode process) stay in those processes; only the
+parent's saving of their results is counted here.
+
+REFERENCES:
+    https://prometheus.io/docs/instrumenting/exposition_formats/
+'''
+
+import functools
+import os
+import resource
+import threading
+import time
+
+LOCK = threading.Lock()
+
+# name -> (type, help)
+METRICS = {
+    "crawl_sites_in_flight": ("gauge", "Sites currently being crawled"),
+    "crawl_sites_total": ("counter", "Sites finished"),
+    "crawl_frontier_depth": ("gauge", "URLs waiting in a site's crawl frontier"),
+    "crawl_pages_total": ("counter", "Internal pages fetched and parsed"),
+    "crawl_fetch_seconds": ("histogram", "Time to fetch one page"),
+    "crawl_dns_seconds": ("histogram", "Time of one DNS lookup"),
+    "crawl_geoip_seconds": ("histogram", "Time of one GeoIP / ASN lookup"),
+    "crawl_output_seconds": ("histogram", "Time to write one site's JSON output"),
+    "crawl_tls_seconds": ("histogram", "Time of one TLS certificate probe"),
+    "crawl_tls_handshakes_total": ("counter", "TLS handshakes by whether the session was resumed"),
+    "crawl_cache_requests_total": ("counter", "Cache lookups by cache and result"),
+    "crawl_geoip_cache_requests_total": ("counter", "Memoised GeoIP / ASN lookups by result"),
+    "crawl_errors_total": ("counter", "Errors by kind"),
+    "process_resident_memory_bytes": ("gauge", "Resident memory of the crawl process"),
+}
+
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# (name, labels) -> value, labels is a tuple of (key, value) pairs
+VALUES = {}
+# (name, labels) -> [bucket counts..., sum, count]
+HISTOGRAMS = {}
+
+
+# ==================================================================================================
+def inc(name, value=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with LOCK:
+        VALUES[key] = VALUES.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with LOCK:
+        VALUES[key] = value
+
+
+def remove(name, **labels):
+    with LOCK:
+        VALUES.pop((name, tuple(sorted(labels.items()))), None)
+
+
+def observe(name, seconds, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with LOCK:
+        histogram = HISTOGRAMS.get(key)
+        if histogram is None:
+            histogram = HISTOGRAMS[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+        histogram[-2] += seconds
+        histogram[-1] += 1
+
+
+# ==================================================================================================
+# Context manager timing a block into a histogram:  with timer("crawl_dns_seconds"): ...
+
+class timer:
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+# ==================================================================================================
+# Decorator timing every call of a function into a histogram. Placed under lru_cache it only times
+# the lookups that miss the cache
+
+def timed(name, **labels):
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# ==================================================================================================
+def rss_bytes():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # ru_maxrss is the peak, in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# ==================================================================================================
+# Values read at scrape time rather than updated by the crawl. Rates such as pages per second are
+# left to Prometheus (rate(crawl_pages_total[1m]))
+
+def refresh():
+    set_gauge("process_resident_memory_bytes", rss_bytes())
+
+    # the GeoIP lookups are memoised with lru_cache, which keeps its own cumulative counts
+    import web_monster_ip as wmi
+    for db, function in (("city", wmi.get_ip_geo), ("asn", wmi.get_ip_asn)):
+        info = function.cache_info()
+        set_gauge("crawl_geoip_cache_requests_total", info.hits, db=db, result="hit")
+        set_gauge("crawl_geoip_cache_requests_total", info.misses, db=db, result="miss")
+
+
+# ==================================================================================================
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                          for k, v in pairs) + "}"
+
+
+# ==================================================================================================
+def render():
+    refresh()
+    lines = []
+
+    with LOCK:
+        values = sorted(VALUES.items())
+        histograms = sorted((key, list(h)) for key, h in HISTOGRAMS.items())
+
+    for name, (metric_type, help_text) in METRICS.items():
+        lines.append("# HELP " + name + " " + help_text)
+        lines.append("# TYPE " + name + " " + metric_type)
+
+        if metric_type == "histogram":
+            for (metric, labels), histogram in histograms:
+                if metric != name:
+                    continue
+                for bound, count in zip(BUCKETS, histogram):
+                    lines.append(name + "_bucket" + format_labels(labels, [("le", bound)]) + " " +
+                                 str(count))
+                lines.append(name + "_bucket" + format_labels(labels, [("le", "+Inf")]) + " " +
+                             str(histogram[-1]))
+                lines.append(name + "_sum" + format_labels(labels) + " " + repr(histogram[-2]))
+                lines.append(name + "_count" + format_labels(labels) + " " + str(histogram[-1]))
+        else:
+            for (metric, labels), value in values:
+                if metric == name:
+                    lines.append(name + format_labels(labels) + " " + repr(value))
+
+    return "\n".join(lines) + "\n"
+
+
+# ==================================================================================================
+# The handler and server are defined when the endpoint starts, so crawls without it don't pay for
+# importing http.server
+
+def start_server(port, host="127.0.0.1"):
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print("METRICS: http://" + host + ":" + str(server.server_address[1]) + "/metrics")
+    return server
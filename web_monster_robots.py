@@ -0,0 +1,127 @@
+'''
+robots.txt and sitemap support for the static crawler. robots.txt is fetched and parsed once per
+host and kept as a RobotFileParser, so checking a URL against it is a dictionary lookup plus a
+rule match. Sitemaps (from the robots.txt Sitemap: lines, or /sitemap.xml) are parsed with
+iterparse, clearing each element once read, so large sitemap indexes don't build a full tree.
+
+REFERENCES:
+    https://www.sitemaps.org/protocol.html
+    https://docs.python.org/3/library/urllib.robotparser.html
+'''
+
+import gzip
+import io
+import threading
+import xml.etree.ElementTree as ET
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+import globals
+import web_monster_support as wms
+
+# scheme://host -> RobotFileParser
+ROBOTS_CACHE = {}
+ROBOTS_LOCK = threading.Lock()
+
+SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+
+# ==================================================================================================
+# Fetches a URL with the static crawler's fetch path (timeouts, retries, circuit breaker). Returns
+# the HTTP status (None if the host couldn't be reached) and the body as bytes, or None
+
+def fetch(url):
+    import web_monster
+    actual_url, page_source, error, status = web_monster.fetch_page(url)
+    return status, page_source
+
+
+# ==================================================================================================
+def host_base(url):
+    parsed = urlparse(url)
+    return parsed.scheme + "://" + parsed.netloc
+
+
+# ==================================================================================================
+# Returns the parsed robots.txt for the URL's host, fetching it the first time the host is seen. As
+# in RFC 9309, a robots.txt that is unavailable (4xx) allows everything, while one that is
+# unreachable (5xx, connection failures, an open circuit breaker) disallows everything
+
+def get_robots(url):
+    base = host_base(url)
+
+    with ROBOTS_LOCK:
+        robots = ROBOTS_CACHE.get(base)
+    if robots is not None:
+        return robots
+
+    robots = RobotFileParser(base + "/robots.txt")
+    status, body = fetch(base + "/robots.txt")
+    if body is not None:
+        robots.parse(body.decode("utf-8", errors="replace").splitlines())
+    elif status is not None and 400 <= status < 500:
+        robots.allow_all = True
+    else:
+        robots.disallow_all = True
+
+    with ROBOTS_LOCK:
+        return ROBOTS_CACHE.setdefault(base, robots)
+
+
+# ==================================================================================================
+def can_fetch(url):
+    return get_robots(url).can_fetch("*", url)
+
+
+# ==================================================================================================
+# Yields ("sitemap" | "url", loc) for every entry of a sitemap or sitemap index read from the binary
+# file object. Gzipped sitemaps are decompressed as they are parsed
+
+def iter_sitemap(fileobj):
+    fileobj = io.BufferedReader(fileobj) if not hasattr(fileobj, "peek") else fileobj
+    if fileobj.peek(2)[:2] == b"\x1f\x8b":
+        fileobj = gzip.GzipFile(fileobj=fileobj)
+
+    try:
+        for event, element in ET.iterparse(fileobj, events=("end",)):
+            tag = element.tag.replace(SITEMAP_NS, "")
+            if tag in ("sitemap", "url"):
+                loc = element.find(SITEMAP_NS + "loc")
+                if loc is None:
+                    loc = element.find("loc")
+                if loc is not None and loc.text:
+                    yield tag, loc.text.strip()
+                element.clear()
+    except (ET.ParseError, OSError, EOFError) as e:
+        print("ERROR (SITEMAP): " + str(e))
+
+
+# ==================================================================================================
+# Collects up to SITEMAP_MAX_URLS page URLs under top_url from the site's sitemaps and passes each
+# one to enqueue. Nested sitemap indexes are followed, at most SITEMAP_MAX_FILES files per site
+
+def seed_from_sitemaps(top_url, enqueue):
+    robots = get_robots(top_url)
+    pending = list(robots.site_maps() or [host_base(top_url) + "/sitemap.xml"])
+    visited = set()
+    seeded = 0
+
+    while pending and len(visited) < globals.SITEMAP_MAX_FILES:
+        sitemap_url = pending.pop(0)
+        if sitemap_url in visited:
+            continue
+        visited.add(sitemap_url)
+
+        status, body = fetch(sitemap_url)
+        if body is None:
+            continue
+
+        for tag, loc in iter_sitemap(io.BytesIO(body)):
+            if tag == "sitemap":
+                pending.append(loc)
+            elif wms.is_under_top_url(wms.cleanup_url(loc), top_url):
+                enqueue(loc)
+                seeded += 1
+                if seeded >= globals.SITEMAP_MAX_URLS:
+                    return seeded
+
+    return seeded
@@ -0,0 +1,186 @@
+'''
+Incremental cross-site statistics. Each crawl thread hands a compact summary of its site to the
+shared RunningAggregator right before the site's data is freed, so live top-K counters and
+histograms are available during a run without keeping per-site results in memory. The aggregator
+periodically writes a JSON snapshot that dashboards can poll.
+'''
+
+import json
+import os
+import threading
+import time
+from collections import Counter
+import globals
+import web_monster_support as wms
+
+
+# ==================================================================================================
+# Geo cells are 1x1 degree squares, keyed by the rounded down latitude and longitude
+
+def geo_cell(lat, long):
+    if lat is None or long is None:
+        return None
+    return str(int(lat // 1)) + "," + str(int(long // 1))
+
+
+# ==================================================================================================
+# Reduces a finished site dictionary to the few counts the aggregator needs
+
+def summarize_site(top_dict):
+    tag_counts = Counter()
+    ns_providers = set()
+    asns = {}
+    geo_cells = set()
+
+    external_domains = top_dict.get("external_domains") or {}
+    for domain_info in external_domains.values():
+        for tag, count in (domain_info.get("resources") or {}).items():
+            if tag != "total":
+                tag_counts[tag] += count
+
+        for ns in (domain_info.get("authoritative_name_servers") or {}).keys():
+            ns_providers.add(wms.registrable_domain(ns))
+
+        for ip_info in (domain_info.get("ip_addresses") or {}).values():
+            if ip_info.get("asn") is not None:
+                asns[ip_info["asn"]] = ip_info.get("as_org")
+
+            cell = geo_cell(ip_info.get("lat"), ip_info.get("long"))
+            if cell:
+                geo_cells.add(cell)
+
+    return {
+        "top_url": top_dict["top_url"],
+        "domains": list(external_domains.keys()),
+        "resources": len(top_dict.get("external_resources") or {}),
+        "tag_counts": dict(tag_counts),
+        "ns_providers": list(ns_providers),
+        "asns": asns,
+        "geo_cells": list(geo_cells)
+    }
+
+
+# ==================================================================================================
+# Approximate top-K counter: when more than `capacity` keys are tracked, the least frequent half is
+# dropped, so memory stays bounded however many distinct keys a long crawl produces
+
+class TopKCounter:
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.counts = Counter()
+
+    def update(self, keys):
+        self.counts.update(keys)
+        if len(self.counts) > self.capacity:
+            self.counts = Counter(dict(self.counts.most_common(self.capacity // 2)))
+
+    def top(self, k):
+        return self.counts.most_common(k)
+
+
+# ==================================================================================================
+# Histogram with power of two buckets: bucket "8" holds values in [8, 16)
+
+class Histogram:
+    def __init__(self):
+        self.buckets = Counter()
+
+    def add(self, value):
+        bucket = 0 if value <= 0 else 1 << (int(value).bit_length() - 1)
+        self.buckets[bucket] += 1
+
+    def to_dict(self):
+        return {str(bucket): self.buckets[bucket] for bucket in sorted(self.buckets)}
+
+
+# ==================================================================================================
+class RunningAggregator:
+    def __init__(self, output_file, flush_interval=60, top_k=50, capacity=10000):
+        self.output_file = output_file
+        self.flush_interval = flush_interval
+        self.top_k = top_k
+        self.lock = threading.Lock()
+
+        self.sites = 0
+        self.started = time.time()
+
+        self.tag_counts = Counter()
+        self.domains = TopKCounter(capacity)
+        self.ns_providers = TopKCounter(capacity)
+        self.asns = TopKCounter(capacity)
+        self.asn_orgs = {}
+        self.geo_cells = TopKCounter(capacity)
+        self.domains_per_site = Histogram()
+        self.resources_per_site = Histogram()
+
+        # flushes on a timer rather than from add(), so a stalled crawl still writes its snapshot
+        self.stopped = threading.Event()
+        self.timer = threading.Thread(target=self.flush_loop, name="stats-flush", daemon=True)
+        self.timer.start()
+
+    # Adds one site summary (see summarize_site)
+    def add(self, summary):
+        with self.lock:
+            self.sites += 1
+            self.tag_counts.update(summary["tag_counts"])
+            self.domains.update(summary["domains"])
+            self.ns_providers.update(summary["ns_providers"])
+            self.asns.update(summary["asns"].keys())
+            self.geo_cells.update(summary["geo_cells"])
+            self.domains_per_site.add(len(summary["domains"]))
+            self.resources_per_site.add(summary["resources"])
+
+            for asn, org in summary["asns"].items():
+                if asn in self.asns.counts:
+                    self.asn_orgs[asn] = org
+            # drop the names of ASNs the top-K counter has forgotten about
+            if len(self.asn_orgs) > len(self.asns.counts) * 2:
+                self.asn_orgs = {asn: self.asn_orgs[asn] for asn in self.asns.counts
+                                 if asn in self.asn_orgs}
+
+    def snapshot(self):
+        return {
+            "sites": self.sites,
+            "elapsed_seconds": round(time.time() - self.started, 1),
+            "resources_by_tag": dict(self.tag_counts),
+            "top_domains": self.domains.top(self.top_k),
+            "top_ns_providers": self.ns_providers.top(self.top_k),
+            "top_asns": [(asn, self.asn_orgs.get(asn), count) for asn, count in
+                         self.asns.top(self.top_k)],
+            "top_geo_cells": self.geo_cells.top(self.top_k),
+            "domains_per_site": self.domains_per_site.to_dict(),
+            "resources_per_site": self.resources_per_site.to_dict()
+        }
+
+    # Writes the snapshot to a temporary file first so readers never see a half written file
+    def flush_locked(self):
+        output_dir = os.path.dirname(self.output_file)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+
+        tmp_file = self.output_file + ".tmp"
+        with open(tmp_file, 'w') as fp:
+            json.dump(self.snapshot(), fp, indent=4)
+        os.replace(tmp_file, self.output_file)
+
+    def flush(self):
+        with self.lock:
+            self.flush_locked()
+
+    def flush_loop(self):
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
+
+    # Stops the timer and writes the final snapshot
+    def close(self):
+        self.stopped.set()
+        self.timer.join()
+        self.flush()
+
+
+# ==================================================================================================
+# Called by the crawl engines once a site is finished, before its data is freed
+
+def record_site(top_dict):
+    if globals.AGGREGATOR is not None:
+        globals.AGGREGATOR.add(summarize_site(top_dict))
@@ -1,5 +1,12 @@
-from urllib.parse import urlparse
+from urllib.parse import urlparse, parse_qsl
+from collections import Counter, OrderedDict, deque
 import globals
+import web_monster_metrics as wmm
+import glob
+import hashlib
+import json
+import os
+import re
 
 # TODO verify that we have all the external source types we care about
 HTML_ELEMENTS = {
@@ -27,6 +34,20 @@ def url_to_domain(url):
     return parsed_url
 
 
+# ==================================================================================================
+# Approximate registrable domain of a host name (ns1.p34.dynect.net. -> dynect.net). Second level
+# names under a country code TLD such as co.uk or com.au keep one more label (bbc.co.uk)
+
+def registrable_domain(hostname):
+    labels = [label for label in hostname.lower().split(".") if label]
+
+    if len(labels) > 2 and len(labels[-1]) == 2 and \
+            labels[-2] in ("co", "com", "net", "org", "gov", "edu", "ac", "ne", "or", "go"):
+        return ".".join(labels[-3:])
+
+    return ".".join(labels[-2:])
+
+
 # ==================================================================================================
 # WWW screws up our parser, so get rid of it if a URL contains it
 
@@ -65,10 +86,161 @@ def cleanup_url(url):
     return add_trailing_slash(url)
 
 
+# ==================================================================================================
+# Returns true if url is top_url or below it, ignoring the difference between http and https
+
+def is_under_top_url(url, top_url):
+    base_urls = {top_url}
+    if top_url.startswith("https:"):
+        base_urls.add(top_url.replace("https:", "http:", 1))
+    elif top_url.startswith("http:"):
+        base_urls.add(top_url.replace("http:", "https:", 1))
+
+    return url.startswith(tuple(base_urls))
+
+
+# ==================================================================================================
+# Takes in an input file path, where the input file is a list of newline separated top level URLs
+# to crawl. Starts filling out the TOP_URLS global dictionary. Returns the list of cleaned up URLs
+
+def parse_input(input_file):
+    return initialize_dicts(iter_input(input_file))
+
+
+# ==================================================================================================
+# Streams the cleaned up top level URLs of an input file one line at a time, skipping blank lines
+# and URLs already seen. Only the seen URLs are kept in memory, not the file
+
+def iter_input(input_file):
+    seen = set()
+
+    with open(input_file, 'r') as f:
+        for line in f:
+            # get rid of newlines, etc
+            url = line.strip()
+            if not url:
+                continue
+
+            url = cleanup_url(url)
+            if url not in seen:
+                seen.add(url)
+                yield url
+
+
+# ==================================================================================================
+# Reorders a stream of top level URLs so consecutive URLs belong to different registrable domains
+# wherever possible, so concurrent workers don't all crawl the same origin. Up to `window` URLs are
+# read ahead and handed out round robin by registrable domain
+
+def interleave_by_host(urls, window=1000):
+    groups = OrderedDict()
+    buffered = 0
+    urls = iter(urls)
+    exhausted = False
+
+    while True:
+        while not exhausted and buffered < window:
+            try:
+                url = next(urls)
+            except StopIteration:
+                exhausted = True
+                break
+
+            key = registrable_domain(urlparse(url).hostname or url_to_domain(url))
+            groups.setdefault(key, deque()).append(url)
+            buffered += 1
+
+        if not groups:
+            return
+
+        # take one URL from the group at the front, then move that group to the back
+        key, group = next(iter(groups.items()))
+        yield group.popleft()
+        buffered -= 1
+
+        if group:
+            groups.move_to_end(key)
+        else:
+            del groups[key]
+
+
+# ==================================================================================================
+# Outputs a JSON file for the website crawled
+
+def output_to_json(output_directory, top_dict, indent=None):
+    # make filename hash of the top url because linux doesn't like :./ in the file name
+    hash_object = hashlib.sha1(str.encode(top_dict["top_url"]))
+    hex_dig = hash_object.hexdigest()
+
+    json_file = os.path.join(output_directory, str(hex_dig) + ".json")
+
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory, exist_ok=True)
+
+    with wmm.timer("crawl_output_seconds"), open(json_file, 'w') as fp:
+        json.dump(top_dict, fp, indent=indent)
+
+
+# ==================================================================================================
+# Yields (path, site dict) for every crawl output JSON file under the given directories, loading one
+# file at a time so whole corpora can be streamed
+
+def iter_output_files(directories):
+    for directory in directories:
+        for json_file in sorted(glob.glob(os.path.join(directory, "**", "*.json"), recursive=True)):
+            with open(json_file, 'r') as f:
+                try:
+                    yield json_file, json.load(f)
+                except ValueError as e:
+                    print("ERROR (JSON): " + json_file + " " + str(e))
+
+
+# ==================================================================================================
+# Reduces a URL to the shape of its path so pages generated from the same template share a key:
+#   https://triblive.com/news/2020/04/12/some-long-article-title/?page=2
+#   -> /news/{n}/{n}/{n}/{slug}/?page=
+
+def url_template(url):
+    parsed = urlparse(url)
+    segments = []
+
+    for segment in parsed.path.split("/"):
+        if not segment:
+            continue
+        if segment.isdigit():
+            segment = "{n}"
+        elif re.fullmatch(r"[0-9a-fA-F-]{8,}", segment) or \
+                (re.search(r"\d", segment) and re.search(r"[a-zA-Z]", segment) and
+                 re.fullmatch(r"[\w.-]*\d{3,}[\w.-]*", segment)):
+            segment = "{id}"
+        elif segment.count("-") >= 3 or len(segment) > 40:
+            segment = "{slug}"
+        segments.append(segment)
+
+    template = "/" + "/".join(segments)
+    if segments and parsed.path.endswith("/"):
+        template += "/"
+
+    query_keys = sorted(set(key for key, _ in parse_qsl(parsed.query, keep_blank_values=True)))
+    if query_keys:
+        template += "?" + "&".join(key + "=" for key in query_keys)
+
+    return template
+
+
+# ==================================================================================================
+# Fingerprint of the external resources one page includes, as a set of (tag, domain) pairs
+
+def resource_fingerprint(page_resources):
+    return hashlib.sha1(str.encode(repr(sorted(page_resources)))).hexdigest()
+
+
 # ==================================================================================================
 # Gets the global dictionaries ready for use
 
 def initialize_dicts(top_urls):
+    cleaned_urls = []
+
     for url in top_urls:
         if url:
             url = cleanup_url(url)
@@ -83,11 +255,23 @@ def initialize_dicts(top_urls):
 
             top_log_dict = {
                 "internal_urls": set(),
-                "error_urls": set()
+                "error_urls": set(),
+                "error_reasons": {},
+                # crawl frontier state, see web_monster.crawl_frontier
+                "frontier": [],
+                "queued": set(),
+                "pushes": 0,
+                "path_counts": Counter(),
+                "stale_pages": 0,
+                # url_template -> fingerprints seen / pages in a row that repeated one
+                "templates": {}
             }
 
             globals.TOP_URLS[url] = top_url_dict
             globals.TOP_LOGS[url] = top_log_dict
+            cleaned_urls.append(url)
+
+    return cleaned_urls
 
 
 # ==================================================================================================
@@ -98,6 +282,11 @@ def free_up_memory(top_dict):
     del top_dict["external_resources"]
     del globals.TOP_LOGS[top_dict["top_url"]]["internal_urls"]
     del globals.TOP_LOGS[top_dict["top_url"]]["error_urls"]
+    del globals.TOP_LOGS[top_dict["top_url"]]["error_reasons"]
+    del globals.TOP_LOGS[top_dict["top_url"]]["frontier"]
+    del globals.TOP_LOGS[top_dict["top_url"]]["queued"]
+    del globals.TOP_LOGS[top_dict["top_url"]]["path_counts"]
+    del globals.TOP_LOGS[top_dict["top_url"]]["templates"]
 
 
 # ==================================================================================================
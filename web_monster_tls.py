@@ -0,0 +1,249 @@
+'''
+TLS for the static engine: the TLS context and session cache page fetches go through, and capture of
+the certificate (issuer, SAN list, expiry) and negotiated protocol / cipher of the top URL and of
+each external domain.
+
+Every connection offers the TLS session of the last connection to the same host:port, so crawling
+many pages of a site, or probing a host that was just fetched from, resumes the session instead of
+doing a full handshake. Captured results are kept in the shared TLS_CACHE so each host:port is
+probed once per run.
+
+Verification is off, as it always was for page fetches, so certificates of misconfigured hosts are
+captured too. Certificates are decoded with the optional cryptography package (pip install
+cryptography); without it only the protocol and cipher are recorded.
+'''
+
+import http.client
+import socket
+import ssl
+import threading
+import urllib.request
+from urllib.parse import urlparse
+import globals
+import web_monster_metrics as wmm
+
+# "host:port" -> ssl.SSLSession of the most recent connection, offered for resumption
+SESSIONS = {}
+SESSION_LOCK = threading.Lock()
+
+# seconds a probe waits for a TLS 1.3 server's session ticket after the handshake
+TICKET_WAIT = 0.2
+
+# set once the missing cryptography package has been warned about
+DECODE_WARNED = False
+
+
+# ==================================================================================================
+def make_context():
+    # ----------------------------------------------------------------------------------------------
+    # WARNING THIS MIGHT BE SOME KIND OF HORRIBLE SECURITY FLAW (gets rid of SSL error though)
+
+    ctx_no_secure = ssl.create_default_context()
+    ctx_no_secure.set_ciphers('HIGH:!DH:!aNULL')
+    ctx_no_secure.check_hostname = False
+    ctx_no_secure.verify_mode = ssl.CERT_NONE
+    # ----------------------------------------------------------------------------------------------
+    return ctx_no_secure
+
+
+# sessions can only be resumed by the context that created them, so there is one for the process
+CONTEXT = make_context()
+
+
+# ==================================================================================================
+# Session cache
+
+def session_key(host, port):
+    return host.lower() + ":" + str(port)
+
+
+def wrap_socket(sock, host, port):
+    with SESSION_LOCK:
+        session = SESSIONS.get(session_key(host, port))
+
+    try:
+        tls_sock = CONTEXT.wrap_socket(sock, server_hostname=host, session=session)
+    except Exception:
+        sock.close()
+        raise
+
+    wmm.inc("crawl_tls_handshakes_total", resumed=str(tls_sock.session_reused).lower())
+    return tls_sock
+
+
+# With TLS 1.3 the resumable session arrives after the handshake, so this is called once the server
+# has sent something. Sessions without a ticket can't be resumed and would replace a good one
+
+def remember_session(host, port, tls_sock):
+    try:
+        session = tls_sock.session
+    except (AttributeError, ValueError):
+        return
+
+    if session is not None and session.has_ticket:
+        with SESSION_LOCK:
+            SESSIONS[session_key(host, port)] = session
+
+
+# ==================================================================================================
+# urllib plumbing so page fetches use the shared context and session cache
+
+class ResumingHTTPSConnection(http.client.HTTPSConnection):
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+
+        # through a proxy, the TLS session is with the tunnelled host, not the proxy
+        if self._tunnel_host:
+            self.tls_host, self.tls_port = self._tunnel_host, self._tunnel_port
+        else:
+            self.tls_host, self.tls_port = self.host, self.port
+        self.sock = wrap_socket(self.sock, self.tls_host, self.tls_port)
+
+    def getresponse(self):
+        # the connection drops its socket once a "Connection: close" response is read
+        tls_sock = self.sock
+        response = super().getresponse()
+        remember_session(self.tls_host, self.tls_port, tls_sock)
+        return response
+
+
+class ResumingHTTPSHandler(urllib.request.HTTPSHandler):
+    def __init__(self):
+        super().__init__(context=CONTEXT)
+
+    def https_open(self, req):
+        return self.do_open(ResumingHTTPSConnection, req, context=CONTEXT)
+
+
+OPENER = urllib.request.build_opener(ResumingHTTPSHandler)
+
+
+# ==================================================================================================
+# Issuer, subject, SAN list and expiry of a DER certificate. The ssl module only decodes the
+# certificate of a verified connection, so cryptography is used; without it the fields are None
+
+def decode_cert(der_cert):
+    global DECODE_WARNED
+
+    fields = {"issuer": None, "issuer_org": None, "subject": None, "san": [], "expires": None}
+    if der_cert is None:
+        return fields
+
+    try:
+        from cryptography import x509
+        from cryptography.x509.oid import NameOID
+    except ImportError:
+        if not DECODE_WARNED:
+            DECODE_WARNED = True
+            print("WARNING (TLS): certificates are not decoded without the cryptography package "
+                  "(pip install cryptography)")
+        return fields
+
+    try:
+        cert = x509.load_der_x509_certificate(der_cert)
+    except ValueError as e:
+        print("ERROR (TLS): undecodable certificate " + str(e))
+        return fields
+
+    def name_field(name, oid):
+        attributes = name.get_attributes_for_oid(oid)
+        return attributes[0].value if attributes else None
+
+    fields["issuer"] = name_field(cert.issuer, NameOID.COMMON_NAME)
+    fields["issuer_org"] = name_field(cert.issuer, NameOID.ORGANIZATION_NAME)
+    fields["subject"] = name_field(cert.subject, NameOID.COMMON_NAME)
+
+    try:
+        san = cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+        fields["san"] = san.get_values_for_type(x509.DNSName)
+    except x509.ExtensionNotFound:
+        pass
+
+    # not_valid_after_utc replaced the naive not_valid_after in cryptography 42
+    expires = getattr(cert, "not_valid_after_utc", None) or cert.not_valid_after
+    fields["expires"] = expires.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return fields
+
+
+# ==================================================================================================
+# Connects to host:port (at address, if given, instead of host's system DNS address) and returns the
+# certificate and handshake info
+
+def handshake(host, port, address=None):
+    sock = socket.create_connection((address or host, port), timeout=globals.CONNECT_TIMEOUT)
+
+    with wrap_socket(sock, host, port) as tls_sock:
+        info = decode_cert(tls_sock.getpeercert(binary_form=True))
+        cipher = tls_sock.cipher()
+        info["protocol"] = tls_sock.version()
+        info["cipher"] = cipher[0] if cipher else None
+
+        # a TLS 1.3 server sends its session ticket after the handshake, so wait briefly for it
+        if tls_sock.session is None or not tls_sock.session.has_ticket:
+            tls_sock.settimeout(TICKET_WAIT)
+            try:
+                tls_sock.recv(1)
+            except OSError:
+                pass
+        remember_session(host, port, tls_sock)
+
+    return info
+
+
+# ==================================================================================================
+# Returns the TLS info of host:port, probing it only the first time it is asked for. Failed probes
+# are cached as None
+
+def get_tls_info(host, port=443, address=None):
+    key = session_key(host, port)
+    if key in globals.TLS_CACHE:
+        wmm.inc("crawl_cache_requests_total", cache="tls", result="hit")
+        return globals.TLS_CACHE[key]
+    wmm.inc("crawl_cache_requests_total", cache="tls", result="miss")
+
+    try:
+        with wmm.timer("crawl_tls_seconds"):
+            info = handshake(host, port, address)
+    except (OSError, ValueError) as e:
+        wmm.inc("crawl_errors_total", kind="tls")
+        print("ERROR (TLS): " + key + " " + str(e))
+        info = None
+
+    globals.TLS_CACHE[key] = info
+    return info
+
+
+# ==================================================================================================
+# Port to probe for a URL: its own for https URLs with an explicit port, 443 otherwise
+
+def tls_port(url):
+    parsed = urlparse(url)
+    if parsed.scheme == "https" and parsed.port:
+        return parsed.port
+    return 443
+
+
+# ==================================================================================================
+# Set the TLS info of an external domain, connecting to one of the IPv4 addresses the crawl
+# resolved for it. domain is a netloc and may carry a port, which tls_port takes from the URL
+
+def set_tls_info(domain, top_dict, resource_url):
+    domain_dict = top_dict["external_domains"][domain]
+    addresses = list((domain_dict.get("ip_addresses") or {}).keys())
+
+    domain_dict["tls"] = get_tls_info(domain.split(":")[0], tls_port(resource_url),
+                                      addresses[0] if addresses else None)
+
+
+# ==================================================================================================
+# Set the TLS info of the site itself, for https top URLs
+
+def set_top_tls_info(url, top_dict):
+    parsed = urlparse(url)
+    if parsed.scheme != "https" or not parsed.hostname:
+        top_dict["tls"] = None
+        return
+
+    addresses = list((top_dict.get("ip_addresses") or {}).keys())
+    top_dict["tls"] = get_tls_info(parsed.hostname, parsed.port or 443,
+                                   addresses[0] if addresses else None)